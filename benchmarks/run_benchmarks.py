@@ -0,0 +1,431 @@
+"""Benchmarks of the kernel, event bus, display, trace loading and trace generation hot paths.
+
+Every benchmark reports one number per case, best of several repeats, and
+the whole run is written as JSON. With a baseline file the results are
+compared case by case, and the run fails if any case got slower than the
+threshold allows. Runs headless, the display is drawn on the Agg backend.
+
+Timings only compare on the same kind of machine. Every run records the host
+and the time of a fixed calibration loop, and baseline values are scaled by
+the ratio of the two calibration times before they are compared, so a host
+that is uniformly slower does not show up as a regression. If the host
+differs from the baseline's a warning says so, and a baseline without a
+calibration time is not compared against another host at all.
+
+From the repository root:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.25
+    python benchmarks/run_benchmarks.py --quick --only kernel --update-baseline benchmarks/baseline.json
+
+Regenerate the committed baseline, on an otherwise idle machine, with a full run:
+    python benchmarks/run_benchmarks.py --update-baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+# Machine fields that have to match for timings to be compared as they are
+HOST_FIELDS = ("platform", "python", "processor", "cpus", "numpy")
+# Units of counts rather than times, never scaled by the calibration
+COUNT_UNITS = ("modules",)
+
+
+def best_time(function, repeats):
+    """Best wall time of function() over a number of repeats, in seconds."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate(repeats=5):
+    """
+    Time a fixed mix of interpreter and numpy work, the yardstick baselines from other machines are scaled by.
+    :return: Best time in seconds.
+    """
+    values = np.random.default_rng(0).random(2**18)
+
+    def workload():
+        total = 0.0
+        for index in range(200000):
+            total += index * 0.5
+        for _ in range(20):
+            np.sort(np.sqrt(values) * total)
+    return best_time(workload, repeats)
+
+
+def machine():
+    """Description of the host, with the time of the calibration loop."""
+    return {"platform": platform.platform(), "python": platform.python_version(),
+            "processor": platform.processor(), "cpus": os.cpu_count(), "numpy": np.__version__,
+            "calibration": calibrate()}
+
+
+def host_differences(host, baseline_host):
+    """Names of the host fields that differ between this machine and the baseline's."""
+    return [field for field in HOST_FIELDS if host.get(field) != baseline_host.get(field)]
+
+
+def make_event_system():
+    from event_system import AsyncEventSystem, COALESCE
+    event_system = AsyncEventSystem()
+    event_system.register_event("input variables changed", policy=COALESCE)
+    event_system.register_event("calculated variables changed", policy=COALESCE)
+    return event_system
+
+
+def make_variables():
+    """Input and calculated variables as set up by main.py."""
+    input_variables = {
+        'FoM': {'value': 20, 'range': (0.1, 100)},
+        'uphonics_range': {'value': 20, 'range': (0, 100)},
+        'Qe': {'value': 10**7, 'range': (10**4, 10**10)},
+        'tuning_range': {'value': 25, 'range': (0.1, 100)},
+        'FRT_On': {'value': 1},
+    }
+    calculated_variables = {'Plotting_Colour': '#ff0000', 'Qe_opt_trace': 10**9, 'Qe_opt_FRT_trace': 10**9,
+                            'Pg_min': 0, 'Pg_FRT_min': 0, 'Pg_avg': 0, 'Pg_FRT_avg': 0}
+    return input_variables, calculated_variables
+
+
+def bench_kernel(trace, quick):
+    """Samples per second of the scalar and block kernel paths, of the block path with a tuner or recorder,
+    and of both paths with every stage timed by the profiler."""
+    from kernel import Kernel
+    input_variables, calculated_variables = make_variables()
+    kernel = Kernel(input_variables, calculated_variables, trace, make_event_system())
+    results = {}
+
+    samples = 2_000 if quick else 20_000
+
+    def scalar():
+        for _ in range(samples):
+            t, detuning, detuning_FRT = kernel.DeltaOmega_t()
+            kernel.Pg(detuning, detuning_FRT)
+            kernel.AvergaePower()
+
+    results["kernel.scalar"] = (samples / best_time(scalar, 3), "samples/s", True)
+
+    for block_size in (1130, 65536):
+        blocks = max(2_000_000 // block_size // (10 if quick else 1), 1)
+
+        def block():
+            for _ in range(blocks):
+                kernel.step_block(block_size)
+
+        results[f"kernel.block[{block_size}]"] = (blocks * block_size / best_time(block, 3), "samples/s", True)
+
+    # The bundled tuner model in place of the ideal FRT
+    from tuner_model import load_tuner_spec
+    kernel = Kernel(input_variables, calculated_variables, trace, make_event_system(),
+                    tuner=load_tuner_spec(os.path.join("..", "data", "tuner.json")))
+    blocks = max(2_000_000 // 1130 // (10 if quick else 1), 1)
+
+    def tuner_block():
+        for _ in range(blocks):
+            kernel.step_block(1130)
+
+    results["kernel.block[1130, tuner]"] = (blocks * 1130 / best_time(tuner_block, 3), "samples/s", True)
+
+    # The block path with every record taken by the results recorder
+    from results_recorder import ResultsRecorder
+    kernel = Kernel(input_variables, calculated_variables, trace, make_event_system())
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = ResultsRecorder(input_variables, kernel.event_system, directory)
+
+        def recorded_block():
+            for _ in range(blocks):
+                recorder.record(kernel.step_block(1130))
+
+        results["kernel.block[1130, recorded]"] = (blocks * 1130 / best_time(recorded_block, 3), "samples/s", True)
+        recorder.close()
+
+    # Both paths with every stage timed
+    from profiling import StageProfiler, instrument_kernel
+    kernel = Kernel(input_variables, calculated_variables, trace, make_event_system())
+    instrument_kernel(StageProfiler(), kernel)
+    results["kernel.scalar[profiled]"] = (samples / best_time(scalar, 3), "samples/s", True)
+
+    def profiled_block():
+        for _ in range(blocks):
+            kernel.step_block(1130)
+
+    results["kernel.block[1130, profiled]"] = (blocks * 1130 / best_time(profiled_block, 3), "samples/s", True)
+    return results
+
+
+def bench_event_bus(quick):
+    """Cost of trigger_event per event as the number of subscribers grows."""
+    from event_system import AsyncEventSystem
+    results = {}
+    events = 2_000 if quick else 20_000
+    for subscribers in (1, 10, 100):
+        event_system = AsyncEventSystem()
+        event_system.register_event("bench")
+        queues = [event_system.add_listener("bench") for _ in range(subscribers)]
+
+        async def publish():
+            for _ in range(events):
+                await event_system.trigger_event("bench", 1)
+                for queue in queues:
+                    queue.get_nowait()
+
+        elapsed = best_time(lambda: asyncio.run(publish()), 3)
+        results[f"event_bus.trigger_event[{subscribers}]"] = (1e6 * elapsed / events, "us/event", False)
+    return results
+
+
+def bench_display(quick):
+    """Frame time of the Pg vs detuning plot, one kernel block ingested per frame or none, as the history grows."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from display import Display
+    rng = np.random.default_rng(0)
+    results = {}
+    frames = 5 if quick else 20
+    histories = (1130, 11300) if quick else (1130, 11300, 113000)
+    for mode in ("scatter", "density"):
+        for history in histories:
+            input_variables, calculated_variables = make_variables()
+            display = Display(input_variables, calculated_variables, make_event_system(), history=history, mode=mode)
+            # The same record every frame keeps the axes limits, so frames are blitted
+            detuning = rng.uniform(-10, 10, 1130)
+            record = {"Detuning": detuning, "Pg": detuning**2, "Detuning FRT": detuning / 2, "Pg FRT": detuning**2 / 4}
+            for _ in range(-(-history // 1130)):
+                display.ingest(record)
+            display.render_frame()
+
+            def frame():
+                for _ in range(frames):
+                    display.ingest(record)
+                    display.render_frame()
+
+            results[f"display.frame[{mode},{history}]"] = (1e3 * best_time(frame, 3) / frames, "ms/frame", False)
+
+            # Nothing new to draw
+            def idle_frame():
+                for _ in range(frames):
+                    display.render_frame()
+
+            results[f"display.idle_frame[{mode},{history}]"] = (1e3 * best_time(idle_frame, 3) / frames, "ms/frame",
+                                                                 False)
+            plt.close(display.fig)
+    return results
+
+
+def bench_trace_load(quick):
+    """Time to load CSV and binary traces as the file size grows."""
+    from kernel import load_detuning_trace
+    from trace_format import convert_csv
+    results = {}
+    sizes = (10_000, 100_000) if quick else (10_000, 100_000, 1_000_000)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            csv_path = os.path.join(directory, f"trace_{size}.csv")
+            time_trace = np.arange(size) * 9.490357641929459e-05
+            detuning = np.sin(time_trace * 2 * np.pi * 50)
+            np.savetxt(csv_path, np.column_stack((time_trace, detuning)), delimiter=",",
+                       header="time,Detuning [Hz]", comments="", fmt="%.17g")
+            results[f"trace_load.csv[{size}]"] = (best_time(lambda: load_detuning_trace(csv_path), 3), "s", False)
+            trace_path = os.path.join(directory, f"trace_{size}.uph")
+            convert_csv(csv_path, trace_path)
+            # Memory-mapped, touch every sample so the read is included
+            results[f"trace_load.binary[{size}]"] = (
+                best_time(lambda: load_detuning_trace(trace_path)[1].sum(), 3), "s", False)
+    return results
+
+
+def bench_microphonics(quick):
+    """Samples per second generated from the bundled microphonics spec, and from its modes alone."""
+    from microphonics import MicrophonicsGenerator, load_spec
+    spec = load_spec(os.path.join("..", "data", "microphonics.json"))
+    duration = 10 if quick else 100
+    results = {}
+    for case, case_spec in (("spec", spec), ("modes", {"modes": spec["modes"]})):
+        generator = MicrophonicsGenerator(case_spec)
+        samples = int(duration * generator.sample_rate)
+
+        def generate():
+            generator.reset()
+            for _ in generator.blocks(2**20, duration):
+                pass
+
+        results[f"microphonics.generate[{case}]"] = (samples / best_time(generate, 3), "samples/s", True)
+    return results
+
+
+# Modules that must never pull in matplotlib or pygame
+HEADLESS_MODULES = ("kernel", "event_system", "trace_format", "trace_source", "detuning_stats", "optimizer",
+                    "batch", "sweep", "multi_kernel", "input_source", "kernel_process", "midi_driver",
+                    "iir", "microphonics", "tuner_model", "result_cache", "results_recorder",
+                    "profiling")
+GUI_MODULES = ("display", "main")
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, sum(name.split('.')[0] in ('matplotlib', 'pygame') for name in sys.modules))
+"""
+
+FIRST_SAMPLE_SCRIPT = """
+import time
+start = time.perf_counter()
+from event_system import AsyncEventSystem
+from kernel import Kernel
+event_system = AsyncEventSystem()
+event_system.register_event("input variables changed")
+event_system.register_event("calculated variables changed")
+input_variables = {{name: {{'value': value}} for name, value in
+                   (('FoM', 20), ('uphonics_range', 20), ('Qe', 10**7), ('tuning_range', 25), ('FRT_On', 1))}}
+kernel = Kernel(input_variables, {{'Plotting_Colour': '#ff0000'}}, {trace!r}, event_system)
+kernel.step_block(1130)
+print(time.perf_counter() - start)
+"""
+
+
+def run_script(script):
+    """Run a script in a fresh interpreter in the src directory and return its output split into numbers."""
+    output = subprocess.run([sys.executable, "-c", script], cwd=SRC_DIR, check=True,
+                            capture_output=True, text=True).stdout
+    return [float(value) for value in output.split()]
+
+
+def bench_startup(trace, quick):
+    """Import time of every module in a fresh interpreter, and time to the first kernel block."""
+    results = {}
+    repeats = 2 if quick else 5
+    heavy = []
+    for module in HEADLESS_MODULES + GUI_MODULES:
+        runs = [run_script(IMPORT_SCRIPT.format(module=module)) for _ in range(repeats)]
+        results[f"startup.import[{module}]"] = (1e3 * min(elapsed for elapsed, _ in runs), "ms", False)
+        if module in HEADLESS_MODULES and runs[0][1]:
+            heavy.append(module)
+    if heavy:
+        print(f"  Headless modules importing matplotlib or pygame: {', '.join(heavy)}", file=sys.stderr)
+    results["startup.heavy_imports"] = (len(heavy), "modules", False)
+    results["startup.first_sample"] = (
+        1e3 * min(run_script(FIRST_SAMPLE_SCRIPT.format(trace=trace))[0] for _ in range(repeats)), "ms", False)
+    return results
+
+
+BENCHMARKS = ("startup", "kernel", "event_bus", "display", "trace_load", "microphonics")
+
+
+def run(selected, quick, trace):
+    """Run the selected benchmarks and return a dictionary of case name to result."""
+    results = {}
+    for name in selected:
+        print(f"Running {name}...", file=sys.stderr, flush=True)
+        if name == "startup":
+            cases = bench_startup(trace, quick)
+        elif name == "kernel":
+            cases = bench_kernel(trace, quick)
+        elif name == "event_bus":
+            cases = bench_event_bus(quick)
+        elif name == "display":
+            cases = bench_display(quick)
+        elif name == "trace_load":
+            cases = bench_trace_load(quick)
+        else:
+            cases = bench_microphonics(quick)
+        for case, (value, unit, higher_is_better) in cases.items():
+            results[case] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+            print(f"  {case}: {value:.4g} {unit}", file=sys.stderr, flush=True)
+    return results
+
+
+def compare(results, baseline, threshold, slowdown=1.0):
+    """
+    Compare results with a baseline.
+    :param threshold: Allowed relative slowdown, 0.25 for 25 %.
+    :param slowdown: How much slower this machine runs the calibration loop than the baseline's machine; baseline
+        times are scaled by it before comparing.
+    :return: List of (case, scaled baseline value, new value, relative change) for the regressed cases.
+    """
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        old, new = baseline[case]["value"], result["value"]
+        if result["unit"] not in COUNT_UNITS:
+            old = old / slowdown if result["higher_is_better"] else old * slowdown
+        if old == 0:
+            # Counts that should stay at zero
+            change = float("inf") if new > old else 0.0
+        else:
+            # Positive change is always a slowdown
+            change = (old - new) / old if result["higher_is_better"] else (new - old) / old
+        if change > threshold:
+            regressions.append((case, old, new, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulator hot paths.")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help="Benchmarks to run, all by default.")
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations and smaller sizes.")
+    parser.add_argument("--trace", default=os.path.join("..", "data", "detuning.csv"),
+                        help="Detuning trace for the kernel benchmarks, relative to src.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with this JSON file and fail on regressions.")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative slowdown against the baseline.")
+    parser.add_argument("--update-baseline", metavar="PATH", help="Write the results as the new baseline.")
+    args = parser.parse_args(argv)
+
+    # Output paths are resolved before moving into src, where the config is found
+    paths = {name: os.path.abspath(getattr(args, name)) for name in ("output", "baseline", "update_baseline")
+             if getattr(args, name)}
+    os.chdir(SRC_DIR)
+    sys.path.insert(0, SRC_DIR)
+
+    report = {
+        "machine": machine(),
+        "quick": args.quick,
+        "results": run(args.only, args.quick, args.trace),
+    }
+    for name in ("output", "update_baseline"):
+        if name in paths:
+            with open(paths[name], "w") as file:
+                json.dump(report, file, indent=2)
+
+    if "baseline" in paths:
+        with open(paths["baseline"]) as file:
+            baseline = json.load(file)
+        if baseline.get("quick") != args.quick:
+            print("Warning: baseline and run differ in --quick, sizes may not match.", file=sys.stderr)
+        host, baseline_host = report["machine"], baseline.get("machine", {})
+        differences = host_differences(host, baseline_host)
+        if differences and "calibration" not in baseline_host:
+            print(f"Not comparing: the baseline was made on another host ({', '.join(differences)} differ) and has no "
+                  f"calibration time to scale it by. Regenerate it on this host with --update-baseline.",
+                  file=sys.stderr)
+            sys.exit(2)
+        slowdown = host["calibration"] / baseline_host["calibration"] if "calibration" in baseline_host else 1.0
+        if differences:
+            print(f"Warning: the baseline was made on another host ({', '.join(differences)} differ), its timings are "
+                  f"scaled by the calibration loop, {slowdown:.2f} times slower here.", file=sys.stderr)
+        regressions = compare(report["results"], baseline["results"], args.threshold, slowdown)
+        for case, old, new, change in regressions:
+            print(f"REGRESSION {case}: {old:.4g} -> {new:.4g} ({100 * change:.0f} % slower)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {100 * args.threshold:.0f} %.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Headless batch simulation over grids of input variables.
+
+Runs the kernel physics over the full detuning trace for every combination of
+FoM, uphonics_range, tuning_range, Qe and FRT_On and writes the average powers
+to CSV or Parquet. Results are kept in a ResultCache, so combinations already
+simulated on the same trace are not simulated again. Nothing here imports
+pygame or matplotlib.
+
+Example, run from the src directory:
+    python batch.py --FoM 10 20 40 --Qe log:1e6:1e9:50 --output ../results/grid.csv
+"""
+import argparse
+import csv
+import os
+import numpy as np
+from kernel import scale_detuning, frt_detuning, calculate_variables, generator_current, generator_power
+from trace_source import open_trace_source
+from result_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES, ResultCache, trace_digest
+
+PARAMETER_NAMES = ('FoM', 'uphonics_range', 'tuning_range', 'Qe', 'FRT_On')
+RESULT_NAMES = PARAMETER_NAMES + ('Qe_opt', 'Qe_opt_FRT', 'QL', 'QL_FRT',
+                                  'Pg_avg', 'Pg_FRT_avg', 'power_saving')
+# Results stored in the cache, everything not given by the parameters themselves
+CACHED_NAMES = RESULT_NAMES[len(PARAMETER_NAMES):]
+
+# Beside the cache in an ignored directory of the repository, so runs never leave results in the source tree
+DEFAULT_OUTPUT_PATH = os.path.join("..", "results", "batch_results.csv")
+
+# Same defaults as the interactive game in main.py
+DEFAULT_VALUES = {
+    'FoM': [20],
+    'uphonics_range': [20],
+    'tuning_range': [25],
+    'Qe': [10**7],
+    'FRT_On': [0, 1],
+}
+
+
+def parse_values(tokens):
+    """
+    Parse a list of command line values into an array.
+    :param tokens: Plain numbers, 'start:stop:num' for a linear range or 'log:start:stop:num' for a log range.
+    :return: A 1D float array with all values.
+    """
+    values = []
+    for token in tokens:
+        parts = token.split(":")
+        if parts[0] == "log" and len(parts) == 4:
+            values.extend(np.geomspace(float(parts[1]), float(parts[2]), int(parts[3])))
+        elif len(parts) == 3:
+            values.extend(np.linspace(float(parts[0]), float(parts[1]), int(parts[2])))
+        elif len(parts) == 1:
+            values.append(float(token))
+        else:
+            raise ValueError(f"Cannot parse value '{token}'.")
+    return np.array(values, dtype=float)
+
+
+def parameter_grid(values):
+    """
+    Build the full cartesian product of the parameter values.
+    :param values: Dictionary of parameter name to a sequence of values.
+    :return: Dictionary of parameter name to a flat array, one entry per combination.
+    """
+    axes = [np.asarray(values[name], dtype=float) for name in PARAMETER_NAMES]
+    mesh = np.meshgrid(*axes, indexing="ij")
+    return {name: axis.ravel() for name, axis in zip(PARAMETER_NAMES, mesh)}
+
+
+def simulate_grid(detuning_trace, grid, chunk_elements=2**22):
+    """
+    Average Pg and Pg_FRT over the whole trace for every parameter combination.
+    :param detuning_trace: Raw detuning samples, as stored in detuning.csv, or an iterable of blocks of them.
+    :param grid: Dictionary of flat parameter arrays as returned by parameter_grid.
+    :param chunk_elements: Upper bound on combinations x samples evaluated at once, to bound memory.
+    :return: Dictionary of result name to array, one entry per combination.
+    """
+    FoM, uphonics_range = grid['FoM'], grid['uphonics_range']
+    tuning_range, Qe, FRT_On = grid['tuning_range'], grid['Qe'], grid['FRT_On']
+    with np.errstate(divide="ignore"):
+        variables = calculate_variables(FoM, uphonics_range, tuning_range, Qe)
+
+    blocks = [detuning_trace] if isinstance(detuning_trace, np.ndarray) else detuning_trace
+    pg_sum = np.zeros(len(FoM))
+    pg_frt_sum = np.zeros(len(FoM))
+    count = 0
+    for block in blocks:
+        rows = max(1, chunk_elements // len(block))
+        for start in range(0, len(FoM), rows):
+            part = slice(start, start + rows)
+            # Combinations along the first axis, trace samples along the second
+            detuning = scale_detuning(block[np.newaxis, :], uphonics_range[part, np.newaxis])
+            detuning_FRT = frt_detuning(detuning, tuning_range[part, np.newaxis])
+            Pg = generator_power(generator_current(detuning, variables['QL'][part, np.newaxis]),
+                                 Qe[part, np.newaxis])
+            Pg_FRT = generator_power(generator_current(detuning_FRT, variables['QL_FRT'][part, np.newaxis]),
+                                     Qe[part, np.newaxis])
+            pg_sum[part] += Pg.sum(axis=1)
+            pg_frt_sum[part] += Pg_FRT.sum(axis=1)
+        count += len(block)
+    pg_avg = pg_sum / count
+    pg_frt_avg = pg_frt_sum / count
+
+    # With the FRT switched off the cavity runs on the plain generator power
+    pg_frt_avg = np.where(FRT_On > 0, pg_frt_avg, pg_avg)
+
+    results = dict(grid)
+    results.update({key: variables[key] for key in ('Qe_opt', 'Qe_opt_FRT', 'QL', 'QL_FRT')})
+    results['Pg_avg'] = pg_avg
+    results['Pg_FRT_avg'] = pg_frt_avg
+    results['power_saving'] = 1 - pg_frt_avg / pg_avg
+    return results
+
+
+def simulate_grid_cached(detuning_trace, grid, cache, context, **kwargs):
+    """
+    simulate_grid, with the combinations found in the cache taken from it and only the rest simulated.
+    :param detuning_trace: Raw detuning samples, or an iterable of blocks of them, only read if anything is missing.
+    :param cache: The ResultCache.
+    :param context: The cache context of the trace, as returned by ResultCache.context.
+    :return: Dictionary of result name to array, one entry per combination.
+    """
+    keys = cache.keys(context, np.column_stack([grid[name] for name in PARAMETER_NAMES]))
+    found, values = cache.get(keys, len(CACHED_NAMES))
+    missing = np.flatnonzero(~found)
+    if len(missing):
+        simulated = simulate_grid(detuning_trace, {name: axis[missing] for name, axis in grid.items()}, **kwargs)
+        values[missing] = np.column_stack([simulated[name] for name in CACHED_NAMES])
+        cache.put([keys[index] for index in missing], values[missing])
+    results = dict(grid)
+    results.update(zip(CACHED_NAMES, values.T))
+    return results
+
+
+class ResultsWriter:
+    """Write result chunks to a CSV file, or to Parquet if the path ends in .parquet."""
+
+    def __init__(self, output_path):
+        """
+        :param output_path: The .csv or .parquet file, created with its directory if missing.
+        """
+        self.output_path = output_path
+        self._file = None
+        self._writer = None
+
+    def write(self, results):
+        """
+        Append a chunk of results.
+        :param results: Dictionary of result name to array.
+        """
+        if self._writer is None:
+            directory = os.path.dirname(self.output_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        if self.output_path.endswith(".parquet"):
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError("Writing Parquet files requires the pyarrow package.")
+            table = pyarrow.table({name: results[name] for name in RESULT_NAMES})
+            if self._writer is None:
+                self._writer = pyarrow.parquet.ParquetWriter(self.output_path, table.schema)
+            self._writer.write_table(table)
+            return
+
+        if self._writer is None:
+            self._file = open(self.output_path, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(RESULT_NAMES)
+        self._writer.writerows(zip(*(results[name].tolist() for name in RESULT_NAMES)))
+
+    def close(self):
+        """Flush and close the output file."""
+        if self._file is not None:
+            self._file.close()
+        elif self._writer is not None:
+            self._writer.close()
+        self._file = None
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_results(results, output_path):
+    """
+    Write the results to a CSV file, or to Parquet if the path ends in .parquet.
+    :param results: Dictionary of result name to array.
+    :param output_path: The file to write.
+    """
+    with ResultsWriter(output_path) as writer:
+        writer.write(results)
+
+
+def parse_arguments(parser, argv=None):
+    """Parse the command line and fill in default values for unspecified parameters."""
+    args = parser.parse_args(argv)
+    values = {name: parse_values(getattr(args, name)) if getattr(args, name) else DEFAULT_VALUES[name]
+              for name in PARAMETER_NAMES}
+    return args, values
+
+
+def build_parser():
+    """Build the command line parser of the batch simulator."""
+    parser = argparse.ArgumentParser(description="Headless parameter sweep of the microphonics FE-FRT simulator.")
+    for name in PARAMETER_NAMES:
+        parser.add_argument(f"--{name}", nargs="+", metavar="VALUE",
+                            help=f"Values of {name} (number, start:stop:num or log:start:stop:num).")
+    parser.add_argument("--trace", default=os.path.join("..", "data", "detuning.csv"),
+                        help="Detuning trace to simulate.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_PATH,
+                        help="Output file, .csv or .parquet.")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH,
+                        help="Results cache, an SQLite file shared by every run.")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_ENTRIES,
+                        help="Number of results kept in the cache.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Simulate every combination, without reading or writing the cache.")
+    return parser
+
+
+def main(argv=None):
+    args, values = parse_arguments(build_parser(), argv)
+
+    def blocks():
+        # Stream the trace so memory stays bounded for long recordings
+        return (detuning for _, detuning in open_trace_source(args.trace, block_size=2**20, loop=False, read_ahead=2))
+
+    if args.no_cache:
+        results = simulate_grid(blocks(), parameter_grid(values))
+    else:
+        with ResultCache(args.cache, args.cache_size) as cache:
+            results = simulate_grid_cached(blocks(), parameter_grid(values), cache,
+                                           cache.context(trace_digest(blocks())))
+    write_results(results, args.output)
+    print(f"Wrote {len(results['FoM'])} configurations to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Incremental 2D binning of the Pg vs detuning history.
+
+Samples are binned once when they enter the history and un-binned when they
+leave it, so the density image and the FRT curve cost the same to update
+whatever the history length. Only a change of the axes limits rebins the
+whole history.
+"""
+import numpy as np
+
+
+class DensityGrid:
+    def __init__(self, shape=(200, 300)):
+        """
+        :param shape: Number of (Pg, detuning) bins of the density image.
+        """
+        self.shape = shape
+        self.set_limits((-1.0, 1.0), (0.0, 1.0))
+
+    @property
+    def size(self):
+        """Number of cells; this index marks samples outside the grid."""
+        return self.shape[0] * self.shape[1]
+
+    def set_limits(self, xlim, ylim):
+        """Move the grid to new detuning and Pg limits and clear it."""
+        self.xlim = xlim
+        self.ylim = ylim
+        self.counts = np.zeros(self.size)
+        # Sum and count of Pg_FRT per detuning_FRT column, for the mean FRT curve
+        self.frt_sums = np.zeros(self.shape[1])
+        self.frt_counts = np.zeros(self.shape[1])
+
+    def column_index(self, x):
+        """Detuning column of each sample, shape[1] for samples outside the grid."""
+        x = np.asarray(x, dtype=float)
+        column = np.floor((x - self.xlim[0]) / (self.xlim[1] - self.xlim[0]) * self.shape[1])
+        return np.where((column >= 0) & (column < self.shape[1]), column, self.shape[1]).astype(np.int64)
+
+    def cell_index(self, x, y):
+        """Flat cell of each (detuning, Pg) sample, size for samples outside the grid."""
+        column = self.column_index(x)
+        y = np.asarray(y, dtype=float)
+        row = np.floor((y - self.ylim[0]) / (self.ylim[1] - self.ylim[0]) * self.shape[0])
+        inside = (column < self.shape[1]) & (row >= 0) & (row < self.shape[0])
+        return np.where(inside, row * self.shape[1] + column, self.size).astype(np.int64)
+
+    def add(self, cells, frt_columns, pg_FRT, sign=1):
+        """
+        Add (or with sign=-1 remove) binned samples.
+        :param cells: Flat cells from cell_index.
+        :param frt_columns: Columns of detuning_FRT from column_index.
+        :param pg_FRT: Pg_FRT of the samples.
+        """
+        self.counts += sign * np.bincount(cells, minlength=self.size + 1)[:self.size]
+        self.frt_sums += sign * np.bincount(frt_columns, weights=pg_FRT, minlength=self.shape[1] + 1)[:self.shape[1]]
+        self.frt_counts += sign * np.bincount(frt_columns, minlength=self.shape[1] + 1)[:self.shape[1]]
+
+    def image(self):
+        """Counts per cell as a (Pg, detuning) image."""
+        return self.counts.reshape(self.shape)
+
+    def extent(self):
+        """Image extent for imshow."""
+        return (*self.xlim, *self.ylim)
+
+    def frt_curve(self):
+        """Column centres and mean Pg_FRT per column, NaN where a column is empty."""
+        edges = np.linspace(*self.xlim, self.shape[1] + 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(self.frt_counts > 0, self.frt_sums / self.frt_counts, np.nan)
+        return (edges[:-1] + edges[1:]) / 2, mean
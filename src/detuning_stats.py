@@ -0,0 +1,102 @@
+"""Statistics of a detuning trace for closed-form average powers.
+
+The mean generator power over a trace only depends on the mean square of the
+scaled detuning, so these classes reduce a trace to the few numbers needed
+for any (uphonics_range, tuning_range) without touching the samples again.
+"""
+import numpy as np
+from kernel import detuning_offset
+
+
+class DetuningHistogram:
+    """Moments and a histogram of the offset-corrected raw detuning."""
+
+    def __init__(self, bin_centres, counts, mean=None, mean_square=None):
+        """
+        :param bin_centres: Centres of the histogram bins of raw detuning + detuning_offset.
+        :param counts: Number of samples in each bin.
+        :param mean: Exact mean of raw detuning + detuning_offset, estimated from the bins if omitted.
+        :param mean_square: Exact mean square of raw detuning + detuning_offset, estimated from the bins if omitted.
+        """
+        self.bin_centres = np.asarray(bin_centres, dtype=float)
+        self.weights = np.asarray(counts, dtype=float) / np.sum(counts)
+        self.mean = np.sum(self.weights * self.bin_centres) if mean is None else mean
+        self.mean_square = np.sum(self.weights * self.bin_centres**2) if mean_square is None else mean_square
+
+    @classmethod
+    def from_trace(cls, detuning_trace, bins=4096):
+        """
+        Build the statistics from a raw detuning trace as stored in detuning.csv.
+        :param detuning_trace: Array of raw detuning samples.
+        :param bins: Number of histogram bins used for the FRT clipping.
+        """
+        detuning = np.asarray(detuning_trace, dtype=float) + detuning_offset
+        counts, edges = np.histogram(detuning, bins=bins)
+        return cls((edges[:-1] + edges[1:]) / 2, counts,
+                   mean=np.mean(detuning), mean_square=np.mean(detuning**2))
+
+    @classmethod
+    def from_blocks(cls, open_blocks, bins=4096):
+        """
+        Build the statistics from a trace too large for memory, in two streaming passes.
+        :param open_blocks: Callable returning a fresh iterable of raw detuning arrays for each pass.
+        :param bins: Number of histogram bins used for the FRT clipping.
+        """
+        count, total, total_square, largest = 0, 0.0, 0.0, 0.0
+        for detuning in open_blocks():
+            detuning = np.asarray(detuning, dtype=float) + detuning_offset
+            count += len(detuning)
+            total += np.sum(detuning)
+            total_square += np.sum(detuning**2)
+            largest = max(largest, np.max(np.abs(detuning), initial=0.0))
+        edges = np.linspace(-largest, largest, bins + 1) if largest > 0 else np.linspace(-1, 1, bins + 1)
+        counts = np.zeros(bins)
+        for detuning in open_blocks():
+            counts += np.histogram(np.asarray(detuning, dtype=float) + detuning_offset, bins=edges)[0]
+        return cls((edges[:-1] + edges[1:]) / 2, counts,
+                   mean=total / count, mean_square=total_square / count)
+
+    def mean_square_detuning(self, uphonics_range):
+        """Mean square of the detuning scaled by uphonics_range, as in Kernel.DeltaOmega_t."""
+        return (uphonics_range / 2)**2 * self.mean_square
+
+    def mean_square_detuning_FRT(self, uphonics_range, tuning_range):
+        """Mean square of the residual detuning after the FRT clips tuning_range/2."""
+        if uphonics_range == 0:
+            return 0.0
+        # Clipping |d| at tuning_range/2 is clipping the raw value at tuning_range/uphonics_range
+        threshold = tuning_range / uphonics_range
+        excess = np.maximum(np.abs(self.bin_centres) - threshold, 0.0)
+        return (uphonics_range / 2)**2 * np.sum(self.weights * excess**2)
+
+
+class DetuningIndex:
+    """Exact statistics of the offset-corrected raw detuning from a sorted prefix-sum index."""
+
+    def __init__(self, detuning_trace):
+        """
+        :param detuning_trace: Array of raw detuning samples as stored in detuning.csv.
+        """
+        detuning = np.asarray(detuning_trace, dtype=float) + detuning_offset
+        self.count = len(detuning)
+        self.mean = np.mean(detuning)
+        self.mean_square = np.mean(detuning**2)
+        self.sorted_magnitudes = np.sort(np.abs(detuning))
+        # Sums of |d| and d^2 over the largest k magnitudes, for k = 0..count
+        self._tail_sums = np.concatenate(([0.0], np.cumsum(self.sorted_magnitudes[::-1])))
+        self._tail_square_sums = np.concatenate(([0.0], np.cumsum(self.sorted_magnitudes[::-1]**2)))
+
+    def mean_square_detuning(self, uphonics_range):
+        """Mean square of the detuning scaled by uphonics_range, as in Kernel.DeltaOmega_t."""
+        return (uphonics_range / 2)**2 * self.mean_square
+
+    def mean_square_detuning_FRT(self, uphonics_range, tuning_range):
+        """Mean square of the residual detuning after the FRT clips tuning_range/2."""
+        if uphonics_range == 0:
+            return 0.0
+        # Clipping |d| at tuning_range/2 is clipping the raw value at tuning_range/uphonics_range
+        threshold = tuning_range / uphonics_range
+        tail = self.count - np.searchsorted(self.sorted_magnitudes, threshold, side="right")
+        excess_square_sum = (self._tail_square_sums[tail] - 2 * threshold * self._tail_sums[tail]
+                             + threshold**2 * tail)
+        return (uphonics_range / 2)**2 * max(excess_square_sum, 0.0) / self.count
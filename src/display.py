@@ -1,24 +1,99 @@
-from matplotlib.animation import FuncAnimation
-from collections import deque
 import asyncio
-import matplotlib.pyplot as plt
+import warnings
 import numpy as np
+from density import DensityGrid
+from ring_buffer import RingBuffer
 
-class Display:
-    def __init__(self, input_variables,calculated_variables, event_system):
+# "scatter" plots every sample, "density" the binned sample density
+DISPLAY_MODES = ("scatter", "density")
+
+
+class FixedRateRenderer:
+    """Consume kernel records as fast as they arrive and redraw at a fixed frame rate.
+
+    Subclasses build their figure in _build_figure, take records in ingest and
+    draw in render_frame, blitting whatever changed since the last frame.
+    """
+
+    async def _ingest_async(self, queue):
+        """Consume kernel records as fast as they arrive, without drawing."""
+        while True:
+            self.ingest(await queue.get())
+            # Drain whatever else is waiting before giving the loop back
+            while not queue.empty():
+                self.ingest(queue.get_nowait())
+
+    async def _render_async(self, frame_rate):
+        """Redraw at a fixed frame rate, independent of the kernel data rate."""
+        loop = asyncio.get_running_loop()
+        frame_interval = 1 / frame_rate
+        next_frame = loop.time()
+        while True:
+            self.render_frame()
+            next_frame += frame_interval
+            delay = next_frame - loop.time()
+            if delay < 0:
+                # Running late, skip the missed frames instead of trying to catch up, and leave the
+                # kernel a whole frame interval before the next one so drawing never takes the loop over
+                next_frame = loop.time() + frame_interval
+                delay = frame_interval
+            await asyncio.sleep(delay)
+
+    async def start_async(self, queue, frame_rate=60):
+        """Asynchronous plotting
+
+        :param queue: The kernel results queue, holding either one sample or one block of samples per record.
+        :param frame_rate: Number of redraws per second.
+        """
+        # Let the other tasks start before spending time on the figure
+        await asyncio.sleep(0)
+        if self.fig is None:
+            self._build_figure()
+        import matplotlib.pyplot as plt
+        with warnings.catch_warnings():
+            # Non-interactive backends warn that they cannot show a window
+            warnings.simplefilter("ignore", UserWarning)
+            plt.show(block=False)
+        await asyncio.gather(self._ingest_async(queue), self._render_async(frame_rate))
+
+
+class Display(FixedRateRenderer):
+    def __init__(self, input_variables,calculated_variables, event_system, history=1130, mode="scatter",
+                 density_shape=(200, 300)):
+        """
+        :param history: Number of samples kept in the Pg vs detuning plot.
+        :param mode: "scatter" to plot every sample, "density" to plot the binned sample density, which costs
+            the same to draw whatever the history length.
+        :param density_shape: Number of (Pg, detuning) bins of the density image.
+        """
+        if mode not in DISPLAY_MODES:
+            raise ValueError(f"Unknown display mode '{mode}'.")
+        self.mode = mode
         self.input_variables = input_variables
         self.calculated_variables = calculated_variables
         self.calculated_variable_queue = event_system.add_listener("calculated variables changed")
         self.input_variable_queue = event_system.add_listener("input variables changed")
 
-        #Cache for calculated variables
-        self._cached_calculated_variables = {}
-        self._calculated_cache_valid =False
-
-        #Cache for input variables
-        self._cached_input_variables = {}
-        self._input_cache_valid =False
-        
+        # The bars only need updating after the controls or calculated variables changed
+        self._controls_changed = True
+
+        # The figure is built on first use, so constructing the display does not wait for matplotlib
+        self.fig = None
+        self.density = DensityGrid(density_shape)
+        self._new_data = False
+
+        # Data for Pg vs detuning, colours are stored as indices into the palette and every sample
+        # keeps its density cell and FRT column so it can be taken out of the grid when it is evicted
+        self.history = RingBuffer(history, {'detuning': np.float64, 'pg': np.float64,
+                                            'detuning_FRT': np.float64, 'pg_FRT': np.float64,
+                                            'colour': np.uint16, 'cell': np.int64, 'frt_column': np.int64})
+        self.palette = []
+        self._palette_indices = {}
+
+    def _build_figure(self):
+        """Create the figure and all its artists."""
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import LogNorm
         self.fig, (self.ax, self.ax_pg_vs_detuning) = plt.subplots(2,1, figsize=(8,6))
         self.fig.canvas.mpl_connect('close_event', self.on_close)
         self.ax2 = self.ax.twinx()
@@ -35,103 +110,108 @@ class Display:
         self.ax_pg_vs_detuning.set_title("Pg vs Detuning")
         self.ax_pg_vs_detuning.set_xlabel("Detuning")
         self.ax_pg_vs_detuning.set_ylabel("Pg")
-        self.pg_vs_detuning_scatter = self.ax_pg_vs_detuning.scatter([], [], c=[], marker='.',label="Pg vs Detuning")
-        self.ax_pg_vs_detuning.legend()
+        # One line of markers per plotting colour, added as colours appear: markers of a single colour are
+        # stamped from one rendered marker, many times faster than a scatter with a colour per point
+        self.scatter_lines = {}
+        self.density_image = self.ax_pg_vs_detuning.imshow(
+            self.density.image(), origin='lower', aspect='auto', extent=self.density.extent(),
+            cmap='viridis', norm=LogNorm(vmin=1, vmax=2), interpolation='nearest')
+        self.density_image.set_visible(self.mode == "density")
+        # Mean Pg FRT per detuning FRT column, drawn in both modes
+        self.frt_line, = self.ax_pg_vs_detuning.plot([], [], color='orange', label="Pg FRT vs Detuning FRT")
+        from matplotlib.lines import Line2D
+        samples = Line2D([], [], linestyle='none', marker='.', color=self.Plotting_Colour, label="Pg vs Detuning")
+        self.ax_pg_vs_detuning.legend(handles=[samples, self.frt_line])
+        # Set with the bars, so it sits in their axes, above the bars in the headroom of the y axis, and is
+        # redrawn with them instead of with every block of samples
+        self.averages_text = self.ax.text(0.02, 0.95, "", transform=self.ax.transAxes, verticalalignment='top')
+
+        # Artists that change are only drawn by blitting over a cached background, one per axes, so a frame
+        # restores and redraws only the axes whose artists changed
+        self._scatter_order = []
+        for artist in self._bar_artists() + self._plot_artists():
+            artist.set_animated(True)
+        self._backgrounds = None
+        self._needs_full_draw = True
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        # Bin whatever arrived before the figure existed against the real axes limits
+        self._rebin_history()
+        self._new_data = True
+        self._controls_changed = True
+
+    def _bar_artists(self):
+        """Animated artists of the input values axes, in drawing order."""
+        return [*self.bars, *self.qe_bar, self.qe_opt_line, self.qe_opt_trace_line, self.averages_text]
+
+    def _plot_artists(self):
+        """Animated artists of the Pg vs detuning axes, in drawing order, the latest plotting colour on top."""
+        return [*self._scatter_order, self.density_image, self.frt_line]
 
-        # Data for Pg vs detuning
-        maxlen = 1130
-        self.pg_colours = deque(maxlen=maxlen)
-        self.detuning_data = deque(maxlen=maxlen)
-        self.pg_data = deque(maxlen=maxlen)
-        self.detuning_FRT_data = deque(maxlen=maxlen)
-        self.pg_FRT_data = deque(maxlen=maxlen)
+    @property
+    def Plotting_Colour(self):
+        """Value of Plotting_Colour from calculated variables."""
+        return self.calculated_variables['Plotting_Colour']
+
+    @property
+    def Qe_opt_trace(self):
+        """Value of Qe_opt_trace from calculated variables."""
+        return self.calculated_variables['Qe_opt_trace']
 
+    @property
+    def Qe_opt_FRT_trace(self):
+        """Value of Qe_opt_FRT_trace from calculated variables."""
+        return self.calculated_variables['Qe_opt_FRT_trace']
 
+    @property
+    def Pg_avg(self):
+        """Value of Pg_avg from calculated variables."""
+        return self.calculated_variables['Pg_avg']
 
     @property
-    def Plotting_Colour(self):
-        """Dynamically retrieve the value of Plotting_Colour from calculated variables."""
-        return self._get_cached_calculated_variables('Plotting_Colour')
-    
+    def Pg_FRT_avg(self):
+        """Value of Pg_FRT_avg from calculated variables."""
+        return self.calculated_variables['Pg_FRT_avg']
+
     @property
     def Qe(self):
-        """Dynamically retrieve the value of Qe from input variables."""
-        return self._get_cached_input_variables('Qe')
-    
+        """Value of Qe from input variables."""
+        return self.input_variables['Qe']['value']
+
     @property
     def FoM(self):
-        """Dynamically retrieve the value of FoM from input variables."""
-        return self._get_cached_input_variables('FoM')
-    
+        """Value of FoM from input variables."""
+        return self.input_variables['FoM']['value']
+
     @property
     def tuning_range(self):
-        """Dynamically retrieve the value of tuning_range from input variables."""
-        return self._get_cached_input_variables('tuning_range')
-    
+        """Value of tuning_range from input variables."""
+        return self.input_variables['tuning_range']['value']
+
     @property
     def uphonics_range(self):
-        """Dynamically retrieve the value of uphonics_range from input variables."""
-        return self._get_cached_input_variables('uphonics_range')
-    
+        """Value of uphonics_range from input variables."""
+        return self.input_variables['uphonics_range']['value']
+
     @property
     def FRT_On(self):
-        """Dynamically retrieve the value of FRT_On from input variables."""
-        return self._get_cached_input_variables('FRT_On')
+        """Value of FRT_On from input variables."""
+        return self.input_variables['FRT_On']['value']
 
     async def _listen_for_input_changes(self):
-        """Listen for changes in input variables and invalidate the cache."""
+        """Listen for changes in input variables and mark the bars for an update."""
         while True:
-            # Wait for a change in input variables
             await self.input_variable_queue.get()
-            # Invalidate the cache when a change is detected
-            self._invalidate_input_cache()
-
-    def _invalidate_input_cache(self):
-        """Invalidate the cache when input variables change."""
-        self._input_cache_valid = False
-
-    def _get_cached_input_variables(self, key):
-        """Retrieve a cached value or recalculate it if the cache is invalid."""
-        if not self._input_cache_valid:
-            # Recalculate the value and update the cache
-            self._recalculate_input_variables()
-        return self._cached_input_variables[key]
-    
-    def _recalculate_input_variables(self):
-        """Recalculate all input variables and update the cache."""
-        for key in self.input_variables:
-            # Recalculate the input variable
-            value = self.input_variables[key]['value']
-            self._cached_input_variables[key] = value
+            self._controls_changed = True
 
     async def _listen_for_calculated_changes(self):
-        """Listen for changes in calculated variables and invalidate the cache."""
+        """Listen for changes in calculated variables and mark the bars for an update."""
         while True:
-            # Wait for a change in calculated variables
             await self.calculated_variable_queue.get()
-            # Invalidate the cache when a change is detected
-            self._invalidate_calculated_cache()
-
-    def _invalidate_calculated_cache(self):
-        """Invalidate the cache when calculated variables change."""
-        self._calculated_cache_valid = False
-
-    def _get_cached_calculated_variables(self, key):
-        """Retrieve a cached value or recalculate it if the cache is invalid."""
-        if not self._calculated_cache_valid:
-            # Recalculate the value and update the cache
-            self._recalculate_calculated_variables()
-        return self._cached_calculated_variables[key]
-    
-    def _recalculate_calculated_variables(self):
-        """Recalculate all calculated variables and update the cache."""
-        for key in self.calculated_variables:
-            # Recalculate the calculated variable
-            value = self.calculated_variables[key]
-            self._cached_calculated_variables[key] = value
+            self._controls_changed = True
 
     def on_close(self, event):
         """Handle the close event of the figure."""
+        import matplotlib.pyplot as plt
         plt.close(self.fig)
         tasks = asyncio.all_tasks(asyncio.get_event_loop())
         for task in tasks:
@@ -190,6 +270,12 @@ class Display:
             color='blue', linestyle='--', label='Qe_opt'
         )
 
+        # Add a horizontal line for the Qe that minimizes the average power of the trace
+        self.qe_opt_trace_line, = self.ax2.plot(
+            [x_start, x_end], [qe_opt_value, qe_opt_value],
+            color='green', linestyle=':', label='Qe_opt (trace)'
+        )
+
         self._update_x_axis_labels()
 
     def _update_x_axis_labels(self):
@@ -198,7 +284,12 @@ class Display:
         self.ax.set_xticklabels(self.variable_names + ['Qe'])
 
     def update_bars(self, _):
-        """Update the heights of the bars based on the current variable values."""
+        """Update the heights of the bars based on the current variable values, if any changed.
+        :return: True if anything was updated.
+        """
+        if not self._controls_changed:
+            return False
+        self._controls_changed = False
         for bar, name in zip(self.bars, self.variable_names):
             # Use the property to get the current value of the variable
             if hasattr(self, name):  # Check if the property exists
@@ -209,63 +300,275 @@ class Display:
         # Update the Qe bar
         self.qe_bar[0].set_height(self.Qe)
 
-        
-    async def start_async(self, queue):
-        """Asynchronous plotting"""
-        def update(_):
-            """Update the plot."""
-            self.update_bars(_)
-            if len(self.detuning_data) > 0 and len(self.pg_data) > 0:
-                # Update the line data with the latest detuning and Pg values
-                self.pg_vs_detuning_scatter.set_offsets(np.column_stack((self.detuning_data, self.pg_data)))
-                self.pg_vs_detuning_scatter.set_color(self.pg_colours)
-                # Manually update the axes limits
-                # Update limits only if necessary
-                largest_detuning = max(np.abs(min(self.detuning_data)),max(self.detuning_data))
-                x_scale = self.ax_pg_vs_detuning.get_xlim()[1]
-                if  largest_detuning > x_scale or largest_detuning<0.8*x_scale:
-                    self.ax_pg_vs_detuning.set_xlim(-1.05*largest_detuning, 1.05*largest_detuning)
-                largest_power = max(self.pg_data)
-                largest_yscale = self.ax_pg_vs_detuning.get_ylim()[1]
-                if largest_power > largest_yscale or largest_power<0.8*largest_yscale:
-                    self.ax_pg_vs_detuning.set_ylim(0, 1.05*largest_power)
-                
-                
-        # Use FuncAnimation without blitting
-        ani = FuncAnimation(
-            self.fig,
-            update,
-            interval=1,  # Update interval in milliseconds
-            cache_frame_data=False,
-        )
+        # Show the exact full-cycle averages for the current controls
+        self.averages_text.set_text(f"Pg Avg: {self.Pg_avg:.4g}, Pg FRT Avg: {self.Pg_FRT_avg:.4g}")
+
+        # Show the optimum for the tuner state currently selected
+        qe_opt_trace = self.Qe_opt_FRT_trace if self.FRT_On else self.Qe_opt_trace
+        self.qe_opt_trace_line.set_ydata([qe_opt_trace, qe_opt_trace])
+        return True
+
+    def update_scatter(self):
+        """Update the Pg vs detuning plot with the samples that arrived since the last update.
+        :return: True if anything was updated; if the axes limits changed, the next frame is drawn in full.
+        """
+        if not self._new_data or len(self.history) == 0:
+            return False
+        self._new_data = False
+        if self._autoscale():
+            self._needs_full_draw = True
+            self._rebin_history()
+        if self.mode == "density":
+            image = self.density.image()
+            self.density_image.set_data(image)
+            self.density_image.set_extent(self.density.extent())
+            self.density_image.set_clim(1, max(image.max(), 2))
+        else:
+            self._update_scatter_lines()
+        self.frt_line.set_data(*self.density.frt_curve())
+        return True
+
+    def _update_scatter_lines(self):
+        """Split the history by plotting colour into the marker lines, ordered by when each colour was last used."""
+        colours = self.history.view('colour')
+        detuning, pg = self.history.view('detuning'), self.history.view('pg')
+        # Last position of every colour in the history, from the first position in reverse order
+        used, reversed_first = np.unique(colours[::-1], return_index=True)
+        order = used[np.argsort(-reversed_first)]
+        for index, line in self.scatter_lines.items():
+            if index not in used:
+                line.set_data([], [])
+        if len(order) == 1:
+            self._scatter_line(order[0]).set_data(detuning, pg)
+        else:
+            for index in order:
+                selected = colours == index
+                self._scatter_line(index).set_data(detuning[selected], pg[selected])
+        self._scatter_order = [self.scatter_lines[index] for index in order]
+
+    def _scatter_line(self, index):
+        """The marker line of a palette colour, created the first time the colour is plotted."""
+        line = self.scatter_lines.get(index)
+        if line is None:
+            from matplotlib.lines import Line2D
+            line = self.scatter_lines[index] = Line2D([], [], linestyle='none', marker='.',
+                                                      color=self.palette[index], animated=True)
+            self.ax_pg_vs_detuning.add_line(line)
+        return line
+
+    def _autoscale(self):
+        """Update the axes limits only if necessary, from the running extrema of the history.
+        :return: True if the limits changed.
+        """
+        rescaled = False
+        largest_detuning = max(-self.history.min('detuning'), self.history.max('detuning'))
+        x_scale = self.ax_pg_vs_detuning.get_xlim()[1]
+        # A limit set again to the value it already has is no change
+        if (largest_detuning > x_scale or largest_detuning<0.8*x_scale) and 1.05*largest_detuning != x_scale:
+            self.ax_pg_vs_detuning.set_xlim(-1.05*largest_detuning, 1.05*largest_detuning)
+            rescaled = True
+        largest_power = self.history.max('pg')
+        y_scale = self.ax_pg_vs_detuning.get_ylim()[1]
+        if (largest_power > y_scale or largest_power<0.8*y_scale) and 1.05*largest_power != y_scale:
+            self.ax_pg_vs_detuning.set_ylim(0, 1.05*largest_power)
+            rescaled = True
+        return rescaled
+
+    def _rebin_history(self):
+        """Move the density grid to the current axes limits and bin the whole history again."""
+        self.density.set_limits(self.ax_pg_vs_detuning.get_xlim(), self.ax_pg_vs_detuning.get_ylim())
+        cells = self.density.cell_index(self.history.view('detuning'), self.history.view('pg'))
+        frt_columns = self.density.column_index(self.history.view('detuning_FRT'))
+        self.history.assign('cell', cells)
+        self.history.assign('frt_column', frt_columns)
+        self.density.add(cells, frt_columns, self.history.view('pg_FRT'))
+
+    def _on_draw(self, event):
+        """Cache the static background of both axes after every full redraw and draw the animated artists on it."""
+        canvas = self.fig.canvas
+        self._backgrounds = {axes: canvas.copy_from_bbox(axes.bbox) for axes in (self.ax, self.ax_pg_vs_detuning)}
+        for artist in self._bar_artists() + self._plot_artists():
+            self.fig.draw_artist(artist)
+
+    def _blit_axes(self, axes, artists):
+        """Redraw the artists of one axes over its cached background."""
+        canvas = self.fig.canvas
+        canvas.restore_region(self._backgrounds[axes])
+        for artist in artists:
+            self.fig.draw_artist(artist)
+        canvas.blit(axes.bbox)
+
+    def render_frame(self):
+        """Redraw what changed since the last frame: nothing if nothing did, only the axes whose artists changed,
+        and the whole figure only after the axes limits changed."""
+        if self.fig is None:
+            self._build_figure()
+        bars_changed = self.update_bars(None)
+        plot_changed = self.update_scatter()
+        canvas = self.fig.canvas
+        if not canvas.supports_blit:
+            if bars_changed or plot_changed or self._needs_full_draw:
+                self._needs_full_draw = False
+                canvas.draw_idle()
+        elif self._needs_full_draw or self._backgrounds is None:
+            # Full redraw, the draw event caches the new backgrounds
+            self._needs_full_draw = False
+            canvas.draw()
+        else:
+            if bars_changed:
+                self._blit_axes(self.ax, self._bar_artists())
+            if plot_changed:
+                self._blit_axes(self.ax_pg_vs_detuning, self._plot_artists())
+        canvas.flush_events()
+
+    def ingest(self, data):
+        """Append one kernel record, a single sample or a block of samples, to the plot history."""
+        # Block mode records hold arrays, scalar records a single sample. Only the newest
+        # capacity samples of an oversized block would stay in the history.
+        kept = slice(-self.history.capacity, None)
+        detuning, pg = np.atleast_1d(data["Detuning"])[kept], np.atleast_1d(data["Pg"])[kept]
+        detuning_FRT, pg_FRT = np.atleast_1d(data["Detuning FRT"])[kept], np.atleast_1d(data["Pg FRT"])[kept]
+        # Take the samples about to be overwritten out of the density grid
+        evicted = min(len(self.history), len(self.history) + len(detuning) - self.history.capacity)
+        if evicted > 0:
+            self.density.add(self.history.view('cell')[:evicted], self.history.view('frt_column')[:evicted],
+                             self.history.view('pg_FRT')[:evicted], sign=-1)
+        cells = self.density.cell_index(detuning, pg)
+        frt_columns = self.density.column_index(detuning_FRT)
+        self.density.add(cells, frt_columns, pg_FRT)
+        self.history.extend(detuning=detuning, pg=pg, detuning_FRT=detuning_FRT, pg_FRT=pg_FRT,
+                            colour=self._colour_index(self.Plotting_Colour), cell=cells, frt_column=frt_columns)
+        self._new_data = True
+
+    def _colour_index(self, colour):
+        """Return the palette index of a colour, adding it to the palette the first time it is seen."""
+        index = self._palette_indices.get(colour)
+        if index is None:
+            index = self._palette_indices[colour] = len(self.palette)
+            self.palette.append(colour)
+        return index
+
+class CryomoduleDisplay(FixedRateRenderer):
+    def __init__(self, kernel, worst_count=5, history=1130*4):
+        """
+        :param kernel: The MultiCavityKernel whose cavities are shown.
+        :param worst_count: Number of highest-power cavities shown in the bar chart.
+        :param history: Number of samples of total power kept in the plot.
+        """
+        self.kernel = kernel
+        self.worst_count = min(worst_count, kernel.cavity_count)
+        self.history = RingBuffer(history, {'time': np.float64, 'total': np.float64})
+        self._new_data = False
+        # The calculated variables of the kernel the bars were last drawn for, replaced whenever they change
+        self._variables = None
+        # The figure is built on first use, so constructing the display does not wait for matplotlib
+        self.fig = None
+
+    def _build_figure(self):
+        """Create the figure and all its artists."""
+        import matplotlib.pyplot as plt
+        self.fig, (self.ax_total, self.ax_worst) = plt.subplots(2, 1, figsize=(8, 6))
+        self.fig.canvas.mpl_connect('close_event', self.on_close)
 
-        batch_size = 10  # Number of points to plot at once
+        self.ax_total.set_xlabel("Time")
+        self.ax_total.set_ylabel("Pg")
+        # Only the total power line changes from frame to frame, it is blitted over the cached background
+        self.total_line, = self.ax_total.plot([], [], color='blue', animated=True)
+
+        self.ax_worst.set_title("Worst offenders (Pg Avg)")
+        self.ax_worst.set_ylabel("Pg")
+        self.worst_bars = self.ax_worst.bar(range(self.worst_count), np.zeros(self.worst_count), color='red')
+        self.ax_worst.set_xticks(range(self.worst_count))
+        self._background = None
+        self._needs_full_draw = True
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        self._variables = None
+        self._new_data = True
 
-        while True:
-                            
-            batch = []
-            # Get the latest values from the queue
-            for _ in range(batch_size):
-                data = await queue.get()
-                batch.append(data)
-            
-            #Process the batch
-            for data in batch:
-                detuning = data["Detuning"]
-                colour = self.Plotting_Colour
-                pg = data["Pg"]
-                detuning_FRT = data["Detuning FRT"]
-                pg_FRT = data["Pg FRT"]
-
-                # Append the new data to the circular buffers
-                self.pg_colours.append(colour)
-                self.detuning_data.append(detuning)
-                self.pg_data.append(pg)
-                self.detuning_FRT_data.append(detuning_FRT)
-                self.pg_FRT_data.append(pg_FRT)
-            # Force Matplotlib to redraw the canvas
-            self.fig.canvas.draw_idle()
-            # Allow matplotlib to update the plot
-            plt.pause(0.002)
-            await asyncio.sleep(0)
+    def on_close(self, event):
+        """Handle the close event of the figure."""
+        import matplotlib.pyplot as plt
+        plt.close(self.fig)
+        for task in asyncio.all_tasks(asyncio.get_event_loop()):
+            task.cancel()
 
+    def ingest(self, data):
+        """Append the total power of one kernel block to the plot history."""
+        self.history.extend(time=data["Time"], total=data["Pg Total"])
+        self._new_data = True
+
+    def update_averages(self):
+        """Update the worst offender bars and the title after the cavity parameters changed.
+        :return: True if anything was updated.
+        """
+        variables = self.kernel.calculated_variables
+        if variables is self._variables:
+            return False
+        self._variables = variables
+        self.ax_total.set_title(f"Total Pg of {self.kernel.cavity_count} cavities "
+                                f"(Avg: {variables['Total_Pg_avg']:.4g})")
+        worst = self.kernel.worst_offenders(self.worst_count)
+        averages = variables['Pg_cavity_avg'][worst]
+        for bar, value in zip(self.worst_bars, averages):
+            bar.set_height(value)
+        self.ax_worst.set_xticklabels([f"Cavity {cavity}" for cavity in worst])
+        self.ax_worst.set_ylim(0, 1.05 * max(averages.max(), 1e-12))
+        return True
+
+    def update_total(self):
+        """Update the total power line with the samples that arrived since the last update.
+        :return: True if anything was updated; if the axes limits changed, the next frame is drawn in full.
+        """
+        if not self._new_data or len(self.history) == 0:
+            return False
+        self._new_data = False
+        self.total_line.set_data(self.history.view('time'), self.history.view('total'))
+        if self._autoscale():
+            self._needs_full_draw = True
+        return True
+
+    def _autoscale(self):
+        """Move the axes limits only when the line leaves them, so most frames are blitted.
+        :return: True if the limits changed.
+        """
+        rescaled = False
+        time = self.history.view('time')
+        left, right = self.ax_total.get_xlim()
+        if time[-1] > right or time[0] < left:
+            # A window of twice the history, so the line scrolls across it for a whole history before it moves
+            span = max(time[-1] - time[0], self.history.capacity * self.kernel.sample_period)
+            self.ax_total.set_xlim(time[-1] - span, time[-1] + span)
+            rescaled = True
+        largest_total = self.history.max('total')
+        y_scale = self.ax_total.get_ylim()[1]
+        if (largest_total > y_scale or largest_total<0.8*y_scale) and 1.05*largest_total != y_scale:
+            self.ax_total.set_ylim(0, 1.05*largest_total)
+            rescaled = True
+        return rescaled
+
+    def _on_draw(self, event):
+        """Cache the static background after every full redraw and draw the total power line on it."""
+        self._background = self.fig.canvas.copy_from_bbox(self.ax_total.bbox)
+        self.fig.draw_artist(self.total_line)
+
+    def render_frame(self):
+        """Redraw what changed since the last frame: nothing if nothing did, only the total power line for new
+        samples, and the whole figure after the averages or the axes limits changed."""
+        if self.fig is None:
+            self._build_figure()
+        averages_changed = self.update_averages()
+        total_changed = self.update_total()
+        canvas = self.fig.canvas
+        if not canvas.supports_blit:
+            if averages_changed or total_changed or self._needs_full_draw:
+                self._needs_full_draw = False
+                canvas.draw_idle()
+        elif averages_changed or self._needs_full_draw or self._background is None:
+            # Full redraw, the draw event caches the new background
+            self._needs_full_draw = False
+            canvas.draw()
+        elif total_changed:
+            canvas.restore_region(self._background)
+            self.fig.draw_artist(self.total_line)
+            canvas.blit(self.ax_total.bbox)
+        canvas.flush_events()
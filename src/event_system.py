@@ -1,20 +1,120 @@
 import asyncio
-from collections import defaultdict
+import json
+import sys
+import time
+from collections import defaultdict, deque
+
+# Delivery policies for a full subscriber queue
+BLOCK = "block"              # trigger_event waits for space, publish raises asyncio.QueueFull
+COALESCE = "coalesce"        # keep only the latest pending event
+DROP_OLDEST = "drop_oldest"  # discard the oldest pending event to make room
+DROP_NEWEST = "drop_newest"  # discard the event being published
+POLICIES = (BLOCK, COALESCE, DROP_OLDEST, DROP_NEWEST)
+
+
+class InstrumentedQueue(asyncio.Queue):
+    """An asyncio.Queue that records its high-water depth and how long items wait in it."""
+
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize=maxsize)
+        self._enqueue_times = deque()
+        self.high_water = 0
+        self.consumed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._discarding = False
+
+    # _put and _get are the storage hooks behind every put/get variant of asyncio.Queue
+    def _put(self, item):
+        super()._put(item)
+        self._enqueue_times.append(time.perf_counter())
+        self.high_water = max(self.high_water, self.qsize())
+
+    def _get(self):
+        latency = time.perf_counter() - self._enqueue_times.popleft()
+        if self._discarding:
+            return super()._get()
+        self.consumed += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        return super()._get()
+
+    def discard_oldest(self):
+        """Remove the oldest item without counting it as consumed."""
+        self._discarding = True
+        try:
+            return self.get_nowait()
+        finally:
+            self._discarding = False
+
+    def snapshot(self):
+        """Return the depth and latency statistics of the queue."""
+        return {
+            "depth": self.qsize(),
+            "high_water": self.high_water,
+            "consumed": self.consumed,
+            "mean_latency_ms": 1000 * self.total_latency / self.consumed if self.consumed else 0.0,
+            "max_latency_ms": 1000 * self.max_latency,
+        }
+
+
+class EventMetrics:
+    """Publish counts per event and statistics of the instrumented queues."""
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.published = defaultdict(int)
+        self.queues = {}
+
+    def record_publish(self, event_name):
+        """Count one publication of an event."""
+        self.published[event_name] += 1
+
+    def snapshot(self, dropped=None):
+        """
+        Return the current metrics.
+        :param dropped: Number of dropped events per event name.
+        :return: Dictionary with per-event publish counts and rates and per-queue statistics.
+        """
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        dropped = dropped or {}
+        return {
+            "elapsed_s": elapsed,
+            "events": {name: {"published": count, "rate_per_s": count / elapsed,
+                              "dropped": dropped.get(name, 0)}
+                       for name, count in self.published.items()},
+            "queues": {label: queue.snapshot() for label, queue in self.queues.items()},
+        }
+
 
 class AsyncEventSystem:
     """An asyncio-based pub-sub event system with per-subscriber queues."""
 
-    def __init__(self):
+    def __init__(self, metrics=False):
+        """
+        :param metrics: Record publish counts, queue depths and queue latencies.
+        """
         # Dictionary to store event names and their associated subscriber queues
         self._events = defaultdict(list)
+        # Delivery policy and queue size of each event
+        self._policies = {}
+        # Number of events dropped or coalesced away per event name
+        self.dropped = defaultdict(int)
+        # None when disabled, so the only cost is one attribute check per publish
+        self.metrics = EventMetrics() if metrics else None
 
-    def register_event(self, event_name):
+    def register_event(self, event_name, policy=BLOCK, maxsize=0):
         """
         Register a new event by name.
         :param event_name: The name of the event to register.
+        :param policy: What to do when a subscriber queue is full, one of POLICIES.
+        :param maxsize: Size of each subscriber queue, 0 for unbounded. Coalesced events always use 1.
         """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown event policy '{policy}'.")
         if event_name not in self._events:
             self._events[event_name] = []
+        self._policies[event_name] = (policy, 1 if policy == COALESCE else maxsize)
 
     def add_listener(self, event_name):
         """
@@ -24,19 +124,83 @@ class AsyncEventSystem:
         """
         if event_name not in self._events:
             raise ValueError(f"Event '{event_name}' is not registered.")
-        queue = asyncio.Queue()
+        _, maxsize = self._policies.get(event_name, (BLOCK, 0))
+        queue = self.create_queue(f"{event_name}[{len(self._events[event_name])}]", maxsize)
         self._events[event_name].append(queue)
         return queue
 
+    def create_queue(self, label, maxsize=0):
+        """
+        Create a queue that is included in the metrics when they are enabled.
+        :param label: Name of the queue in the metrics snapshot.
+        :param maxsize: Size of the queue, 0 for unbounded.
+        :return: An asyncio.Queue, instrumented when metrics are enabled.
+        """
+        if self.metrics is None:
+            return asyncio.Queue(maxsize=maxsize)
+        queue = InstrumentedQueue(maxsize=maxsize)
+        self.metrics.queues[label] = queue
+        return queue
+
+    def metrics_snapshot(self):
+        """Return the current metrics, or None when metrics are disabled."""
+        if self.metrics is None:
+            return None
+        return self.metrics.snapshot(self.dropped)
+
+    async def log_metrics_async(self, interval=5.0, stream=None):
+        """
+        Periodically write the metrics snapshot as one JSON line.
+        :param interval: Seconds between log lines.
+        :param stream: File to write to, stderr by default.
+        """
+        while self.metrics is not None:
+            await asyncio.sleep(interval)
+            print(json.dumps(self.metrics_snapshot()), file=stream or sys.stderr, flush=True)
+
+    def publish(self, event_name, *args, **kwargs):
+        """
+        Publish an event to all subscriber queues without waiting.
+        :param event_name: The name of the event to publish.
+        :param args: Positional arguments to pass to the listeners.
+        :param kwargs: Keyword arguments to pass to the listeners.
+        """
+        if event_name not in self._events:
+            raise ValueError(f"Event '{event_name}' is not registered.")
+        if self.metrics is not None:
+            self.metrics.record_publish(event_name)
+        policy, _ = self._policies.get(event_name, (BLOCK, 0))
+        item = (args, kwargs)
+        for queue in self._events[event_name]:
+            if not queue.full():
+                queue.put_nowait(item)
+            elif policy in (COALESCE, DROP_OLDEST):
+                if isinstance(queue, InstrumentedQueue):
+                    queue.discard_oldest()
+                else:
+                    queue.get_nowait()
+                queue.put_nowait(item)
+                self.dropped[event_name] += 1
+            elif policy == DROP_NEWEST:
+                self.dropped[event_name] += 1
+            else:
+                queue.put_nowait(item)  # Raises asyncio.QueueFull
+
     async def trigger_event(self, event_name, *args, **kwargs):
         """
         Trigger an event, putting it into all subscriber queues.
+        Events with the block policy wait for space in full queues, other policies never wait.
         :param event_name: The name of the event to trigger.
         :param args: Positional arguments to pass to the listeners.
         :param kwargs: Keyword arguments to pass to the listeners.
         """
         if event_name not in self._events:
             raise ValueError(f"Event '{event_name}' is not registered.")
+        policy, _ = self._policies.get(event_name, (BLOCK, 0))
+        if policy != BLOCK:
+            self.publish(event_name, *args, **kwargs)
+            return
+        if self.metrics is not None:
+            self.metrics.record_publish(event_name)
         for queue in self._events[event_name]:
-            
-            await queue.put((args, kwargs))
\ No newline at end of file
+            await queue.put((args, kwargs))
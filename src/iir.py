@@ -0,0 +1,72 @@
+"""Vectorized first-order IIR filter, y[n] = pole*y[n-1] + x[n], for complex poles.
+
+A first-order recursion has the closed form y[n] = pole**n * cumsum(pole**-k * x[k]),
+so a block is filtered with one cumsum instead of a Python loop. pole**-k grows
+without bound, so the block is cut into chunks short enough to keep it finite,
+each chunk is filtered from a zero state, and the chunk end values are joined
+by the same recursion with pole**chunk_length.
+
+    y, state = first_order_iir(noise, np.exp((-np.pi*f/Q + 2j*np.pi*f) / sample_rate))
+    y, state = first_order_iir(next_noise, pole, state)  # Continues where the last block ended
+"""
+import functools
+import numpy as np
+
+# Largest growth of pole**-k within a chunk, as a natural logarithm
+MAX_DECAY = 40.0
+
+
+@functools.lru_cache(maxsize=64)
+def _powers(pole, length):
+    """pole**-k, pole**k and pole**(k+1) for k in range(length)."""
+    k = np.arange(length)
+    return pole**-k, pole**k, pole**(k + 1)
+
+
+def first_order_iir(x, pole, state=0.0, chunk=8192):
+    """
+    Filter x through y[n] = pole*y[n-1] + x[n].
+    :param x: The input samples, real or complex.
+    :param pole: The filter pole, real or complex, with magnitude at most 1.
+    :param state: y[-1], the last output of the previous block.
+    :param chunk: Maximum number of samples per chunk, which keeps the working set in cache.
+    :return: The output, real only if x, pole and state are, and the final state to pass with the next block.
+    """
+    x = np.asarray(x)
+    # Real filters run in real arithmetic, at half the cost
+    pole = complex(pole)
+    if pole.imag == 0:
+        pole = pole.real
+    dtype = np.result_type(x.dtype, type(pole), type(state))
+    n = len(x)
+    if n == 0:
+        return np.empty(0, dtype=dtype), state
+    magnitude = abs(pole)
+    if magnitude > 1:
+        raise ValueError(f"Unstable pole {pole}, its magnitude must be at most 1.")
+    decay = -np.log(magnitude) if magnitude > 0 else np.inf
+    length = min(n, chunk, int(MAX_DECAY / decay) if decay > 0 else n)
+    if length < 2:
+        # pole**2 is below double precision, only the previous sample contributes
+        y = x.astype(dtype)
+        y[0] += pole * state
+        y[1:] += pole * x[:-1]
+        return y, y[-1]
+    chunks = -(-n // length)
+    if n % length:
+        padded = np.zeros(chunks * length, dtype=x.dtype)
+        padded[:n] = x
+        x = padded
+    inverse_powers, powers, next_powers = _powers(pole, length)
+    # Every chunk filtered from a zero state, in one buffer
+    local = np.multiply(x.reshape(chunks, length), inverse_powers, dtype=dtype)
+    np.cumsum(local, axis=1, out=local)
+    local *= powers
+    # The true value at the end of each chunk, which carries into the next one
+    ends, _ = first_order_iir(local[:, -1], pole**length, state, chunk)
+    carries = np.empty(chunks, dtype=dtype)
+    carries[0] = state
+    carries[1:] = ends[:-1]
+    local += np.multiply.outer(carries, next_powers)
+    y = local.ravel()[:n]
+    return y, y[-1]
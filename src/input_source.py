@@ -0,0 +1,182 @@
+"""Sources of input variable changes, and recording and replay of control sessions.
+
+An input source changes input_variables and publishes "input variables
+changed", as MidiDriver does for a live controller. ControlRecorder logs every
+change with its time since the start of the session as one JSON line, and
+ControlReplayer feeds such a log back at real time, N times faster, or as fast
+as possible. replay_session steps a kernel through a log without an event
+loop, applying each change at the sample that corresponds to its time, so a
+session always produces the same results.
+
+Replay a recorded session through the kernel as fast as possible, from the src directory:
+    python input_source.py session.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+
+class InputSource:
+    """Base class of sources of input variable changes. Subclasses implement start_async."""
+
+    def __init__(self, input_variables, event_system):
+        self.input_variables = input_variables
+        self.event_system = event_system
+
+    def apply(self, values):
+        """
+        Set input variables and publish one change event if any of them changed.
+        :param values: Dictionary of input variable name to new value.
+        :return: True if an input variable changed.
+        """
+        changed = False
+        for name, value in values.items():
+            if self.input_variables[name]['value'] != value:
+                self.input_variables[name]['value'] = value
+                changed = True
+        if changed:
+            self.event_system.publish("input variables changed")
+        return changed
+
+    async def start_async(self):
+        """Produce input changes until cancelled or the source is exhausted."""
+        raise NotImplementedError
+
+
+class ControlRecorder:
+    """Log timestamped input variable changes to a JSON lines file."""
+
+    def __init__(self, input_variables, event_system, path):
+        """
+        :param path: The session file to write, one {"time": seconds, "values": {...}} object per line.
+        """
+        self.input_variables = input_variables
+        self.input_variable_queue = event_system.add_listener("input variables changed")
+        self.path = path
+        self._last_values = {}
+
+    def _record(self, file, elapsed):
+        """Write the input variables that changed since the last record."""
+        values = {name: variable['value'] for name, variable in self.input_variables.items()
+                  if self._last_values.get(name) != variable['value']}
+        if values:
+            self._last_values.update(values)
+            file.write(json.dumps({"time": elapsed, "values": values}) + "\n")
+            file.flush()
+
+    async def start_async(self):
+        """Record until cancelled, starting with the initial value of every input variable."""
+        start = time.perf_counter()
+        with open(self.path, "w") as file:
+            self._record(file, 0.0)
+            while True:
+                await self.input_variable_queue.get()
+                self._record(file, time.perf_counter() - start)
+
+
+def load_session(path):
+    """Load a recorded session as a list of (time, values) pairs in time order."""
+    with open(path) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    return [(record["time"], record["values"]) for record in records]
+
+
+class ControlReplayer(InputSource):
+    """Feed a recorded session back into the input variables."""
+
+    def __init__(self, input_variables, event_system, session, speed=1.0):
+        """
+        :param session: A session file or a list of (time, values) pairs.
+        :param speed: Replay speed relative to the recording, None for as fast as possible.
+        """
+        super().__init__(input_variables, event_system)
+        self.session = load_session(session) if isinstance(session, (str, os.PathLike)) else session
+        self.speed = speed
+
+    async def start_async(self):
+        """Replay the session once; returns when the last change has been applied."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for event_time, values in self.session:
+            if self.speed is None:
+                await asyncio.sleep(0)  # Still let the listeners see every change
+            else:
+                await asyncio.sleep(max(start + event_time / self.speed - loop.time(), 0))
+            self.apply(values)
+
+
+def replay_session(kernel, session, block_size=1130, sample_period=None, duration=None):
+    """
+    Step a kernel through a recorded session as fast as possible, without an event loop.
+    Each change is applied before the first block starting at or after its time, with
+    session time mapped to simulated time one to one.
+    :param kernel: The Kernel to drive; its input_variables are changed in place.
+    :param session: A list of (time, values) pairs.
+    :param sample_period: Simulated time per sample, one over the kernel's sample rate by default.
+    :param duration: Simulated time to run, until the last change by default.
+    :return: Generator of the kernel records, one per block.
+    """
+    if sample_period is None:
+        sample_period = 1 / kernel.sample_rate
+    if duration is None:
+        duration = session[-1][0] if session else 0.0
+    samples = int(round(duration / sample_period))
+    next_change = 0
+    position = 0
+    while True:
+        values = {}
+        while next_change < len(session) and session[next_change][0] <= position * sample_period:
+            values.update(session[next_change][1])
+            next_change += 1
+        if values:
+            kernel.parameters.set(values)
+        if position >= samples:
+            break
+        count = min(block_size, samples - position)
+        yield kernel.step_block(count)
+        position += count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded control session through the kernel as fast as possible.")
+    parser.add_argument("session", help="Session file written by ControlRecorder.")
+    parser.add_argument("--trace", default=os.path.join("..", "data", "detuning.csv"), help="Detuning trace to run.")
+    parser.add_argument("--block-size", type=int, default=1130, help="Samples per kernel block.")
+    parser.add_argument("--profile", action="store_true", help="Time the kernel stages and print a summary.")
+    args = parser.parse_args(argv)
+
+    from event_system import AsyncEventSystem, COALESCE
+    from kernel import Kernel
+    event_system = AsyncEventSystem()
+    event_system.register_event("input variables changed", policy=COALESCE)
+    event_system.register_event("calculated variables changed", policy=COALESCE)
+    input_variables = {'FoM': {'value': 20}, 'uphonics_range': {'value': 20}, 'Qe': {'value': 10**7},
+                       'tuning_range': {'value': 25}, 'FRT_On': {'value': 0}}
+    kernel = Kernel(input_variables, {'Plotting_Colour': '#ff0000'}, args.trace, event_system)
+    session = load_session(args.session)
+    profiler = None
+    if args.profile:
+        from profiling import StageProfiler, instrument_kernel  # Only needed when profiling
+        profiler = StageProfiler("replay")
+        instrument_kernel(profiler, kernel)
+
+    start = time.perf_counter()
+    samples = 0
+    total_power = 0.0
+    for record in replay_session(kernel, session, args.block_size):
+        samples += len(record["Pg"])
+        total_power += record["Pg FRT"].sum() if kernel.FRT_On else record["Pg"].sum()
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {len(session)} changes over {samples} samples in {elapsed:.3f} s "
+          f"({samples / max(elapsed, 1e-9):.4g} samples/s), mean Pg {total_power / max(samples, 1):.6g}")
+    if profiler is not None:
+        for stage, summary in profiler.summary()["stages"].items():
+            print(f"  {stage:<16} {summary['count']:>8} calls, mean {summary['mean_us']:9.2f} us, "
+                  f"p99 {summary['p99_us']:9.2f} us, max {summary['max_us']:9.2f} us, "
+                  f"{summary['share']:6.1%} of the time")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
-import csv
+import functools
 import json
+import logging
+import math
 import os
+import types
 import asyncio
+import collections
 import numpy as np
 import time
-import matplotlib.cm as cm
+from trace_format import TRACE_SUFFIX, open_trace
+from trace_source import ArrayTraceSource, open_trace_source
+from parameter_store import ParameterStore
+from tuner_model import TunerModel
+
+logger = logging.getLogger(__name__)
 
 #detuning_offset
 detuning_offset = 0.034688375
@@ -12,214 +21,376 @@ detuning_offset = 0.034688375
 # Construct the path to the config file
 config_path = os.path.join("..", "config", "config.json")
 
-# Load the config.json file with error handling
-try:
-    with open(config_path, "r", encoding="utf-16") as config_file:
-        content = config_file.read().encode("utf-8").decode("utf-8")  # Remove BOM by re-encoding
-        config = json.loads(content)
-except FileNotFoundError:
-    print(f"Error: Config file not found at {config_path}")
-    config = {}
-except json.JSONDecodeError as e:
-    print(f"Error: Failed to parse JSON file at {config_path}: {e}")
-    config = {}
-
-# Access the variables from the config file
-f0 = config["constants"]["f0"]
-w0 = 2*np.pi*f0
-Vc = config["constants"]["Vc"]
-Q0 = config["constants"]["Q0"]
-RQ = config["constants"]["RQ"]
+# Hue wheel of the plotting colours, the hsv colormap sampled at 10 points
+PLOTTING_COLOURS = ('#ff0000', '#ffa700', '#afff00', '#07ff00', '#00ff9f',
+                    '#00b7ff', '#000fff', '#9700ff', '#ff00bf', '#ff0017')
+
+CONSTANT_NAMES = ("f0", "w0", "Vc", "Q0", "RQ")
+
+
+@functools.lru_cache(maxsize=None)
+def load_config(path=config_path):
+    """Load the config.json file on first use, with error handling; later calls return the cached result."""
+    try:
+        with open(path, "r", encoding="utf-16") as config_file:
+            content = config_file.read().encode("utf-8").decode("utf-8")  # Remove BOM by re-encoding
+            return json.loads(content)
+    except FileNotFoundError:
+        print(f"Error: Config file not found at {path}")
+    except json.JSONDecodeError as e:
+        print(f"Error: Failed to parse JSON file at {path}: {e}")
+    return {}
+
+
+@functools.lru_cache(maxsize=None)
+def constants():
+    """The physical constants from the config file: f0, w0, Vc, Q0 and RQ."""
+    config = load_config()
+    f0 = config["constants"]["f0"]
+    return types.SimpleNamespace(f0=f0, w0=2*np.pi*f0, Vc=config["constants"]["Vc"],
+                                 Q0=config["constants"]["Q0"], RQ=config["constants"]["RQ"])
+
+
+def __getattr__(name):
+    """Serve the constants as module attributes, loading the config only when one is first used."""
+    if name in CONSTANT_NAMES:
+        return getattr(constants(), name)
+    if name == "config":
+        return load_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load_detuning_trace(csv_file):
+    """Load the whole detuning trace into time and detuning arrays.
+
+    Binary trace files are memory-mapped instead of parsed; every other trace,
+    compressed files and microphonics specs included, is read through its
+    trace source.
+    """
+    if csv_file.endswith(TRACE_SUFFIX):
+        return open_trace(csv_file)
+    source = open_trace_source(csv_file, loop=False)
+    try:
+        return source.read_all()
+    finally:
+        source.close()
+
+
+def scale_detuning(detuning, uphonics_range):
+    """Scale a raw detuning sample (or array) by the microphonics range."""
+    return uphonics_range * (detuning + detuning_offset) / 2
+
+
+def frt_detuning(detuning, tuning_range):
+    """Residual detuning left after the FRT compensates up to tuning_range/2."""
+    half_range = tuning_range/2
+    return np.where(np.abs(detuning) > half_range,
+                    np.sign(detuning)*(np.abs(detuning)-half_range), 0.0)
+
+
+def detuning_range_Qe(uphonics_range):
+    """Qe_opt for the detuning range alone, w0/uphonics_range, infinite without microphonics."""
+    c = constants()
+    if np.ndim(uphonics_range) == 0:
+        return c.w0/uphonics_range if uphonics_range else math.inf
+    with np.errstate(divide='ignore'):
+        return c.w0/np.asarray(uphonics_range, dtype=float)
+
+
+def frt_quality_factor(FoM, tuning_range):
+    """Quality factor QFRT of the losses added by the FRT."""
+    return FoM*constants().f0/tuning_range
+
+
+def loaded_quality_factor(Qe, QFRT=None):
+    """Loaded Q for an external Q, with the FRT losses if QFRT is given."""
+    Q0 = constants().Q0
+    return 1 / (1 / Qe + 1 / Q0) if QFRT is None else 1 / (1 / Qe + 1 / Q0 + 1 / QFRT)
+
+
+def calculate_variables(FoM, uphonics_range, tuning_range, Qe):
+    """Calculate the derived quality factors, element-wise for scalars or arrays."""
+    c = constants()
+    QFRT = frt_quality_factor(FoM, tuning_range)
+    return {
+        'Qe_opt': detuning_range_Qe(uphonics_range),
+        'QFRT': QFRT,
+        'Qe_opt_FRT': 1 / (1 / c.Q0 + 1 / QFRT),
+        'QL': loaded_quality_factor(Qe),
+        'QL_FRT': loaded_quality_factor(Qe, QFRT),
+    }
+
+
+def generator_current(detuning, QL):
+    """Calculate the complex generator current for a detuning and loaded Q."""
+    c = constants()
+    real_brack = c.Vc / (2 * c.RQ * QL)
+    imag_brack = 1j * c.Vc * detuning / (c.w0 * c.RQ)
+    return real_brack + imag_brack
+
+
+def generator_power(Ig, Qe):
+    """Calculate the generator power from the generator current and external Q."""
+    return Qe*constants().RQ*np.abs(Ig)**2/2
+
+
+# Values read in the per-sample hot loop, kept as plain attributes of the kernel
+KERNEL_ATTRIBUTES = ('FoM', 'uphonics_range', 'tuning_range', 'Qe', 'FRT_On', 'QL', 'QL_FRT', 'Pg_avg', 'Pg_FRT_avg')
+# Passes over the trace when averaging through a tuner model, all but the last only settle the tuner state
+TUNER_CYCLES = 2
 
 
 class Kernel:
-    def __init__(self, input_variables, calculated_variables, csv_file, event_system):
+    def __init__(self, input_variables, calculated_variables, csv_file, event_system, streaming=False, tuner=None):
+        """
+        :param csv_file: The detuning trace, a CSV or binary trace file, optionally compressed, or a microphonics spec.
+        :param streaming: Read the trace in bounded blocks on a background thread instead of loading it whole.
+        :param tuner: Keyword arguments of a TunerModel for the FRT, None for the ideal FRT.
+            With a tuner, Pg_FRT_avg is the average through the tuner over a cycle of the trace, and the average with
+            the ideal FRT, the reference the tuner model is compared to, is published as Pg_FRT_ideal_avg.
+        """
         self.input_variables = input_variables
         self.calculated_variables = calculated_variables
         self.csv_file = csv_file
         self.event_system = event_system
+        # Deferred, detuning_stats and optimizer import their constants from this module
+        from detuning_stats import DetuningIndex, DetuningHistogram
+        if streaming:
+            self.time_trace, self.detuning_trace = None, None
+            self.trace_source = open_trace_source(csv_file, loop=True, read_ahead=2)
+            self.detuning_statistics = DetuningHistogram.from_blocks(self._detuning_blocks)
+        else:
+            self.time_trace, self.detuning_trace = self._load_detuning_trace()
+            self.trace_source = ArrayTraceSource(self.time_trace, self.detuning_trace)
+            self.detuning_statistics = DetuningIndex(self.detuning_trace)
+        # Samples the scalar path fetched from the trace source but has not used yet, taken first by the block path
+        self._sample_buffer = collections.deque()
         self.detuning_time_generator = self._detuning_time_generator()
+        self.sample_rate = 1 / self._sample_period()
+        self.tuner_spec = tuner
+        self.tuner = None if tuner is None else TunerModel(self.sample_rate, **tuner)
         self.input_variable_queue = event_system.add_listener("input variables changed")
         self.last_update_time = time.time()
         self.color_index = 0
 
-        #Cache for input variables
-        self._cached_input_variables = {}
-        self._cache_valid =False
-        
-    def _invalidate_cache(self):
-        """Invalidate the cache when input variables change."""
-        self._cache_valid = False
+        # Derived quantities are recomputed only where an input changed, and the
+        # values the hot loop needs are copied into plain attributes
+        self.parameters = ParameterStore(input_variables, calculated_variables)
+        self._define_calculated_variables()
+        self.parameters.subscribe(self._apply_changes)
+        self._apply_changes({**self.parameters.inputs, **self.parameters.values})
 
-    def _get_cached_input_variables(self, key):
-        """Retrieve a cached value or recalculate it if the cache is invalid."""
-        if not self._cache_valid:
-            # Recalculate the value and update the cache
-            self._recalculate_variables()
-        return self._cached_input_variables[key]
+    def _define_calculated_variables(self):
+        """Build the dependency graph of the calculated variables."""
+        from optimizer import optimum, mean_generator_power  # Deferred, optimizer imports this module
+        c = constants()
+        statistics = self.detuning_statistics
 
-    def _get_next_color(self):
-        """Generate the next color from a color wheel."""
-        num_colors = 10  # Number of distinct colors
-        colormap = cm.get_cmap('hsv', num_colors)  # Use the HSV color wheel
-        color = colormap(self.color_index % num_colors)  # Get the next color
-        self.color_index += 1
-        # Convert RGBA to a hex color string
-        return '#{:02x}{:02x}{:02x}'.format(
-            int(color[0] * 255), int(color[1] * 255), int(color[2] * 255)
-        )
-
-    def _recalculate_variables(self):
-        """Recalculate all input and calculated variables and update the cache."""
-        for key in self.input_variables:
-            # Recalculate the input variable
-            value = self.input_variables[key]['value']
-            self._cached_input_variables[key] = value
-        # Recalculate the calculated variables
+        define = self.parameters.define
+        define('Plotting_Colour', self._plotting_colour, tuple(self.input_variables))
+        define('Qe_opt', detuning_range_Qe, ('uphonics_range',))
+        define('QFRT', frt_quality_factor, ('FoM', 'tuning_range'))
+        define('Qe_opt_FRT', lambda QFRT: 1 / (1 / c.Q0 + 1 / QFRT), ('QFRT',))
+        define('QL', loaded_quality_factor, ('Qe',))
+        define('QL_FRT', loaded_quality_factor, ('Qe', 'QFRT'))
+        # Qe that minimizes the average power and the exact averages for the loaded trace
+        define('mean_square_detuning', statistics.mean_square_detuning, ('uphonics_range',))
+        if self.tuner is None:
+            define('mean_square_detuning_FRT', statistics.mean_square_detuning_FRT, ('uphonics_range', 'tuning_range'))
+        else:
+            define('mean_square_detuning_FRT', self._tuner_mean_square_detuning, ('uphonics_range', 'tuning_range'))
+            define('mean_square_detuning_FRT_ideal', statistics.mean_square_detuning_FRT,
+                   ('uphonics_range', 'tuning_range'))
+            define('Pg_FRT_ideal_avg', mean_generator_power, ('Qe', 'mean_square_detuning_FRT_ideal', 'QFRT'))
+        define(('Qe_opt_trace', 'Pg_min'), optimum, ('mean_square_detuning',))
+        define(('Qe_opt_FRT_trace', 'Pg_FRT_min'), optimum, ('mean_square_detuning_FRT', 'QFRT'))
+        define('Pg_avg', mean_generator_power, ('Qe', 'mean_square_detuning'))
+        define('Pg_FRT_avg', mean_generator_power, ('Qe', 'mean_square_detuning_FRT', 'QFRT'))
+
+    def _detuning_blocks(self, block_size=2**16):
+        """Iterate over one cycle of the raw detuning trace in blocks."""
+        if self.detuning_trace is not None:
+            for start in range(0, len(self.detuning_trace), block_size):
+                yield self.detuning_trace[start:start + block_size]
+            return
+        source = open_trace_source(self.csv_file, block_size=block_size, loop=False)
+        try:
+            for _, detuning in source:
+                yield detuning
+        finally:
+            source.close()
+
+    def _tuner_mean_square_detuning(self, uphonics_range, tuning_range):
+        """Mean square of the residual detuning left by the tuner model over a cycle of the trace, in steady state."""
+        tuner = TunerModel(self.sample_rate, **self.tuner_spec)
+        for _ in range(TUNER_CYCLES):
+            count, total_square = 0, 0.0
+            for detuning in self._detuning_blocks():
+                residual = tuner.apply(scale_detuning(detuning, uphonics_range), tuning_range)
+                count += len(residual)
+                total_square += np.dot(residual, residual)
+        return total_square / count if count else 0.0
+
+    def _plotting_colour(self, *_):
+        """Move to the next plotting colour when the controls change, at most every 0.2 seconds."""
         current_time = time.time()
         if current_time - self.last_update_time > 0.2:  # Check if 0.2 seconds have passed
-            self.calculated_variables['Plotting_Colour'] = self._get_next_color()
             self.last_update_time = current_time
-        #update the calculated variables
-        self.calculated_variables['Qe_opt'] = w0/self._cached_input_variables['uphonics_range']
-        self.calculated_variables['QFRT'] = self._cached_input_variables['FoM']*f0/self._cached_input_variables['tuning_range']
-        self.calculated_variables['Qe_opt_FRT'] = 1 / (1 / Q0 + 1 / self.calculated_variables['QFRT'])
-        self.calculated_variables['QL'] = 1 / (1 / self._cached_input_variables['Qe'] + 1 / Q0)
-        self.calculated_variables['QL_FRT'] = 1 / (1 / self._cached_input_variables['Qe'] + 1 / Q0 + 1 / self.calculated_variables['QFRT'])
+            return self._get_next_color()
+        return self.calculated_variables.get('Plotting_Colour', PLOTTING_COLOURS[0])
+
+    def _get_next_color(self):
+        """Generate the next color from a color wheel."""
+        color = PLOTTING_COLOURS[self.color_index % len(PLOTTING_COLOURS)]
+        self.color_index += 1
+        return color
 
-        # Notify other components that calculated variables have changed
-        asyncio.create_task(self.event_system.trigger_event("calculated variables changed", self.calculated_variables))
+    def _apply_changes(self, diff):
+        """Copy changed values into the kernel attributes and tell the listeners which calculated variables changed."""
+        for name, value in diff.items():
+            if name in KERNEL_ATTRIBUTES:
+                setattr(self, name, value)
+        calculated = {name: value for name, value in diff.items() if name not in self.parameters.inputs}
+        if calculated:
+            # Coalesced, so listeners that need every change subscribe to the parameter store instead
+            self.event_system.publish("calculated variables changed", calculated)
 
-        # Mark the cache as valid
-        self._cache_valid = True
+    def refresh_inputs(self):
+        """Pick up input variables changed in place and recompute what depends on them."""
+        return self.parameters.refresh()
 
     async def _listen_for_input_changes(self):
-        """Listen for changes in input variables and invalidate the cache."""
+        """Listen for changes in input variables and recompute the affected calculated variables."""
         while True:
             # Wait for a change in input variables
             await self.input_variable_queue.get()
-            # Invalidate the cache when a change is detected
-            self._invalidate_cache()
-    
-    @property
-    def uphonics_range(self):
-        """Dynamically retrieve the value of uphonics_range from variables."""
-        return self._get_cached_input_variables('uphonics_range')
-    
-    @property
-    def Qe(self):
-        """Dynamically retrieve the value of Qe from variables."""
-        return self._get_cached_input_variables('Qe')
-    
-    @property
-    def tuning_range(self):
-        """Dynamically retrieve the value of tuning_range from variables."""
-        return self._get_cached_input_variables('tuning_range')
-    
-    
-    @property
-    def FRT_On(self):
-        """Dynamically retrieve the value of FRT_On from variables."""
-        return self._get_cached_input_variables('FRT_On')
-    
-    @property
-    def FoM(self):
-        """Dynamically retrieve the value of FoM from variables."""
-        return self._get_cached_input_variables('FoM')
-    
-    @property
-    def QL(self):
-        """Calculate QL based on the current variables."""
-        return self.calculated_variables['QL']
-
-    @property
-    def QL_FRT(self):
-        """Calculate QL_FRT based on the current variables."""
-        return self.calculated_variables['QL_FRT']
-    
-    def _get_state(self):
-        """Return the current state of the midi controls except FRT_On."""
-        state = (self.uphonics_range, self.Qe, self.tuning_range, self.FoM)
-        return state
+            try:
+                self.refresh_inputs()
+            except Exception:
+                # A bad combination of inputs must not stop the kernel from following the next one
+                logger.exception("Updating the calculated variables failed.")
 
-    def _detuning_time_generator(self):
-        """Generator to yield detuning and time pairs from the CSV file."""
+    def _detuning_time_generator(self, chunk_size=4096):
+        """Generator to yield detuning and time pairs from the trace source, looping forever."""
+        buffer = self._sample_buffer
         while True:
-            with open(self.csv_file, "r") as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    detuning = float(row["Detuning [Hz]"])
-                    time = float(row["time"])
-                    yield (time,detuning)
+            if not buffer:
+                # Convert a chunk at a time so long traces are never copied whole
+                times, detunings = self.trace_source.read(chunk_size)
+                buffer.extend(zip(times.tolist(), detunings.tolist()))
+            yield buffer.popleft()
+
+    def _read_block(self, block_size):
+        """Read the next block of time and detuning samples, starting with any the scalar path fetched ahead."""
+        buffer = self._sample_buffer
+        if not buffer:
+            return self.trace_source.read(block_size)
+        count = min(block_size, len(buffer))
+        times, detunings = np.array([buffer.popleft() for _ in range(count)]).T
+        if count < block_size:
+            rest_times, rest_detunings = self.trace_source.read(block_size - count)
+            times, detunings = np.concatenate((times, rest_times)), np.concatenate((detunings, rest_detunings))
+        return times, detunings
+
+    def _sample_period(self):
+        """Time between two samples of the trace."""
+        if self.time_trace is not None:
+            return self.time_trace[1] - self.time_trace[0]
+        source = open_trace_source(self.csv_file, block_size=2, loop=False)
+        try:
+            time_trace, _ = source.read(2)
+        finally:
+            source.close()
+        return time_trace[1] - time_trace[0]
+
+    def _load_detuning_trace(self):
+        """Load the whole detuning trace from the CSV or binary trace file into NumPy arrays."""
+        return load_detuning_trace(self.csv_file)
 
     def IgeiPhi(self, detuning, detuning_FRT):
         """Calculate IgeiPhi based on the current variables."""
-        real_brack = Vc / (2 * RQ * self.QL)
-        real_brack_FRT = Vc / (2 * RQ * self.QL_FRT)
-        imag_brack = 1j * Vc * detuning / (w0 * RQ)
-        imag_brack_FRT = 1j * Vc * detuning_FRT / (w0 * RQ)
-        Ig = real_brack + imag_brack
-        Ig_FRT = real_brack_FRT + imag_brack_FRT
+        Ig = generator_current(detuning, self.QL)
+        Ig_FRT = generator_current(detuning_FRT, self.QL_FRT)
         return Ig, Ig_FRT
     
     def Pg(self,detuning,detuning_FRT):
         """Calculate Pg based on the current variables."""
         Ig, Ig_FRT = self.IgeiPhi(detuning,detuning_FRT)
-        Pg = self.Qe*RQ*np.abs(Ig)**2/2
-        Pg_FRT = self.Qe*RQ*np.abs(Ig_FRT)**2/2
+        Pg = generator_power(Ig, self.Qe)
+        Pg_FRT = generator_power(Ig_FRT, self.Qe)
         return Pg, Pg_FRT
 
     def DeltaOmega_t(self):
         """Get the next detuning and time pair from the generator."""
         t, detuning = next(self.detuning_time_generator)
         # Apply self.uphonics_range dynamically here
-        detuning = self.uphonics_range * (detuning + detuning_offset) / 2
-        if np.abs(detuning) > self.tuning_range/2:
+        detuning = scale_detuning(detuning, self.uphonics_range)
+        if self.tuner is not None:
+            # The tuner keeps its state from sample to sample, it runs each sample as a block of one
+            detuning_FRT = self.tuner.apply((detuning,), self.tuning_range)[0]
+        elif np.abs(detuning) > self.tuning_range/2:
             detuning_FRT = np.sign(detuning)*(np.abs(detuning)-self.tuning_range/2)
         else:
             detuning_FRT = 0
         
         return t, detuning, detuning_FRT
     
-    def AvergaePower(self,Pgen,Pgen_FRT):
-        """Calculate the avergae powers"""
-        # Initialize/reset state tracking and accumulators
-        if not hasattr(self, "_state") or not hasattr(self, "_pg_sum"):
-            self._state = self._get_state()
-            self._pg_sum = 0
-            self._pg_frt_sum = 0
-            self._count = 0
-            
-        # Check if any property has changed
-        current_state = self._get_state()
-        if current_state != self._state:
-            # Reset accumulators if state has changed
-            self._state = current_state
-            self._pg_sum = 0
-            self._pg_frt_sum = 0
-            self._count = 0
-
-        # Update accumulators
-        self._pg_sum += Pgen
-        self._pg_frt_sum += Pgen_FRT
-        self._count += 1
-
-        # Calculate averages
-        avg_pg = self._pg_sum / self._count
-        avg_pg_frt = self._pg_frt_sum / self._count
-
-        return avg_pg, avg_pg_frt
-    
+    def DeltaOmega_block(self, block_size):
+        """Get the next block of detuning and time samples as arrays, wrapping at the end of the trace."""
+        t, detuning = self._read_block(block_size)
+        # Apply self.uphonics_range dynamically here
+        detuning = scale_detuning(detuning, self.uphonics_range)
+        if self.tuner is None:
+            detuning_FRT = frt_detuning(detuning, self.tuning_range)
+        else:
+            detuning_FRT = self.tuner.apply(detuning, self.tuning_range)
+
+        return t, detuning, detuning_FRT
+
+    def AvergaePower(self):
+        """Return the exact full-cycle average powers for the current controls.
+
+        The averages are evaluated from the precomputed detuning index when the
+        controls change, so they are correct immediately instead of converging
+        over a pass of the trace.
+        """
+        return self.Pg_avg, self.Pg_FRT_avg
+
+    def AvergaePower_block(self, block_size):
+        """Return the full-cycle average powers repeated for a block of samples."""
+        return np.full(block_size, self.Pg_avg), np.full(block_size, self.Pg_FRT_avg)
+
     async def start_async(self, results_queue):
         # Placeholder for the main loop of the kernel
         while True:
             time, detuning, detuning_FRT = self.DeltaOmega_t()
             Pgen, Pgen_FRT = self.Pg(detuning, detuning_FRT)
-            Pg_Avg, Pg_FRT_Avg = self.AvergaePower(Pgen, Pgen_FRT)
+            Pg_Avg, Pg_FRT_Avg = self.AvergaePower()
             await results_queue.put({"Time": time,
                              "Detuning": detuning, "Pg": Pgen,
                              "Detuning FRT": detuning_FRT, "Pg FRT": Pgen_FRT,
                              "Pg Avg": Pg_Avg, "Pg FRT Avg": Pg_FRT_Avg,
                              })
             await asyncio.sleep(0)  # Simulate some processing delay
-            
\ No newline at end of file
+
+    def step_block(self, block_size):
+        """Advance the simulation by a block of samples and return one record of arrays."""
+        time, detuning, detuning_FRT = self.DeltaOmega_block(block_size)
+        Pgen, Pgen_FRT = self.Pg(detuning, detuning_FRT)
+        Pg_Avg, Pg_FRT_Avg = self.AvergaePower_block(len(detuning))
+        return {"Time": time,
+                "Detuning": detuning, "Pg": Pgen,
+                "Detuning FRT": detuning_FRT, "Pg FRT": Pgen_FRT,
+                "Pg Avg": Pg_Avg, "Pg FRT Avg": Pg_FRT_Avg,
+                }
+
+    async def start_block_async(self, results_queue, block_size=1130):
+        """Main loop of the kernel in block mode, putting one record of arrays per block."""
+        while True:
+            await results_queue.put(self.step_block(block_size))
+            await asyncio.sleep(0)
+
+    async def start_clocked_async(self, results_queue, clock):
+        """Main loop of the kernel paced by a SimulationClock, one record per batch of due samples."""
+        async for count in clock.ticks_async():
+            await results_queue.put(self.step_block(count))
@@ -0,0 +1,290 @@
+"""Run the kernel in a worker process and exchange data through shared memory.
+
+Result blocks travel from the kernel process to the display process through
+ResultsChannel, a ring of fixed-size slots in shared memory with one writer
+and one reader and no locks: the writer never waits, and every slot carries
+a sequence number so the reader can tell when a block was overwritten under
+it. Input variables travel the other way through SharedParameters, guarded by
+a version counter (a seqlock). Only the low-rate changes of the calculated
+variables use a multiprocessing queue, sent as diffs.
+
+In main.py:
+    kernel = KernelProcess(input_variables, calculated_variables, csv_file, event_system)
+    await asyncio.gather(kernel.start_async(queue), kernel._listen_for_input_changes(), ...)
+"""
+import asyncio
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from event_system import AsyncEventSystem, COALESCE
+from sim_clock import SimulationClock
+
+RESULT_COLUMNS = ("Time", "Detuning", "Pg", "Detuning FRT", "Pg FRT", "Pg Avg", "Pg FRT Avg")
+# The write counter sits in its own cache line ahead of the slots
+HEADER_SIZE = 64
+# Seconds a read of the shared parameters waits for a write in progress, after which the writer is taken to have
+# died in the middle of it
+READ_TIMEOUT = 1.0
+
+
+def _open_shared_memory(name, size):
+    """Create a new shared memory block if name is None, otherwise attach to an existing one."""
+    if name is None:
+        return shared_memory.SharedMemory(create=True, size=size)
+    try:
+        # The creating process owns the block; keep this process's resource tracker out of it
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track argument
+        return shared_memory.SharedMemory(name=name)
+
+
+class ResultsChannel:
+    """Single-producer, single-consumer ring of kernel result blocks in shared memory."""
+
+    def __init__(self, block_size=1130, capacity=8, name=None):
+        """
+        :param block_size: Maximum number of samples per block.
+        :param capacity: Number of blocks held; older unread blocks are overwritten.
+        :param name: Name of an existing channel to attach to, None to create one.
+        """
+        self.block_size = block_size
+        self.capacity = capacity
+        slot_dtype = np.dtype([('sequence', '<i8'), ('count', '<i8')]
+                              + [(column, '<f8', (block_size,)) for column in RESULT_COLUMNS])
+        self._owner = name is None
+        self.memory = _open_shared_memory(name, HEADER_SIZE + capacity * slot_dtype.itemsize)
+        self.name = self.memory.name
+        self._written = np.ndarray((1,), dtype=np.int64, buffer=self.memory.buf)
+        self._slots = np.ndarray((capacity,), dtype=slot_dtype, buffer=self.memory.buf, offset=HEADER_SIZE)
+        if self._owner:
+            self._written[0] = 0
+            self._slots['sequence'] = -1
+        self._read = 0
+        # Number of blocks overwritten before the reader got to them
+        self.dropped = 0
+
+    def write(self, record):
+        """Write one kernel record into the next slot, overwriting the oldest block. Never waits."""
+        index = int(self._written[0])
+        slot = index % self.capacity
+        count = len(record["Time"])
+        if count > self.block_size:
+            raise ValueError(f"Block of {count} samples does not fit in slots of {self.block_size}.")
+        # The slot is marked invalid while it is written, so a reader never accepts a torn block
+        self._slots['sequence'][slot] = -1
+        self._slots['count'][slot] = count
+        for column in RESULT_COLUMNS:
+            self._slots[column][slot, :count] = record[column]
+        self._slots['sequence'][slot] = index
+        self._written[0] = index + 1
+
+    def read(self):
+        """Copy out the blocks written since the last read, oldest first, skipping blocks already overwritten."""
+        written = int(self._written[0])
+        # The slot after the newest block may be being written right now
+        start = max(self._read, written - self.capacity + 1)
+        self.dropped += start - self._read
+        records = []
+        for index in range(start, written):
+            slot = index % self.capacity
+            if self._slots['sequence'][slot] != index:
+                self.dropped += 1
+                continue
+            count = int(self._slots['count'][slot])
+            record = {column: self._slots[column][slot, :count].copy() for column in RESULT_COLUMNS}
+            # Overwritten while copying
+            if self._slots['sequence'][slot] != index:
+                self.dropped += 1
+                continue
+            records.append(record)
+        self._read = written
+        return records
+
+    def close(self):
+        """Detach from the channel, and remove it if this process created it."""
+        # Views into the buffer must be gone before it can be closed
+        self._written = self._slots = None
+        self.memory.close()
+        if self._owner:
+            self.memory.unlink()
+
+
+class SharedParameters:
+    """Input variable values in shared memory, written by one process and read by another."""
+
+    def __init__(self, names, name=None):
+        """
+        :param names: Names of the input variables, in a fixed order.
+        :param name: Name of an existing block to attach to, None to create one.
+        """
+        self.names = list(names)
+        self._owner = name is None
+        self.memory = _open_shared_memory(name, 8 * (len(self.names) + 1))
+        self.name = self.memory.name
+        # The version is odd while the values are being written
+        self._version = np.ndarray((1,), dtype=np.int64, buffer=self.memory.buf)
+        self._values = np.ndarray((len(self.names),), dtype=np.float64, buffer=self.memory.buf, offset=8)
+        if self._owner:
+            self._version[0] = 0
+
+    def write(self, values):
+        """Write the values of all input variables from a dictionary of name to value."""
+        self._version[0] += 1
+        self._values[:] = [values[name] for name in self.names]
+        self._version[0] += 1
+
+    def read(self, last_version=None):
+        """
+        Read the values if they changed.
+        :param last_version: Version returned by the previous read, None to always read.
+        :return: The current version and a dictionary of name to value, or None if nothing changed.
+        :raises RuntimeError: If a write stays in progress for READ_TIMEOUT seconds.
+        """
+        deadline = None
+        while True:
+            version = int(self._version[0])
+            if version == last_version:
+                return version, None
+            if version % 2:
+                # A write is in progress, leave the writer the CPU to finish it
+                if deadline is None:
+                    deadline = time.monotonic() + READ_TIMEOUT
+                elif time.monotonic() > deadline:
+                    raise RuntimeError("The writer of the shared parameters stopped in the middle of a write.")
+                time.sleep(0)
+                continue
+            values = self._values.tolist()
+            if int(self._version[0]) == version:
+                return version, dict(zip(self.names, values))
+
+    def close(self):
+        """Detach from the block, and remove it if this process created it."""
+        self._version = self._values = None
+        self.memory.close()
+        if self._owner:
+            self.memory.unlink()
+
+
+def _kernel_worker(csv_file, input_variables, calculated_variables, block_size, capacity, speed, tuner, profile,
+                   results_name, parameters_name, calculated_queue, stop):
+    """Body of the kernel process: step the kernel, paced by a simulation clock, until stopped."""
+    from kernel import Kernel  # Only needed in the worker
+    results = ResultsChannel(block_size, capacity, name=results_name)
+    parameters = SharedParameters(input_variables, name=parameters_name)
+    # Never block exit on calculated variables the display process did not collect
+    calculated_queue.cancel_join_thread()
+    event_system = AsyncEventSystem()
+    event_system.register_event("input variables changed", policy=COALESCE)
+    event_system.register_event("calculated variables changed", policy=COALESCE)
+    kernel = Kernel(input_variables, calculated_variables, csv_file, event_system, tuner=tuner)
+    profiler = None
+    if profile:
+        from profiling import StageProfiler, instrument_kernel  # Only needed when profiling
+        profiler = StageProfiler("kernel process", interval=profile)
+        instrument_kernel(profiler, kernel)
+        profiler.instrument(results, {"write": "channel write"})
+    # Everything is sent once, then only what changed
+    pending = dict(calculated_variables)
+    kernel.parameters.subscribe(lambda diff: pending.update(
+        (name, value) for name, value in diff.items() if name in calculated_variables))
+    version = None
+    clock = SimulationClock(kernel.sample_rate, speed, block_size=block_size)
+    try:
+        for count in clock.ticks():
+            if stop.is_set():
+                break
+            version, values = parameters.read(version)
+            if values is not None:
+                kernel.parameters.set(values)
+            results.write(kernel.step_block(count))
+            if pending:
+                calculated_queue.put(pending.copy())
+                pending.clear()
+            if profiler is not None:
+                profiler.log_if_due()
+    finally:
+        results.close()
+        parameters.close()
+
+
+class KernelProcess:
+    """Stand-in for Kernel in the display process that runs the real kernel in a worker process."""
+
+    def __init__(self, input_variables, calculated_variables, csv_file, event_system, block_size=1130, capacity=8,
+                 speed=None, tuner=None, profile=None):
+        """
+        :param csv_file: The detuning trace, a CSV or binary trace file, or a microphonics spec.
+        :param block_size: Maximum number of samples per block.
+        :param capacity: Number of blocks buffered in shared memory.
+        :param speed: Simulated seconds per wall second, None to run the kernel as fast as possible.
+        :param tuner: Keyword arguments of a TunerModel for the FRT, None for the ideal FRT.
+        :param profile: Seconds between summaries of the kernel stage timings the kernel process writes to stderr,
+            None for no profiling.
+        """
+        self.input_variables = input_variables
+        self.calculated_variables = calculated_variables
+        self.event_system = event_system
+        self.input_variable_queue = event_system.add_listener("input variables changed")
+        self.results = ResultsChannel(block_size, capacity)
+        self.parameters = SharedParameters(input_variables)
+        self.parameters.write(self._input_values())
+        context = multiprocessing.get_context()
+        self._calculated_queue = context.Queue()
+        self._stop = context.Event()
+        self.process = context.Process(
+            target=_kernel_worker, name="uphonics kernel", daemon=True,
+            args=(csv_file, input_variables, calculated_variables, block_size, capacity, speed, tuner, profile,
+                  self.results.name, self.parameters.name, self._calculated_queue, self._stop))
+        self.process.start()
+
+    def _input_values(self):
+        """Current value of every input variable."""
+        return {name: variable['value'] for name, variable in self.input_variables.items()}
+
+    async def _listen_for_input_changes(self):
+        """Forward changes in input variables to the kernel process."""
+        while True:
+            await self.input_variable_queue.get()
+            self.parameters.write(self._input_values())
+
+    def _receive_calculated_variables(self):
+        """Apply the changes of the calculated variables that arrived from the kernel process, in order."""
+        diff = {}
+        while True:
+            try:
+                diff.update(self._calculated_queue.get_nowait())
+            except queue.Empty:
+                break
+        if diff:
+            self.calculated_variables.update(diff)
+            self.event_system.publish("calculated variables changed", diff)
+
+    async def start_async(self, results_queue, poll_interval=1/120):
+        """
+        Move the newest result blocks from shared memory into the results queue.
+        :param poll_interval: Seconds between two looks at the channel.
+        """
+        try:
+            while True:
+                if not self.process.is_alive():
+                    raise RuntimeError(f"The kernel process exited with code {self.process.exitcode}.")
+                for record in self.results.read():
+                    await results_queue.put(record)
+                self._receive_calculated_variables()
+                await asyncio.sleep(poll_interval)
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the kernel process and release the shared memory."""
+        if self.results is None:
+            return
+        self._stop.set()
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.results.close()
+        self.parameters.close()
+        self.results = self.parameters = None
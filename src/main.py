@@ -1,14 +1,19 @@
-from display import Display
+from display import DISPLAY_MODES, Display
 from midi_driver import MidiDriver
+from input_source import ControlRecorder, ControlReplayer
+from results_recorder import ResultsRecorder
 from kernel import Kernel
-from event_system import AsyncEventSystem
+from kernel_process import KernelProcess
+from tuner_model import load_tuner_spec
+from sim_clock import SimulationClock
+from event_system import AsyncEventSystem, COALESCE
+from profiling import StageProfiler, instrument_display, instrument_input_source, instrument_kernel, \
+    profile_window_async
 import os
 import asyncio
 
 async def main():
     print("Welcome to the microphonics FE-FRT simulator!")
-    # Create the shared asyncio.Queue
-    queue = asyncio.Queue(maxsize = 100)
     
     # Define default ranges for variables
     variable_ranges = {
@@ -33,29 +38,102 @@ async def main():
         'Qe_opt_FRT': {'value': 0},
         'QL': {'value': 0},
         'QL_FRT': {'value': 0},
+        'Qe_opt_trace': 10**9,
+        'Qe_opt_FRT_trace': 10**9,
+        'Pg_min': 0,
+        'Pg_FRT_min': 0,
+        'Pg_avg': 0,
+        'Pg_FRT_avg': 0,
     }
     
-    # Create the event system
-    event_system = AsyncEventSystem()
-    # Register events
-    event_system.register_event("input variables changed")
-    event_system.register_event("calculated variables changed")
+    # Create the event system, with metrics logged to stderr if UPHONICS_METRICS is set
+    metrics = bool(os.environ.get("UPHONICS_METRICS"))
+    event_system = AsyncEventSystem(metrics=metrics)
+    # Create the shared asyncio.Queue between the kernel and the display
+    queue = event_system.create_queue("results", maxsize = 100)
+    # Register events, listeners only need to know that something changed since their last look
+    event_system.register_event("input variables changed", policy=COALESCE)
+    event_system.register_event("calculated variables changed", policy=COALESCE)
     
     
-    # Path to the CSV file
-    csv_file = os.path.join("..", "data", "detuning.csv")
+    # Path to the CSV file, or UPHONICS_TRACE for another trace file or a microphonics spec
+    csv_file = os.environ.get("UPHONICS_TRACE", os.path.join("..", "data", "detuning.csv"))
 
-    # Initialize display and MIDI driver
-    display = Display(input_variables,calculated_variables,event_system)
-    midi_driver = MidiDriver(input_variables, event_system)
-    kernel = Kernel(input_variables, calculated_variables, csv_file, event_system)
+    # Run the kernel in block mode, paced through the trace at UPHONICS_SPEED times real time
+    # ("max" to run as fast as possible), with at most block_size samples per record
+    block_mode = True
+    block_size = 1130
+    speed = os.environ.get("UPHONICS_SPEED", "1")
+    speed = None if speed == "max" else float(speed)
+    # Model the FRT with the delay, response and slew limit of UPHONICS_TUNER, a JSON file of
+    # TunerModel arguments, instead of the ideal instantaneous tuner
+    tuner_path = os.environ.get("UPHONICS_TUNER")
+    tuner = load_tuner_spec(tuner_path) if tuner_path else None
+    # Plot every sample, or with UPHONICS_DISPLAY=density bin the Pg vs detuning history instead
+    display_mode = os.environ.get("UPHONICS_DISPLAY", "scatter")
+    if display_mode not in DISPLAY_MODES:
+        raise ValueError(f"Unknown UPHONICS_DISPLAY '{display_mode}', use one of {', '.join(DISPLAY_MODES)}.")
+    # Run the kernel in its own process if UPHONICS_KERNEL_PROCESS is set, so the GUI cannot stall it
+    kernel_process = bool(os.environ.get("UPHONICS_KERNEL_PROCESS"))
+    # Replay a recorded session instead of the MIDI controller, at UPHONICS_REPLAY_SPEED times real time
+    # ("max" for as fast as possible), and record the session to UPHONICS_RECORD
+    replay_path = os.environ.get("UPHONICS_REPLAY")
+    replay_speed = os.environ.get("UPHONICS_REPLAY_SPEED", "1")
+    record_path = os.environ.get("UPHONICS_RECORD")
+    # Record every kernel result and input change into the directory UPHONICS_RECORD_RESULTS
+    results_path = os.environ.get("UPHONICS_RECORD_RESULTS")
+    # Time every stage of the simulation loop if UPHONICS_PROFILE is set, with a summary logged to stderr every
+    # 5 seconds, and profile the whole program into UPHONICS_PROFILE_OUTPUT (cProfile for a .prof file, sampled
+    # folded stacks otherwise) from UPHONICS_PROFILE_START seconds into the session for UPHONICS_PROFILE_DURATION
+    profile = bool(os.environ.get("UPHONICS_PROFILE"))
+    profile_output = os.environ.get("UPHONICS_PROFILE_OUTPUT")
+    profile_start = float(os.environ.get("UPHONICS_PROFILE_START", "5"))
+    profile_duration = float(os.environ.get("UPHONICS_PROFILE_DURATION", "10"))
 
-    # Run MIDI driver and display concurrently
+    # Initialize display, input source and kernel
+    display = Display(input_variables,calculated_variables,event_system, mode=display_mode)
+    if replay_path:
+        input_source = ControlReplayer(input_variables, event_system, replay_path,
+                                       speed=None if replay_speed == "max" else float(replay_speed))
+    else:
+        input_source = MidiDriver(input_variables, event_system)
+    if kernel_process:
+        kernel = KernelProcess(input_variables, calculated_variables, csv_file, event_system, block_size, speed=speed,
+                               tuner=tuner, profile=5.0 if profile else None)
+        kernel_loop = kernel.start_async(queue)
+        clock = None
+    else:
+        kernel = Kernel(input_variables, calculated_variables, csv_file, event_system, tuner=tuner)
+        clock = SimulationClock(kernel.sample_rate, speed, block_size=block_size)
+        kernel_loop = kernel.start_clocked_async(queue, clock) if block_mode else kernel.start_async(queue)
+
+    # Run input source, kernel and display concurrently
+    tasks = [event_system.log_metrics_async()] if metrics else []
+    if metrics and clock is not None and block_mode:
+        tasks.append(clock.log_report_async())
+    if profile:
+        profiler = StageProfiler()
+        if not kernel_process:
+            instrument_kernel(profiler, kernel)
+        instrument_display(profiler, display)
+        instrument_input_source(profiler, input_source)
+        queue.put = profiler.timed_async(queue.put, "queue put")
+        tasks.append(profiler.log_summary_async())
+    if profile_output:
+        tasks.append(profile_window_async(profile_output, profile_start, profile_duration))
+    if record_path:
+        tasks.append(ControlRecorder(input_variables, event_system, record_path).start_async())
+    display_queue = queue
+    if results_path:
+        # The recorder passes the records on to the display through a queue of its own
+        display_queue = event_system.create_queue("display", maxsize=100)
+        tasks.append(ResultsRecorder(input_variables, event_system, results_path).start_async(queue, display_queue))
     try:
         await asyncio.gather(
-            midi_driver.start_async(),
-            display.start_async(queue),
-            kernel.start_async(queue),
+            *tasks,
+            input_source.start_async(),
+            display.start_async(display_queue),
+            kernel_loop,
             kernel._listen_for_input_changes(),  # Listen for changes in input variables
             display._listen_for_input_changes(),  # Listen for changes in input variables
             display._listen_for_calculated_changes(),  # Listen for changes in calculated variables
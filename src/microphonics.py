@@ -0,0 +1,277 @@
+"""Synthetic microphonics: detuning traces of any length generated from a spec.
+
+The detuning is the sum of
+- mechanical modes, each a narrowband Gaussian process around its frequency
+  with the Lorentzian line width of its Q,
+- broadband noise, white or low-pass filtered,
+- the drift from helium pressure fluctuations, with a correlation time,
+- the Lorentz force detuning from jitter of the accelerating gradient,
+plus a constant offset. Every term is stationary from the first sample.
+
+Modes and drifts are generated as envelopes sampled a power of two samples
+apart, then interpolated and mixed up to their frequency for a whole chunk
+with one small matrix product; broadband noise runs through the vectorized
+filter in iir.py. Every term draws from its own random stream spawned from the
+seed, so a trace depends only on the spec and the seed, not on the block sizes
+it is read in.
+
+The spec is a JSON file, amplitudes in the units of the trace (the bundled
+traces are normalized, the kernel scales them by uphonics_range / 2):
+    {"sample_rate": 10537.0, "duration": 60.0, "seed": 0, "offset": 0.0,
+     "modes": [{"frequency": 56.0, "Q": 100.0, "rms": 0.28}],
+     "noise": {"rms": 0.03, "bandwidth": 1000.0},
+     "helium_pressure": {"sensitivity": 0.02, "rms": 1.0, "time_constant": 20.0},
+     "lorentz_force": {"coefficient": -0.004, "gradient": 16.0, "jitter": 0.001, "bandwidth": 5.0}}
+
+A spec with a duration can be used wherever a trace file can. Write an hour
+long trace, from the src directory:
+    python microphonics.py ../data/microphonics.json ../data/microphonics.uph --duration 3600
+"""
+import argparse
+import json
+import time
+import numpy as np
+from iir import first_order_iir
+from trace_format import TraceWriter
+from trace_source import TraceSource
+
+# Sample rate of detuning.csv
+DEFAULT_SAMPLE_RATE = 10537.0
+# Samples generated at a time, a power of two so every knot spacing divides it
+CHUNK = 65536
+# Largest spacing of the envelope knots, and the most the envelope may decorrelate from one knot to the next
+MAX_KNOT_SPACING = 4096
+MAX_KNOT_DECAY = 0.05
+
+
+def load_spec(path):
+    """Load a microphonics spec from a JSON file."""
+    with open(path) as file:
+        return json.load(file)
+
+
+class NarrowbandProcess:
+    """Stationary Gaussian process, rms * Re(envelope[n] * exp(1j*phase_step*n)).
+
+    The envelope is a complex Ornstein-Uhlenbeck process, which gives a
+    Lorentzian spectrum of half width decay*sample_rate/(2 pi) around the
+    carrier. With phase_step 0 it is a real low-pass process. Between knots
+    the envelope is interpolated linearly, which cuts the Lorentzian tails
+    beyond about half the knot rate from the carrier.
+    """
+
+    def __init__(self, decay, phase_step, rng, rms=1.0):
+        """
+        :param decay: Decay of the envelope correlation per sample.
+        :param phase_step: Carrier phase per sample, 2 pi frequency / sample_rate.
+        :param rng: A random generator used by this process alone.
+        :param rms: Standard deviation of the samples.
+        """
+        self.phase_step = phase_step
+        self.rng = rng
+        # The widest power of two knot spacing over which the envelope barely changes
+        spacing = 1
+        while spacing < MAX_KNOT_SPACING and 2 * spacing * decay <= MAX_KNOT_DECAY:
+            spacing *= 2
+        self.spacing = spacing
+        self.pole = np.exp(-decay * spacing)
+        self.knot = self._draw(1)[0]
+        self.knot_index = 0
+        # Carrier and carrier times the interpolation weight over one knot interval, scaled so that
+        # the variance of the interpolated envelope stays rms**2 between the knots
+        weight = np.arange(spacing) / spacing
+        carrier = rms * np.exp(1j * phase_step * np.arange(spacing))
+        carrier /= np.sqrt((1 - weight)**2 + weight**2 + 2 * weight * (1 - weight) * self.pole)
+        self._mixer = np.stack([carrier.real, carrier.imag, carrier.real * weight, carrier.imag * weight])
+
+    def _draw(self, count):
+        """Samples of the stationary envelope distribution, real and imaginary parts of unit variance."""
+        if self.phase_step == 0:
+            return self.rng.standard_normal(count)
+        values = self.rng.standard_normal((count, 2))
+        return values[:, 0] + 1j * values[:, 1]
+
+    def generate(self, count):
+        """The next count samples, a multiple of the knot spacing."""
+        intervals = count // self.spacing
+        new_knots, _ = first_order_iir(np.sqrt(1 - self.pole**2) * self._draw(intervals), self.pole, self.knot)
+        knots = np.concatenate(([self.knot], new_knots))
+        # Envelope at the start of every interval and its change over it, rotated to the carrier phase there
+        phase = np.exp(1j * self.phase_step * self.spacing * np.arange(self.knot_index, self.knot_index + intervals))
+        start = knots[:-1] * phase
+        change = np.diff(knots) * phase
+        self.knot = knots[-1]
+        self.knot_index += intervals
+        weights = np.column_stack((start.real, -start.imag, change.real, -change.imag))
+        return (weights @ self._mixer).ravel()
+
+
+class LowPassNoise:
+    """Gaussian noise, white or through a first-order low-pass filter, stationary from the start."""
+
+    def __init__(self, bandwidth, sample_rate, rng, rms=1.0):
+        """
+        :param bandwidth: Cutoff frequency of the filter, None for white noise.
+        :param rms: Standard deviation of the samples.
+        """
+        self.rng = rng
+        self.rms = rms
+        self.pole = 0.0 if bandwidth is None else np.exp(-2 * np.pi * bandwidth / sample_rate)
+        self.state = rms * rng.standard_normal()
+
+    def generate(self, count):
+        """The next count samples."""
+        noise = self.rng.standard_normal(count)
+        noise *= self.rms * np.sqrt(1 - self.pole**2)
+        if self.pole == 0:
+            return noise
+        samples, self.state = first_order_iir(noise, self.pole, self.state)
+        return samples
+
+
+class MicrophonicsGenerator:
+    """Generate the detuning trace of a spec chunk by chunk, each continuing where the last one ended."""
+
+    def __init__(self, spec, seed=None):
+        """
+        :param spec: The microphonics spec, a dictionary as described in the module docstring.
+        :param seed: Seed of the random streams, the spec's seed (or 0) by default.
+        """
+        self.spec = spec
+        self.sample_rate = float(spec.get("sample_rate", DEFAULT_SAMPLE_RATE))
+        self.seed = spec.get("seed", 0) if seed is None else seed
+        self.reset()
+
+    def reset(self):
+        """Start the trace again from its first sample."""
+        spec = self.spec
+        sample_rate = self.sample_rate
+        modes = spec.get("modes", [])
+        rngs = iter([np.random.default_rng(seed) for seed in np.random.SeedSequence(self.seed).spawn(len(modes) + 3)])
+        # Terms as (process, function of its samples to detuning, None if they are detuning already)
+        self._terms = []
+        for mode in modes:
+            frequency = mode["frequency"]
+            process = NarrowbandProcess(np.pi * frequency / (mode["Q"] * sample_rate),
+                                        2 * np.pi * frequency / sample_rate, next(rngs), mode["rms"])
+            self._terms.append((process, None))
+        noise_rng, pressure_rng, lorentz_rng = next(rngs), next(rngs), next(rngs)
+        if "noise" in spec:
+            noise = spec["noise"]
+            self._terms.append((LowPassNoise(noise.get("bandwidth"), sample_rate, noise_rng, noise["rms"]), None))
+        if "helium_pressure" in spec:
+            pressure = spec["helium_pressure"]
+            process = NarrowbandProcess(1 / (pressure["time_constant"] * sample_rate), 0.0, pressure_rng,
+                                        pressure["sensitivity"] * pressure["rms"])
+            self._terms.append((process, None))
+        if "lorentz_force" in spec:
+            lorentz = spec["lorentz_force"]
+            process = NarrowbandProcess(2 * np.pi * lorentz["bandwidth"] / sample_rate, 0.0, lorentz_rng,
+                                        lorentz["jitter"])
+            static = lorentz["coefficient"] * lorentz["gradient"]**2
+            # The tuner holds the static Lorentz detuning, only its change with the gradient jitter is left
+            self._terms.append((process, lambda jitter: static * jitter * (2 + jitter)))
+        self.position = 0
+        self._pending = np.empty(0)
+
+    def _generate_chunk(self):
+        """Generate the next CHUNK samples of detuning."""
+        detuning = np.full(CHUNK, float(self.spec.get("offset", 0.0)))
+        for process, to_detuning in self._terms:
+            samples = process.generate(CHUNK)
+            detuning += samples if to_detuning is None else to_detuning(samples)
+        return detuning
+
+    def generate(self, count):
+        """
+        Generate the next count samples.
+        :return: The time and detuning arrays.
+        """
+        chunks = [self._pending]
+        available = len(self._pending)
+        while available < count:
+            chunks.append(self._generate_chunk())
+            available += CHUNK
+        detuning = np.concatenate(chunks) if len(chunks) > 1 else self._pending
+        self._pending = detuning[count:]
+        time = (self.position + np.arange(count)) / self.sample_rate
+        self.position += count
+        return time, detuning[:count]
+
+    def blocks(self, block_size=CHUNK, duration=None):
+        """
+        Yield (time, detuning) blocks of block_size samples.
+        :param duration: Seconds of trace to generate, None for no end; the last block may be shorter.
+        """
+        remaining = None if duration is None else int(round(duration * self.sample_rate))
+        while remaining is None or remaining > 0:
+            count = block_size if remaining is None else min(block_size, remaining)
+            yield self.generate(count)
+            if remaining is not None:
+                remaining -= count
+
+
+class MicrophonicsTraceSource(TraceSource):
+    """A trace source generating a microphonics spec on the fly; every pass over it is the same trace."""
+
+    def __init__(self, spec, block_size=65536, loop=True, duration=None, seed=None):
+        """
+        :param spec: The microphonics spec.
+        :param duration: Seconds per pass, the spec's duration by default; None for a trace that never ends.
+        :param seed: Seed of the random streams, the spec's seed by default.
+        """
+        super().__init__(block_size, loop)
+        self.spec = spec
+        self.duration = spec.get("duration") if duration is None else duration
+        self.seed = seed
+
+    def _iter_chunks(self):
+        return MicrophonicsGenerator(self.spec, self.seed).blocks(CHUNK, self.duration)
+
+
+def generate_trace(spec, duration=None, seed=None):
+    """
+    Generate a whole trace in memory.
+    :param duration: Seconds to generate, the spec's duration by default.
+    :return: The time and detuning arrays.
+    """
+    duration = spec.get("duration") if duration is None else duration
+    if duration is None:
+        raise ValueError("The microphonics spec needs a duration to be generated as a whole trace.")
+    generator = MicrophonicsGenerator(spec, seed)
+    return generator.generate(int(round(duration * generator.sample_rate)))
+
+
+def write_trace_file(spec, path, duration=None, seed=None, dtype=np.float64, block_size=2**20):
+    """
+    Generate a trace into a binary trace file, one block at a time.
+    :param duration: Seconds to generate, the spec's duration by default.
+    :param dtype: np.float64 or np.float32 for the stored values.
+    :return: The number of samples written.
+    """
+    duration = spec.get("duration") if duration is None else duration
+    if duration is None:
+        raise ValueError("The microphonics spec needs a duration to be written to a file.")
+    with TraceWriter(path, dtype) as writer:
+        for time, detuning in MicrophonicsGenerator(spec, seed).blocks(block_size, duration):
+            writer.write(time, detuning)
+        return writer.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic microphonics trace from a spec.")
+    parser.add_argument("spec", help="Microphonics spec, a JSON file.")
+    parser.add_argument("trace_path", help="Binary trace file to write.")
+    parser.add_argument("--duration", type=float, help="Seconds to generate, the spec's duration by default.")
+    parser.add_argument("--seed", type=int, help="Seed of the random streams, the spec's seed by default.")
+    parser.add_argument("--float32", action="store_true", help="Store values as float32 instead of float64.")
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    count = write_trace_file(load_spec(args.spec), args.trace_path, args.duration, args.seed,
+                             np.float32 if args.float32 else np.float64)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {count} samples to {args.trace_path} in {elapsed:.3f} s ({count / max(elapsed, 1e-9):.4g} samples/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,117 @@
 import os
 os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
-import pygame.midi
 import asyncio
-from event_system import AsyncEventSystem
+import logging
+import threading
+from input_source import InputSource
 
-class MidiDriver:
-    def __init__(self, input_variables, event_system):
-        self.event_system = event_system
-        self.input_variables = input_variables
+logger = logging.getLogger(__name__)
+# Status byte of Control Change messages, the low nibble is the channel
+CONTROL_CHANGE = 0xB0
+
+
+class PygameMidiInput:
+    """The default MIDI input device through pygame.midi, read on a dedicated thread."""
+
+    def __init__(self, poll_interval=0.001):
+        """
+        :param poll_interval: Seconds between polls of an idle device. PortMidi has no blocking read.
+        """
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._input = None
+
+    def start(self, callback):
+        """Open the device and call callback(status, cc, value) from the reader thread for every message."""
+        import pygame.midi  # Deferred so the driver can run on other inputs without pygame
+        pygame.midi.init()
+        input_id = pygame.midi.get_default_input_id()
+        if input_id == -1:
+            pygame.midi.quit()
+            raise OSError("No MIDI input devices found.")
+        self._input = pygame.midi.Input(input_id)
+        self._thread = threading.Thread(target=self._read_loop, args=(callback,), name="midi reader", daemon=True)
+        self._thread.start()
+
+    def _read_loop(self, callback):
+        while not self._stop.is_set():
+            # Drain the whole backlog before sleeping again
+            while self._input.poll():
+                for event in self._input.read(1024):
+                    status, cc, value = event[0][:3]
+                    callback(status, cc, value)
+            self._stop.wait(self.poll_interval)
+
+    def close(self):
+        """Stop the reader thread and close the device."""
+        import pygame.midi
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._input is not None:
+            self._input.close()
+        pygame.midi.quit()
+
+
+class MidoMidiInput:
+    """A MIDI input port through mido, whose backend calls back from its own thread for every message."""
+
+    def __init__(self, port_name=None):
+        """
+        :param port_name: Name of the input port, the backend's default port if None.
+        """
+        self.port_name = port_name
+        self._port = None
+
+    def start(self, callback):
+        """Open the port and call callback(status, cc, value) for every message."""
+        import mido
+
+        def receive(message):
+            data = message.bytes() + [0, 0]  # Pad messages with fewer than two data bytes
+            callback(*data[:3])
+
+        self._port = mido.open_input(self.port_name, callback=receive)
+
+    def close(self):
+        """Close the port."""
+        if self._port is not None:
+            self._port.close()
+
+
+class MockMidiInput:
+    """Local stand-in for a MIDI device, so the driver can run and be tested without hardware."""
+
+    def __init__(self):
+        self._callback = None
+
+    def start(self, callback):
+        """Deliver messages passed to send() to callback(status, cc, value)."""
+        self._callback = callback
+
+    def send(self, status, cc, value):
+        """Deliver one message as the device would, from the calling thread."""
+        self._callback(status, cc, value)
+
+    def close(self):
+        self._callback = None
+
+
+class MidiDriver(InputSource):
+    def __init__(self, input_variables, event_system, midi_input=None):
+        """
+        :param midi_input: Source of MIDI messages with start(callback) and close(), the default pygame device if None.
+        """
+        super().__init__(input_variables, event_system)
+        self.midi_input = PygameMidiInput() if midi_input is None else midi_input
+        # Messages received since the loop last looked, in order, with repeated moves of a controller merged
+        self._pending = []
+        # Position in _pending of the last message of every controller that moved since the last note event
+        self._pending_controllers = {}
+        self._pending_lock = threading.Lock()
+        self._drain_scheduled = False
+        self._loop = None
         self.midi_mappings = {
             36: "FoM",  # Slider 1 -> FoM
             37: "uphonics_range",  # Slider 2 -> uphonics_range
@@ -22,6 +126,7 @@ class MidiDriver:
         :param status: The MIDI status byte (e.g., 176 for CC, 144 for Note On).
         :param cc: The MIDI CC number or Note number.
         :param value: The MIDI CC value (0-127) or Note velocity.
+        :return: True if an input variable changed.
         """
         if status == 176:  # Control Change message
             if cc in self.midi_mappings:
@@ -36,7 +141,8 @@ class MidiDriver:
                 # Check if the value has changed
                 if self.input_variables[variable]['value'] != new_value:
                     self.input_variables[variable]['value'] = new_value
-                    print(f"Updated {variable}: {new_value}")
+                    logger.debug("Updated %s: %s", variable, new_value)
+                    return True
                                                           
         elif status == 144:  # Note On message
             # Handle FRT On/Off switch
@@ -45,59 +151,55 @@ class MidiDriver:
                 variable = self.midi_mappings[cc]
                 if self.input_variables[variable]['value'] != value:
                     self.input_variables[variable]['value'] = value
-                    print(f"Updated {variable}: {value}")
+                    logger.debug("Updated %s: %s", variable, value)
+                    return True
+        return False
                     
 
-    async def start_async(self):
-        """Asynchronous MIDI event listener."""
-        # Initialize Pygame MIDI
-        pygame.midi.init()
-        input_id = pygame.midi.get_default_input_id()
-        if input_id == -1:
-            print("No MIDI input devices found.")
-            return
+    def _receive(self, status, cc, value):
+        """
+        Called on the reader thread for every message; wakes the event loop once per batch.
+        A controller that moves again only updates its pending value, while note events are all kept, so repeated
+        taps are not lost; merging stops at a note event, so every message still applies in the order it came.
+        """
+        with self._pending_lock:
+            if status & 0xF0 == CONTROL_CHANGE:
+                position = self._pending_controllers.get((status, cc))
+                if position is None:
+                    self._pending_controllers[(status, cc)] = len(self._pending)
+                    self._pending.append((status, cc, value))
+                else:
+                    self._pending[position] = (status, cc, value)
+            else:
+                self._pending_controllers.clear()
+                self._pending.append((status, cc, value))
+            if self._drain_scheduled:
+                return
+            self._drain_scheduled = True
+        self._loop.call_soon_threadsafe(self._drain)
 
-        midi_input = pygame.midi.Input(input_id)
+    def _drain(self):
+        """Apply the pending messages in order, then publish once if anything changed."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+            self._pending_controllers.clear()
+            self._drain_scheduled = False
+        changed = False
+        for status, cc, value in pending:
+            changed |= self.process_midi_input(status, cc, value)
+        if changed:
+            self.event_system.publish("input variables changed")
 
-        # Initialize the MIDI output device
-        output_id = 3  # Replace with the correct device ID for your output device
+    async def start_async(self):
+        """Asynchronous MIDI event listener, running until cancelled."""
+        self._loop = asyncio.get_running_loop()
         try:
-            midi_output = pygame.midi.Output(output_id)
-        except Exception as e:
-            print(f"Failed to open MIDI output device: {e}")
-            return    
-
+            self.midi_input.start(self._receive)
+        except OSError as e:
+            logger.error("Failed to open MIDI input device: %s", e)
+            return
         try:
-            # Main loop to read MIDI events
-            while True:
-                if midi_input.poll():
-                    midi_events = midi_input.read(10)
-                    for event in midi_events:
-                        data = event[0]
-                        status, cc, value = data[0], data[1], data[2]
-                        self.process_midi_input(status, cc, value)
-                        # Publish the "input_variable_changed" event
-                        await self.event_system.trigger_event("input variables changed")
-                                
-                await asyncio.sleep(0.016)  # Yield control to the event loop
-
+            # Messages arrive through _receive, nothing to do here but wait
+            await self._loop.create_future()
         finally:
-            midi_input.close()
-            midi_output.close()
-            pygame.midi.quit()
-
-
-
-# def update_calculated_variables(self):
-#     """Update calculated variables based on the current input variables."""
-#     #update the colour
-#     current_time = time.time()
-#     if current_time - self.last_update_time > 0.2:  # Check if 0.2 seconds have passed
-#         self.calculated_variables['Plotting_Colour'] = self.get_next_color()
-#         self.last_update_time = current_time
-#     #update the calculated variables
-#     self.calculated_variables['Qe_opt'] = w0/self.input_variables['uphonics_range']
-#     self.calculated_variables['QFRT'] = self.input_variables['FoM']*f0/self.input_variables['tuning_range']
-#     self.calculated_variables['Qe_opt_FRT'] = 1 / (1 / Q0 + 1 / self.calculated_variables['QFRT'])
-#     self.calculated_variables['QL'] = 1 / (1 / self.input_variables['Qe'] + 1 / Q0)
-#     self.calculated_variables['QL_FRT'] = 1 / (1 / self.input_variables['Qe'] + 1 / Q0 + 1 / self.calculated_variables['QFRT'])
+            self.midi_input.close()
@@ -0,0 +1,142 @@
+"""Simulation of a whole cryomodule or linac of cavities in one kernel.
+
+Per-cavity parameters are kept as arrays (struct of arrays), and each block
+step evaluates the detuning and generator powers of every cavity at once as
+a (cavities, samples) array with the same equations as Kernel.
+
+Run a demo cryomodule from the src directory:
+    python multi_kernel.py 16
+"""
+import asyncio
+import os
+import sys
+import numpy as np
+from kernel import (load_detuning_trace, scale_detuning, frt_detuning, calculate_variables,
+                    generator_current, generator_power)
+from detuning_stats import DetuningIndex
+from optimizer import mean_generator_power
+
+CAVITY_PARAMETERS = ('FoM', 'uphonics_range', 'tuning_range', 'Qe', 'FRT_On')
+
+
+class MultiCavityKernel:
+    def __init__(self, cavity_parameters, detuning_traces, sample_period, trace_index=None, phase_offset=None):
+        """
+        :param cavity_parameters: Dictionary of FoM, uphonics_range, tuning_range, Qe and FRT_On, each a scalar or one value per cavity.
+        :param detuning_traces: List of raw detuning arrays, as stored in detuning.csv.
+        :param sample_period: Time between two trace samples in seconds.
+        :param trace_index: Index into detuning_traces for each cavity, all cavities share trace 0 by default.
+        :param phase_offset: Sample offset of each cavity into its trace, zero by default.
+        """
+        self.cavity_count = max(np.size(cavity_parameters[name]) for name in CAVITY_PARAMETERS)
+        for name in CAVITY_PARAMETERS:
+            setattr(self, name, np.broadcast_to(np.asarray(cavity_parameters[name], dtype=float),
+                                                (self.cavity_count,)).copy())
+        self.sample_period = sample_period
+
+        # Traces are padded into one 2D array so every cavity can be gathered in a single indexing operation
+        self.trace_lengths = np.array([len(trace) for trace in detuning_traces])
+        self.detuning_traces = np.zeros((len(detuning_traces), self.trace_lengths.max()))
+        for row, trace in enumerate(detuning_traces):
+            self.detuning_traces[row, :len(trace)] = trace
+        self.trace_index = np.zeros(self.cavity_count, dtype=int) if trace_index is None else np.asarray(trace_index)
+        self.phase_offset = np.zeros(self.cavity_count, dtype=int) if phase_offset is None else np.asarray(phase_offset)
+        self.detuning_statistics = [DetuningIndex(trace) for trace in detuning_traces]
+        self._position = 0
+        self.recalculate_variables()
+
+    @classmethod
+    def from_trace(cls, csv_file, cavity_count, **cavity_parameters):
+        """
+        Build a string of cavities sharing one trace, each starting at an evenly spaced phase offset.
+        :param csv_file: The detuning trace, a CSV or binary trace file.
+        :param cavity_count: Number of cavities.
+        :param cavity_parameters: Values of FoM, uphonics_range, tuning_range, Qe and FRT_On, defaulting to the game's.
+        """
+        time_trace, detuning_trace = load_detuning_trace(csv_file)
+        parameters = {'FoM': 20, 'uphonics_range': 20, 'tuning_range': 25, 'Qe': 10**7, 'FRT_On': 1}
+        parameters.update(cavity_parameters)
+        parameters = {name: np.broadcast_to(parameters[name], (cavity_count,)) for name in CAVITY_PARAMETERS}
+        phase_offset = np.arange(cavity_count) * len(detuning_trace) // cavity_count
+        return cls(parameters, [np.asarray(detuning_trace)], time_trace[1] - time_trace[0],
+                   phase_offset=phase_offset)
+
+    def set_parameter(self, name, value, cavity=None):
+        """
+        Change a cavity parameter and update the derived quantities.
+        :param name: One of FoM, uphonics_range, tuning_range, Qe and FRT_On.
+        :param value: The new value, or one value per cavity.
+        :param cavity: Index or indices of the cavities to change, all cavities if None.
+        """
+        if name not in CAVITY_PARAMETERS:
+            raise ValueError(f"Unknown cavity parameter '{name}'.")
+        getattr(self, name)[slice(None) if cavity is None else cavity] = value
+        self.recalculate_variables()
+
+    def recalculate_variables(self):
+        """Recalculate the per-cavity quality factors and full-cycle average powers."""
+        self.calculated_variables = calculate_variables(self.FoM, self.uphonics_range, self.tuning_range, self.Qe)
+        mean_square = np.empty(self.cavity_count)
+        mean_square_FRT = np.empty(self.cavity_count)
+        for cavity in range(self.cavity_count):
+            statistics = self.detuning_statistics[self.trace_index[cavity]]
+            mean_square[cavity] = statistics.mean_square_detuning(self.uphonics_range[cavity])
+            mean_square_FRT[cavity] = statistics.mean_square_detuning_FRT(
+                self.uphonics_range[cavity], self.tuning_range[cavity])
+        # Pg_avg and Pg_FRT_avg mean what they mean in the single cavity Kernel, the average without and with
+        # the FRT; Pg_cavity_avg is the one each cavity actually draws given its FRT_On
+        Pg_avg = self.calculated_variables['Pg_avg'] = mean_generator_power(self.Qe, mean_square)
+        Pg_FRT_avg = self.calculated_variables['Pg_FRT_avg'] = mean_generator_power(
+            self.Qe, mean_square_FRT, self.calculated_variables['QFRT'])
+        self.calculated_variables['Pg_cavity_avg'] = np.where(self.FRT_On > 0, Pg_FRT_avg, Pg_avg)
+        self.calculated_variables['Total_Pg_avg'] = self.calculated_variables['Pg_cavity_avg'].sum()
+
+    def worst_offenders(self, count=5):
+        """Indices of the cavities with the highest average power, highest first."""
+        return np.argsort(self.calculated_variables['Pg_cavity_avg'])[::-1][:count]
+
+    def step_block(self, block_size):
+        """
+        Advance all cavities by a block of samples.
+        :return: Dictionary with per-cavity (cavities, samples) arrays and the total power per sample.
+        """
+        samples = self._position + np.arange(block_size)
+        indices = (samples[np.newaxis, :] + self.phase_offset[:, np.newaxis]) % self.trace_lengths[self.trace_index, np.newaxis]
+        self._position += block_size
+        detuning = scale_detuning(self.detuning_traces[self.trace_index[:, np.newaxis], indices],
+                                  self.uphonics_range[:, np.newaxis])
+        detuning_FRT = frt_detuning(detuning, self.tuning_range[:, np.newaxis])
+        Qe = self.Qe[:, np.newaxis]
+        Pg = generator_power(generator_current(detuning, self.calculated_variables['QL'][:, np.newaxis]), Qe)
+        Pg_FRT = generator_power(generator_current(detuning_FRT, self.calculated_variables['QL_FRT'][:, np.newaxis]), Qe)
+        # Each cavity draws the FRT power only while its tuner is switched on
+        Pg_cavity = np.where(self.FRT_On[:, np.newaxis] > 0, Pg_FRT, Pg)
+        return {"Time": samples * self.sample_period,
+                "Detuning": detuning, "Pg": Pg,
+                "Detuning FRT": detuning_FRT, "Pg FRT": Pg_FRT,
+                "Pg Cavity": Pg_cavity, "Pg Total": Pg_cavity.sum(axis=0),
+                "Pg Cavity Avg": self.calculated_variables['Pg_cavity_avg'],
+                "Pg Total Avg": self.calculated_variables['Total_Pg_avg'],
+                }
+
+    async def start_async(self, results_queue, block_size=1130):
+        """Main loop of the multi-cavity kernel, one record per block for the whole string of cavities."""
+        while True:
+            await results_queue.put(self.step_block(block_size))
+            await asyncio.sleep(0)
+
+
+async def main(cavity_count):
+    from display import CryomoduleDisplay  # Deferred so the kernel stays usable without matplotlib
+    queue = asyncio.Queue(maxsize=100)
+    kernel = MultiCavityKernel.from_trace(os.path.join("..", "data", "detuning.csv"), cavity_count,
+                                          Qe=np.geomspace(10**6, 10**8, cavity_count))
+    display = CryomoduleDisplay(kernel)
+    try:
+        await asyncio.gather(kernel.start_async(queue), display.start_async(queue))
+    except asyncio.CancelledError:
+        print("Program stopped.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 8))
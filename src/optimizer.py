@@ -0,0 +1,51 @@
+"""Closed-form optimal external Q for a measured detuning distribution.
+
+With Ig = Vc/(2 RQ QL) + i Vc d/(w0 RQ) and 1/QL = 1/Qe + G, the mean power
+Qe RQ <|Ig|^2>/2 depends on the trace only through <d^2>. Setting its
+derivative with respect to 1/Qe to zero gives
+
+    1/Qe_opt = sqrt(G^2 + 4 <d^2> / w0^2)
+
+with G = 1/Q0 without the FRT and G = 1/Q0 + 1/QFRT with it.
+"""
+import numpy as np
+from kernel import constants
+
+
+def _loss_rate(QFRT=None):
+    """Inverse loaded Q contributed by everything except the coupler."""
+    Q0 = constants().Q0
+    return 1 / Q0 if QFRT is None else 1 / Q0 + 1 / QFRT
+
+
+def mean_generator_power(Qe, mean_square_detuning, QFRT=None):
+    """
+    Average generator power over a trace with the given mean square detuning.
+    :param Qe: External quality factor, scalar or array.
+    :param mean_square_detuning: Mean of the squared (scaled) detuning.
+    :param QFRT: Quality factor of the FRT, or None without the FRT.
+    """
+    c = constants()
+    inverse_QL = 1 / Qe + _loss_rate(QFRT)
+    mean_Ig_squared = (c.Vc / (2 * c.RQ))**2 * inverse_QL**2 + (c.Vc / (c.w0 * c.RQ))**2 * mean_square_detuning
+    return Qe * c.RQ * mean_Ig_squared / 2
+
+
+def optimal_Qe(mean_square_detuning, QFRT=None):
+    """
+    External quality factor that minimizes the average generator power.
+    :param mean_square_detuning: Mean of the squared (scaled) detuning.
+    :param QFRT: Quality factor of the FRT, or None without the FRT.
+    """
+    return 1 / np.sqrt(_loss_rate(QFRT)**2 + 4 * mean_square_detuning / constants().w0**2)
+
+
+def optimum(mean_square_detuning, QFRT=None):
+    """
+    Optimal Qe for a trace and the average generator power it achieves.
+    :param mean_square_detuning: Mean of the squared (scaled) detuning.
+    :param QFRT: Quality factor of the FRT, or None without the FRT.
+    :return: Qe_opt and the minimum average power.
+    """
+    Qe_opt = optimal_Qe(mean_square_detuning, QFRT)
+    return Qe_opt, mean_generator_power(Qe_opt, mean_square_detuning, QFRT)
@@ -0,0 +1,117 @@
+"""Reactive store of the input variables and the quantities derived from them.
+
+Every derived quantity is a node with a function and the names it depends
+on, e.g. QL_FRT from Qe and QFRT. When inputs change, only the nodes
+downstream of them are recomputed, and a node whose outputs did not change
+stops the propagation. Subscribers receive a diff of the inputs and derived
+quantities that changed, never a copy of everything. A node that raises is
+logged and keeps its last values, and propagation carries on with the rest.
+
+    parameters = ParameterStore(input_variables, calculated_variables)
+    parameters.define('QFRT', frt_quality_factor, ('FoM', 'tuning_range'))
+    parameters.define('QL_FRT', loaded_quality_factor, ('Qe', 'QFRT'))
+    parameters.subscribe(print)
+    parameters.set({'Qe': 10**8})  # Prints {'Qe': 100000000, 'QL_FRT': ...}
+"""
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class ParameterStore:
+    def __init__(self, input_variables, values=None):
+        """
+        :param input_variables: The shared input variables, a dictionary of name to {'value': ..., 'range': ...}.
+        :param values: Dictionary the derived quantities are written into, e.g. calculated_variables.
+        """
+        self.input_variables = input_variables
+        self.values = {} if values is None else values
+        # Input values as of the last refresh
+        self.inputs = {name: variable['value'] for name, variable in input_variables.items()}
+        # Nodes as (outputs, function, dependencies); definition order is a valid evaluation order
+        self._nodes = []
+        self._dependents = defaultdict(list)
+        self._subscribers = []
+
+    def __getitem__(self, name):
+        """Current value of an input or derived quantity."""
+        return self.inputs[name] if name in self.inputs else self.values[name]
+
+    def define(self, outputs, function, dependencies):
+        """
+        Add a derived quantity and compute it.
+        :param outputs: Name of the quantity, or a tuple of names if function returns a tuple.
+        :param function: Called with the values of the dependencies as positional arguments.
+        :param dependencies: Names of the inputs and earlier defined quantities it is computed from.
+        """
+        for name in dependencies:
+            if name not in self.inputs and name not in self.values:
+                raise ValueError(f"Unknown dependency '{name}', define it first.")
+        outputs = (outputs,) if isinstance(outputs, str) else tuple(outputs)
+        node = len(self._nodes)
+        self._nodes.append((outputs, function, tuple(dependencies)))
+        for name in dependencies:
+            self._dependents[name].append(node)
+        self._evaluate(node)
+
+    def subscribe(self, callback):
+        """Call callback(diff) after every change, with a dictionary of the inputs and quantities that changed."""
+        self._subscribers.append(callback)
+
+    def set(self, values):
+        """
+        Change input variables and recompute what depends on them.
+        :param values: Dictionary of input variable name to new value.
+        :return: The diff sent to the subscribers, empty if nothing changed.
+        """
+        changed = {}
+        for name, value in values.items():
+            if self.inputs[name] != value:
+                self.inputs[name] = value
+                self.input_variables[name]['value'] = value
+                changed[name] = value
+        return self._propagate(changed)
+
+    def refresh(self):
+        """Pick up input variables changed in place in input_variables and recompute what depends on them."""
+        changed = {name: variable['value'] for name, variable in self.input_variables.items()
+                   if self.inputs[name] != variable['value']}
+        self.inputs.update(changed)
+        return self._propagate(changed)
+
+    def _propagate(self, changed):
+        """Recompute the nodes downstream of the changed names and notify the subscribers."""
+        if not changed:
+            return {}
+        diff = dict(changed)
+        dirty = {node for name in changed for node in self._dependents[name]}
+        while dirty:
+            # Dependents always come later, so the lowest dirty node has all its inputs up to date
+            node = min(dirty)
+            dirty.remove(node)
+            try:
+                outputs = self._evaluate(node)
+            except Exception:
+                # The outputs keep their last values, so nothing downstream of them changes either
+                logger.exception("Computing %s failed.", ", ".join(self._nodes[node][0]))
+                continue
+            diff.update(outputs)
+            for name in outputs:
+                dirty.update(self._dependents[name])
+        for callback in self._subscribers:
+            callback(diff)
+        return diff
+
+    def _evaluate(self, node):
+        """Compute one node and return the outputs whose value changed."""
+        outputs, function, dependencies = self._nodes[node]
+        results = function(*(self[name] for name in dependencies))
+        if len(outputs) == 1:
+            results = (results,)
+        changed = {}
+        for name, value in zip(outputs, results):
+            if name not in self.values or self.values[name] != value:
+                self.values[name] = value
+                changed[name] = value
+        return changed
@@ -0,0 +1,321 @@
+"""Per-stage timers for the simulation loop, and whole-program profiles of a window of a session.
+
+StageProfiler times the stages of the loop, e.g. the trace fetch, Pg, the
+queue put and the display draw, by wrapping the methods that implement them on
+the running objects, so the loop itself is unchanged and nothing is timed
+unless profiling is on. Every call of a stage lands in a histogram of log
+spaced buckets, a few list operations per call; summaries of count, mean,
+percentiles and maximum per stage are logged as one JSON line per interval,
+each covering the calls since the previous one. Stages nested in a timed stage,
+like IgeiPhi in Pg, are taken out of its time, so every stage reports its own
+time and the stages add up to the time the loop spent in them.
+
+profile_window_async profiles everything the event loop thread does for a
+fixed window of the session, with cProfile into a .prof file for pstats or
+snakeviz, or by sampling the stack into folded stacks for flame graphs.
+
+In main.py:
+    profiler = StageProfiler()
+    instrument_kernel(profiler, kernel)
+    instrument_display(profiler, display)
+    queue.put = profiler.timed_async(queue.put, "queue put")
+    await asyncio.gather(profiler.log_summary_async(), profile_window_async("session.prof", start=5.0), ...)
+
+Read a window profile from the src directory:
+    python -m pstats session.prof
+"""
+import asyncio
+import cProfile
+import functools
+import inspect
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Histogram buckets: BUCKETS_PER_OCTAVE per doubling of time, from 2**MIN_OCTAVE seconds (60 ns) to 2**MAX_OCTAVE (64 s)
+BUCKETS_PER_OCTAVE = 4
+MIN_OCTAVE = -24
+MAX_OCTAVE = 6
+BUCKETS = (MAX_OCTAVE - MIN_OCTAVE) * BUCKETS_PER_OCTAVE
+PERCENTILES = (50, 90, 99)
+
+
+class StageHistogram:
+    """Durations of the calls of one stage, counted in log spaced buckets."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """Count one call of the stage that took `seconds`."""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if seconds > 0:
+            index = int((math.log2(seconds) - MIN_OCTAVE) * BUCKETS_PER_OCTAVE)
+            self.counts[min(max(index, 0), BUCKETS - 1)] += 1
+        else:
+            self.counts[0] += 1
+
+    def percentile(self, percent):
+        """Upper edge of the bucket holding the given percentile, never more than the maximum."""
+        rank = percent / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(2 ** (MIN_OCTAVE + (index + 1) / BUCKETS_PER_OCTAVE), self.max)
+        return self.max
+
+    def summary(self):
+        """Count, total and mean, percentiles and maximum, in seconds."""
+        summary = {"count": self.count, "total": self.total, "mean": self.total / self.count if self.count else 0.0}
+        for percent in PERCENTILES:
+            summary[f"p{percent}"] = self.percentile(percent)
+        summary["max"] = self.max
+        return summary
+
+
+class TimedIterator:
+    """Iterator whose steps are taken by a timed wrapper of another iterator's __next__."""
+
+    __slots__ = ("_step",)
+
+    def __init__(self, step):
+        self._step = step
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._step()
+
+
+class StageProfiler:
+    """Histograms of the time spent per stage of the simulation loop."""
+
+    # Clock the stages are timed with, in seconds
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, name="main", interval=5.0, stream=None):
+        """
+        :param name: Name of the process in the summaries, so the kernel process can be told apart.
+        :param interval: Seconds between two summaries.
+        :param stream: File the summaries are written to, stderr by default.
+        """
+        self.name = name
+        self.interval = interval
+        self.stream = stream
+        self.stages = {}
+        # Time spent in nested stages, one entry per synchronous stage running
+        self._nested = []
+        self._window_start = self.clock()
+        self._next_summary = self._window_start + interval
+
+    def record(self, stage, seconds):
+        """Count one call of a stage."""
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = StageHistogram()
+        histogram.add(seconds)
+
+    def timed(self, function, stage):
+        """
+        Wrap a function so every call is counted as a call of the stage, less the time of the stages nested in it.
+        :return: The wrapped function.
+        """
+        clock, nested, record = self.clock, self._nested, self.record
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            nested.append(0.0)
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                inner = nested.pop()
+                if nested:
+                    nested[-1] += elapsed
+                record(stage, elapsed - inner)
+        wrapper.profiled_stage = stage
+        return wrapper
+
+    def timed_async(self, function, stage):
+        """
+        Wrap a coroutine function so every call is counted as a call of the stage, including any time it waits.
+        Other tasks run while it waits, so its time is never taken out of another stage.
+        :return: The wrapped coroutine function.
+        """
+        clock, record = self.clock, self.record
+
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                record(stage, clock() - start)
+        wrapper.profiled_stage = stage
+        return wrapper
+
+    def timed_iterator(self, iterator, stage):
+        """Wrap an iterator so every step is counted as a call of the stage."""
+        return TimedIterator(self.timed(iterator.__next__, stage))
+
+    def instrument(self, target, stages):
+        """
+        Time methods of an object by replacing them on the object with timed wrappers.
+        :param target: The object, its class is left alone.
+        :param stages: Dictionary of method name to stage name; methods the object does not have and methods
+            already timed are skipped, so instrumenting an object twice does not count its stages twice.
+        """
+        for attribute, stage in stages.items():
+            method = getattr(target, attribute, None)
+            if method is None or hasattr(method, "profiled_stage"):
+                continue
+            if inspect.iscoroutinefunction(method):
+                setattr(target, attribute, self.timed_async(method, stage))
+            else:
+                setattr(target, attribute, self.timed(method, stage))
+
+    def summary(self, reset=True):
+        """
+        Summarize every stage.
+        :param reset: Start new histograms, so the next summary covers only the calls after this one.
+        :return: Dictionary with the window length in seconds and per stage the call count, mean, percentiles and
+            maximum in microseconds and the share of the window spent in the stage.
+        """
+        now = self.clock()
+        window = now - self._window_start
+        stages = {}
+        for stage, histogram in self.stages.items():
+            summary = histogram.summary()
+            count, total = summary.pop("count"), summary.pop("total")
+            stages[stage] = {"count": count, "share": total / window if window > 0 else 0.0,
+                             **{f"{key}_us": value * 1e6 for key, value in summary.items()}}
+        if reset:
+            self.stages = {}
+            self._window_start = now
+        return {"profile": self.name, "window": window, "stages": stages}
+
+    def log_summary(self):
+        """Write the summary of the calls since the last one as one JSON line."""
+        print(json.dumps(self.summary()), file=self.stream or sys.stderr, flush=True)
+        self._next_summary = self.clock() + self.interval
+
+    def log_if_due(self):
+        """Write a summary if the interval has passed since the last one, for loops outside the event loop."""
+        if self.clock() >= self._next_summary:
+            self.log_summary()
+
+    async def log_summary_async(self):
+        """Periodically write a summary as one JSON line."""
+        while True:
+            await asyncio.sleep(self.interval)
+            self.log_summary()
+
+
+def instrument_kernel(profiler, kernel):
+    """Time the stages of a Kernel, in both the sample and the block loop; stages already timed are left alone."""
+    profiler.instrument(kernel, {"DeltaOmega_t": "DeltaOmega_t", "DeltaOmega_block": "DeltaOmega_block",
+                                 "IgeiPhi": "IgeiPhi", "Pg": "Pg",
+                                 "AvergaePower": "AvergaePower", "AvergaePower_block": "AvergaePower"})
+    if not isinstance(kernel.detuning_time_generator, TimedIterator):
+        kernel.detuning_time_generator = profiler.timed_iterator(kernel.detuning_time_generator, "trace fetch")
+    profiler.instrument(kernel.trace_source, {"read": "trace read"})
+    if kernel.tuner is not None:
+        profiler.instrument(kernel.tuner, {"apply": "tuner"})
+
+
+def instrument_display(profiler, display):
+    """Time the stages of a Display; "draw" is what is left of a frame after the bars and the scatter."""
+    profiler.instrument(display, {"ingest": "display ingest", "update_bars": "update_bars",
+                                  "update_scatter": "update_scatter", "render_frame": "draw"})
+
+
+def instrument_input_source(profiler, input_source):
+    """Time the handling of controller messages."""
+    profiler.instrument(input_source, {"process_midi_input": "midi input"})
+
+
+class StackSampler:
+    """Sample the stack of one thread from a background thread, counted as folded stacks."""
+
+    def __init__(self, interval=0.002, thread_id=None):
+        """
+        :param interval: Seconds between samples.
+        :param thread_id: Thread to sample, the calling thread by default.
+        """
+        self.interval = interval
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name="stack sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _sample(self):
+        """Body of the sampling thread."""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        """Write the samples as folded stacks, one "outermost;...;innermost count" line per stack."""
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+async def profile_window_async(path, start=5.0, duration=10.0, interval=0.002):
+    """
+    Profile everything the event loop thread does for a window of the session.
+    :param path: Output file, a cProfile dump if it ends in .prof, otherwise folded stacks sampled every interval.
+    :param start: Seconds from now to the start of the window.
+    :param duration: Seconds profiled.
+    :param interval: Seconds between stack samples.
+    """
+    await asyncio.sleep(start)
+    if path.endswith(".prof"):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+    else:
+        sampler = StackSampler(interval)
+        sampler.start()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            sampler.stop()
+            sampler.write(path)
+    print(f"Wrote the profile of {duration:g} s of the session to {path}", file=sys.stderr, flush=True)
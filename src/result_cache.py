@@ -0,0 +1,206 @@
+"""Persistent cache of simulation results, addressed by the content of their inputs.
+
+A result is keyed by a digest of the detuning trace samples, the physical
+constants of config.json (f0, Vc, Q0, RQ) and the values of the input
+parameters, so any run over the same trace and parameters finds it again,
+whatever file or process it came from. Results live in an SQLite database,
+one row per parameter combination, evicted least recently used first once
+the cache holds more than max_entries. Counting the rows scans the table, so
+each process counts them, and evicts, only after writing EVICT_INTERVAL of
+max_entries rows since its last count; the cache may exceed max_entries by
+that much per process writing to it. A hit is marked as used only if its
+mark is older than TOUCH_INTERVAL, and the marks are written in batches of
+TOUCH_BATCH, with the next put or on close, so lookups that hit do not wait
+for the write lock. The database runs in WAL mode, so any number of
+processes, e.g. the workers of a sweep, can share it.
+
+    cache = ResultCache()
+    context = cache.context(trace_digest(detuning_trace))
+    keys = cache.keys(context, parameters)  # One row of parameter values per combination
+    found, values = cache.get(keys, width)  # Rows of values, with found[i] False where not cached
+    cache.put([key for key, hit in zip(keys, found) if not hit], computed_values)
+"""
+import hashlib
+import os
+import sqlite3
+import time
+import numpy as np
+
+DEFAULT_CACHE_PATH = os.path.join("..", "cache", "results.sqlite")
+DEFAULT_MAX_ENTRIES = 1_000_000
+# Changes whenever the physics behind the cached results does, so old results are never served
+CACHE_VERSION = 1
+# Keys per SQL statement, below SQLite's limit of bound parameters
+KEYS_PER_QUERY = 500
+# Share of max_entries a cache writes between two counts of its rows
+EVICT_INTERVAL = 0.01
+# Nanoseconds a use mark stays fresh enough for LRU eviction, and number of hits whose marks are written together
+TOUCH_INTERVAL = 60 * 10**9
+TOUCH_BATCH = 4096
+
+
+def trace_digest(detuning_trace):
+    """
+    Digest of the detuning samples, the same for the same samples whatever file they were read from.
+    :param detuning_trace: Raw detuning samples, or an iterable of blocks of them.
+    :return: The digest as a hex string.
+    """
+    blocks = [detuning_trace] if isinstance(detuning_trace, np.ndarray) else detuning_trace
+    digest = hashlib.sha256()
+    for block in blocks:
+        digest.update(np.ascontiguousarray(block, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, timeout=60.0):
+        """
+        :param path: The SQLite database file, created with its directory if missing.
+        :param max_entries: Number of results kept, the least recently used beyond it are evicted.
+        :param timeout: Seconds to wait for another process holding the write lock.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        # Rows written by this cache since it last counted the rows, starting due so the first put counts them
+        self._count_interval = max(int(max_entries * EVICT_INTERVAL), 1)
+        self._written = self._count_interval
+        # Hits whose use marks are stale, to be marked as used with the next batch
+        self._untouched = []
+        # Autocommit, transactions are opened explicitly where they are needed
+        self._connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS results "
+                                 "(key BLOB PRIMARY KEY, value BLOB NOT NULL, used INTEGER NOT NULL) WITHOUT ROWID")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+
+    def context(self, trace_digest, **extra):
+        """
+        Digest of everything besides the parameters that the results depend on.
+        :param trace_digest: Digest of the detuning trace, as returned by trace_digest.
+        :param extra: Further settings the results depend on, as names and values with a stable repr.
+        """
+        from kernel import constants  # Deferred, the config is only read once a cache is used
+        values = constants()
+        digest = hashlib.sha256(repr((CACHE_VERSION, trace_digest, values.f0, values.Vc, values.Q0, values.RQ,
+                                      sorted(extra.items()))).encode())
+        return digest.digest()[:16]
+
+    @staticmethod
+    def keys(context, parameters):
+        """
+        Keys of parameter combinations.
+        :param context: The digest returned by context.
+        :param parameters: Array of parameter values, one row per combination, the columns always in the same order.
+        :return: A list of keys, one per row.
+        """
+        parameters = np.ascontiguousarray(parameters, dtype=np.float64)
+        # -0.0 and 0.0 are the same parameter value
+        parameters = parameters + 0.0
+        return [context + row.tobytes() for row in parameters]
+
+    def get(self, keys, width):
+        """
+        Look up results and mark them as used, in batches written later.
+        :param keys: Keys as returned by keys.
+        :param width: Number of values per result.
+        :return: A boolean array of which keys were found, and their values, one row per key, NaN where not found.
+        """
+        index = {key: position for position, key in enumerate(keys)}
+        hits, blobs = [], []
+        stale = time.time_ns() - TOUCH_INTERVAL
+        for start in range(0, len(keys), KEYS_PER_QUERY):
+            part = keys[start:start + KEYS_PER_QUERY]
+            query = f"SELECT key, value, used FROM results WHERE key IN ({','.join('?' * len(part))})"
+            for key, value, used in self._connection.execute(query, part):
+                hits.append(key)
+                blobs.append(value)
+                if used < stale:
+                    self._untouched.append(key)
+        found = np.zeros(len(keys), dtype=bool)
+        values = np.full((len(keys), width), np.nan)
+        if hits:
+            positions = [index[key] for key in hits]
+            found[positions] = True
+            values[positions] = np.frombuffer(b"".join(blobs), dtype=np.float64).reshape(len(hits), width)
+        if len(self._untouched) >= TOUCH_BATCH:
+            self.flush()
+        return found, values
+
+    def _touch(self, now):
+        """Mark the hits waiting for it as used now, inside the caller's transaction."""
+        keys, self._untouched = self._untouched, []
+        for start in range(0, len(keys), KEYS_PER_QUERY):
+            part = keys[start:start + KEYS_PER_QUERY]
+            self._connection.execute(f"UPDATE results SET used = ? WHERE key IN ({','.join('?' * len(part))})",
+                                     [now] + part)
+
+    def flush(self):
+        """Write the use marks of the hits waiting for the next batch, in one transaction."""
+        if not self._untouched:
+            return
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._touch(time.time_ns())
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def put(self, keys, values):
+        """
+        Store results, and every so often evict the least recently used beyond max_entries.
+        :param keys: Keys as returned by keys.
+        :param values: Array of values, one row per key.
+        """
+        if not len(keys):
+            return
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        now = time.time_ns()
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # The write lock is held anyway, so the waiting use marks go along before anything is evicted
+            self._touch(now)
+            connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                                   ((key, row.tobytes(), now) for key, row in zip(keys, values)))
+            # Counting scans the table, so it waits until this cache wrote a share of max_entries since the last
+            # count; the written rows include replaced ones, the cache grew by at most as many
+            written = self._written + len(keys)
+            if written >= self._count_interval:
+                written = 0
+                excess = connection.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    connection.execute("DELETE FROM results WHERE key IN "
+                                       "(SELECT key FROM results ORDER BY used LIMIT ?)", (excess,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._written = written
+
+    def clear(self):
+        """Remove every result."""
+        self._connection.execute("DELETE FROM results")
+        self._written = 0
+        self._untouched = []
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        """Write the waiting use marks and close the database connection."""
+        if self._connection is not None:
+            self.flush()
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,231 @@
+"""Record the kernel results stream to disk for analysis after the session.
+
+ResultsRecorder sits between the kernel and the display: it takes every
+record from the results queue and passes it on unchanged, keeping only
+references to its arrays, so the event loop does no copying. Once a chunk of
+samples has been taken, a background thread gathers them into preallocated
+column arrays and appends each column to its own raw file in the recording
+directory, so the event loop never waits for the disk, and memory stays
+bounded however long the session. Like binary traces, the column files are
+read back with np.memmap, without parsing or copies.
+
+The recording directory holds
+- one file of little-endian values per column, e.g. Pg_FRT.bin for "Pg FRT",
+- inputs.jsonl, one {"sample": index, "values": {...}} line per input variable
+  change, at the first sample recorded after it, starting with every value,
+- recording.json, the columns and value type.
+
+In main.py:
+    recorder = ResultsRecorder(input_variables, event_system, "session_results")
+    await asyncio.gather(recorder.start_async(queue, display_queue), display.start_async(display_queue), ...)
+
+Read a recording back, or summarize it from the src directory:
+    results, inputs = open_results("session_results")
+    python results_recorder.py session_results
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import numpy as np
+from kernel_process import RESULT_COLUMNS
+
+METADATA_FILE = "recording.json"
+INPUTS_FILE = "inputs.jsonl"
+# Sentinel that stops the writer thread
+_END = object()
+
+
+def column_file(column):
+    """File name of a column in the recording directory."""
+    return column.replace(" ", "_") + ".bin"
+
+
+class ResultsRecorder:
+    """Collect kernel records into column chunks appended to disk on a background thread."""
+
+    def __init__(self, input_variables, event_system, path, chunk_size=2**16, dtype=np.float64,
+                 columns=RESULT_COLUMNS):
+        """
+        :param path: Directory the recording is written into, created if missing.
+        :param chunk_size: Samples gathered per write.
+        :param dtype: np.float64 or np.float32 for the stored columns.
+        :param columns: The record columns to store.
+        """
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, METADATA_FILE)):
+            raise FileExistsError(f"{path} already holds a recording.")
+        self.input_variables = input_variables
+        self.input_variable_queue = event_system.add_listener("input variables changed")
+        self.path = path
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.columns = tuple(columns)
+        with open(os.path.join(path, METADATA_FILE), "w") as file:
+            json.dump({"columns": self.columns, "dtype": self.dtype.str}, file)
+        self._files = {column: open(os.path.join(path, column_file(column)), "wb") for column in self.columns}
+        self._inputs_file = open(os.path.join(path, INPUTS_FILE), "w")
+        # Samples recorded so far
+        self.samples = 0
+        # Arrays of each column waiting to be written, in order, and single samples not yet made into one
+        self._parts = {column: [] for column in self.columns}
+        self._singles = {column: [] for column in self.columns}
+        self._count = 0
+        self._last_values = {}
+        self._inputs = []
+        self._record_inputs()
+        # Column arrays the writer gathers the parts into, reused for every chunk
+        self._buffers = {}
+        self._pending = queue.SimpleQueue()
+        self._error = None
+        self._writer = threading.Thread(target=self._write_chunks, name="results recorder", daemon=True)
+        self._writer.start()
+
+    def _record_inputs(self):
+        """Note the input variables that changed since the last look, at the next sample to be recorded."""
+        values = {name: variable['value'] for name, variable in self.input_variables.items()
+                  if self._last_values.get(name) != variable['value']}
+        if values:
+            self._last_values.update(values)
+            self._inputs.append({"sample": self.samples, "values": values})
+
+    def record(self, record):
+        """
+        Take the samples of one kernel record. Arrays are kept, not copied, until they are written,
+        so they must not be changed afterwards; kernel records are never reused.
+        :param record: Dictionary of column name to one sample or an array of samples.
+        """
+        if self._error is not None:
+            raise RuntimeError("Writing the recording failed.") from self._error
+        if not self.input_variable_queue.empty():
+            self.input_variable_queue.get_nowait()
+            self._record_inputs()
+        if np.ndim(record[self.columns[0]]) == 0:
+            for column in self.columns:
+                self._singles[column].append(record[column])
+            count = 1
+        else:
+            if self._singles[self.columns[0]]:
+                self._collect_singles()
+            for column in self.columns:
+                self._parts[column].append(record[column])
+            count = len(record[self.columns[0]])
+        self._count += count
+        self.samples += count
+        if self._count >= self.chunk_size:
+            self._flush()
+
+    def _collect_singles(self):
+        """Turn the single samples taken so far into one array per column."""
+        for column in self.columns:
+            self._parts[column].append(np.array(self._singles[column], dtype=self.dtype))
+            self._singles[column] = []
+
+    def _flush(self):
+        """Hand the samples and the input changes seen with them to the writer."""
+        if self._singles[self.columns[0]]:
+            self._collect_singles()
+        if not self._count and not self._inputs:
+            return
+        self._pending.put((self._parts, self._count, self._inputs))
+        self._parts = {column: [] for column in self.columns}
+        self._count = 0
+        self._inputs = []
+
+    def _write_chunks(self):
+        """Body of the writer thread: write chunks until the end sentinel arrives."""
+        while True:
+            item = self._pending.get()
+            if item is _END:
+                return
+            try:
+                if self._error is None:
+                    self._write_chunk(*item)
+            except Exception as error:
+                self._error = error
+
+    def _write_chunk(self, parts, count, inputs):
+        """Append one chunk to the files, the input changes first so no sample is on disk ahead of its inputs."""
+        for change in inputs:
+            self._inputs_file.write(json.dumps(change) + "\n")
+        self._inputs_file.flush()
+        for column in self.columns:
+            buffer = self._buffers.get(column)
+            if buffer is None or len(buffer) < count:
+                buffer = self._buffers[column] = np.empty(max(count, self.chunk_size), dtype=self.dtype)
+            # numpy releases the GIL for the copies, so the event loop keeps running on another core
+            np.concatenate(parts[column], out=buffer[:count])
+            self._files[column].write(memoryview(buffer[:count]))
+
+    def close(self):
+        """Write the last partial chunk, wait for the writer to finish and close the files."""
+        if self._writer is None:
+            return
+        self._record_inputs()
+        self._flush()
+        self._pending.put(_END)
+        self._writer.join()
+        self._writer = None
+        for file in self._files.values():
+            file.close()
+        self._inputs_file.close()
+        if self._error is not None:
+            raise RuntimeError("Writing the recording failed.") from self._error
+
+    async def start_async(self, source, sink):
+        """
+        Record every record of the source queue and pass it on to the sink queue, until cancelled.
+        :param source: The queue the kernel puts its records into.
+        :param sink: The queue the display reads from.
+        """
+        try:
+            while True:
+                record = await source.get()
+                self.record(record)
+                await sink.put(record)
+        finally:
+            self.close()
+
+
+def open_results(path, columns=None):
+    """
+    Map the columns of a recording and load its input changes.
+    :param columns: The columns to map, all by default.
+    :return: A dictionary of column name to memory-mapped array, trimmed to the shortest column if a write
+        was interrupted, and the input changes as a list of (sample index, values) pairs.
+    """
+    with open(os.path.join(path, METADATA_FILE)) as file:
+        metadata = json.load(file)
+    dtype = np.dtype(metadata["dtype"])
+    columns = metadata["columns"] if columns is None else columns
+    samples = min(os.path.getsize(os.path.join(path, column_file(column))) // dtype.itemsize for column in columns)
+    # np.memmap cannot map an empty file
+    results = {column: np.memmap(os.path.join(path, column_file(column)), dtype=dtype, mode="r", shape=(samples,))
+               if samples else np.empty(0, dtype=dtype) for column in columns}
+    with open(os.path.join(path, INPUTS_FILE)) as file:
+        changes = [json.loads(line) for line in file if line.strip()]
+    return results, [(change["sample"], change["values"]) for change in changes]
+
+
+def load_results(path, columns=None):
+    """Load a recording into memory, as open_results but with plain arrays."""
+    results, inputs = open_results(path, columns)
+    return {column: np.array(values) for column, values in results.items()}, inputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a recording of the kernel results.")
+    parser.add_argument("path", help="Recording directory written by ResultsRecorder.")
+    args = parser.parse_args(argv)
+    results, inputs = open_results(args.path)
+    samples = min((len(values) for values in results.values()), default=0)
+    time = results.get("Time")
+    span = f", time {time[0]:.6g} to {time[-1]:.6g}" if time is not None and samples else ""
+    print(f"{samples} samples of {', '.join(results)}{span}")
+    for sample, values in inputs:
+        print(f"  sample {sample}: " + ", ".join(f"{name} = {value:g}" for name, value in values.items()))
+
+
+if __name__ == "__main__":
+    main()
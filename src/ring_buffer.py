@@ -0,0 +1,77 @@
+"""Preallocated NumPy ring buffer for the display history.
+
+Every column is stored twice in a row (a "mirrored" ring), so the newest
+`size` values are always one contiguous slice and can be handed to
+matplotlib in time order without copying. The buffer also keeps minimum and
+maximum per fixed-size segment, so the overall extrema are found from a few
+hundred numbers instead of a rescan of the whole history.
+"""
+import numpy as np
+
+
+class RingBuffer:
+    def __init__(self, capacity, columns, segment_size=1024):
+        """
+        :param capacity: Maximum number of samples kept.
+        :param columns: Dictionary of column name to dtype.
+        :param segment_size: Number of samples per min/max segment.
+        """
+        self.capacity = capacity
+        self.size = 0
+        self._head = 0  # Ring position of the next sample
+        self._columns = {name: np.zeros(2 * capacity, dtype=dtype) for name, dtype in columns.items()}
+        self.segment_size = segment_size
+        segments = -(-capacity // segment_size)
+        self._segment_min = {name: np.full(segments, np.inf) for name in columns}
+        self._segment_max = {name: np.full(segments, -np.inf) for name in columns}
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, **values):
+        """
+        Append a block of samples to every column, dropping the oldest samples when full.
+        :param values: One array (or scalar) per column, all of the same length.
+        """
+        count = max(np.size(value) for value in values.values())
+        skip = max(count - self.capacity, 0)
+        written = count - skip
+        positions = (self._head + np.arange(written)) % self.capacity
+        for name, column in self._columns.items():
+            value = np.broadcast_to(values[name], (count,))[skip:]
+            column[positions] = value
+            column[positions + self.capacity] = value
+        self._head = (self._head + written) % self.capacity
+        self.size = min(self.size + written, self.capacity)
+        self._update_segments(np.unique(positions // self.segment_size))
+
+    def assign(self, name, values):
+        """Overwrite the samples held in a column, oldest first."""
+        positions = (self._head - self.size + np.arange(self.size)) % self.capacity
+        self._columns[name][positions] = values
+        self._columns[name][positions + self.capacity] = values
+        self._update_segments(np.unique(positions // self.segment_size))
+
+    def _update_segments(self, segments):
+        """Recompute the extrema of the given segments over their valid samples."""
+        for segment in segments:
+            start = segment * self.segment_size
+            # Before the ring is full only positions below size hold samples
+            stop = min(start + self.segment_size, self.capacity if self.size == self.capacity else self.size)
+            for name, column in self._columns.items():
+                values = column[start:stop]
+                self._segment_min[name][segment] = values.min()
+                self._segment_max[name][segment] = values.max()
+
+    def view(self, name):
+        """Return the samples of a column, oldest first, as a view into the buffer."""
+        start = (self._head - self.size) % self.capacity
+        return self._columns[name][start:start + self.size]
+
+    def min(self, name):
+        """Minimum of a column over the samples currently held."""
+        return self._segment_min[name].min()
+
+    def max(self, name):
+        """Maximum of a column over the samples currently held."""
+        return self._segment_max[name].max()
@@ -0,0 +1,116 @@
+"""Simulation clock that paces the kernel through the trace by wall time.
+
+At every tick the clock works out how many trace samples are due, from the
+wall time elapsed since the start times the speed factor, and hands them out
+as blocks of at most block_size samples, so each tick costs one vectorized
+kernel step. With speed None it free-runs, handing out full blocks as fast
+as they are consumed. If the consumer falls more than max_lag behind, the
+missed samples are skipped instead of produced in one burst.
+
+    clock = SimulationClock(kernel.sample_rate, speed=10)
+    async for count in clock.ticks_async():
+        record = kernel.step_block(count)
+"""
+import asyncio
+import json
+import sys
+import time
+
+
+class SimulationClock:
+    def __init__(self, sample_rate, speed=1.0, tick_interval=1/60, block_size=1130, max_lag=0.25):
+        """
+        :param sample_rate: Samples per second of simulated time, about 10.5 kHz for detuning.csv.
+        :param speed: Simulated seconds per wall second, None to run as fast as possible.
+        :param tick_interval: Wall seconds between ticks.
+        :param block_size: Maximum number of samples handed out at once.
+        :param max_lag: Simulated seconds the clock may fall behind before samples are skipped.
+        """
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.tick_interval = tick_interval
+        self.block_size = block_size
+        self.max_lag = max_lag
+        self.start()
+
+    @property
+    def target_rate(self):
+        """Samples per wall second the clock aims for, None when free-running."""
+        return None if self.speed is None else self.sample_rate * self.speed
+
+    def start(self):
+        """Start (or restart) the clock at the current wall time."""
+        self._start = time.perf_counter()
+        self._next_tick = self._start
+        self._position = 0  # Samples handed out or skipped
+        self.produced = 0
+        self.skipped = 0
+
+    def _due(self):
+        """Number of samples due now, skipping any beyond the allowed lag."""
+        if self.speed is None:
+            return self.block_size
+        target = int((time.perf_counter() - self._start) * self.target_rate)
+        lag = target - self._position
+        max_samples = max(int(self.max_lag * self.target_rate), self.block_size)
+        if lag > max_samples:
+            self.skipped += lag - max_samples
+            self._position += lag - max_samples
+            lag = max_samples
+        return lag
+
+    def _blocks(self, count):
+        """Split a number of due samples into blocks of at most block_size."""
+        while count > 0:
+            block = min(count, self.block_size)
+            self._position += block
+            self.produced += block
+            count -= block
+            yield block
+
+    def _delay(self):
+        """Wall seconds until the next tick, 0 when running late."""
+        if self.speed is None:
+            return 0.0
+        self._next_tick += self.tick_interval
+        now = time.perf_counter()
+        if self._next_tick < now:
+            # Running late, skip the missed ticks instead of trying to catch up
+            self._next_tick = now
+        return self._next_tick - now
+
+    def ticks(self):
+        """Yield the number of samples to produce, sleeping between ticks. For threads and processes."""
+        self.start()
+        while True:
+            yield from self._blocks(self._due())
+            time.sleep(self._delay())
+
+    async def ticks_async(self):
+        """Yield the number of samples to produce, awaiting between ticks."""
+        self.start()
+        while True:
+            for count in self._blocks(self._due()):
+                yield count
+            await asyncio.sleep(self._delay())
+
+    def report(self):
+        """Return the achieved and target sample rates since the start."""
+        elapsed = max(time.perf_counter() - self._start, 1e-9)
+        return {
+            "elapsed_s": elapsed,
+            "samples": self.produced,
+            "skipped": self.skipped,
+            "target_rate": self.target_rate,
+            "achieved_rate": self.produced / elapsed,
+        }
+
+    async def log_report_async(self, interval=5.0, stream=None):
+        """
+        Periodically write the rate report as one JSON line.
+        :param interval: Seconds between log lines.
+        :param stream: File to write to, stderr by default.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            print(json.dumps({"clock": self.report()}), file=stream or sys.stderr, flush=True)
@@ -0,0 +1,154 @@
+"""Multi-process parameter sweep.
+
+Splits the (FoM, uphonics_range, tuning_range, Qe, FRT_On) grid into chunks
+and evaluates them on a ProcessPoolExecutor. The detuning trace is streamed
+from its trace source into shared memory once, and every worker maps it
+instead of receiving a pickled copy with each task. Every worker looks its chunk up in the shared ResultCache
+first and only simulates what is missing. Chunk results are written in grid
+order as they finish.
+
+Example, run from the src directory:
+    python sweep.py --FoM 1:100:64 --Qe log:1e5:1e10:200 --workers 64 --output ../results/sweep.parquet
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from trace_source import open_trace_source
+from batch import build_parser, parse_arguments, parameter_grid, simulate_grid, simulate_grid_cached, ResultsWriter
+from result_cache import DEFAULT_MAX_ENTRIES, ResultCache, trace_digest
+
+# Per-worker state, set up once by _init_worker
+_worker_trace = None
+_worker_memory = None
+_worker_grid = None
+_worker_cache = None
+_worker_context = None
+
+
+def _init_worker(memory_name, trace_length, values, cache_path=None, cache_size=None, context=None):
+    """Attach the worker to the shared detuning trace and the results cache, and build its copy of the grid."""
+    global _worker_trace, _worker_memory, _worker_grid, _worker_cache, _worker_context
+    try:
+        # The parent owns the block; keep the worker's resource tracker out of it
+        _worker_memory = shared_memory.SharedMemory(name=memory_name, track=False)
+    except TypeError:  # Python < 3.13
+        _worker_memory = shared_memory.SharedMemory(name=memory_name)
+    _worker_trace = np.ndarray((trace_length,), dtype=np.float64, buffer=_worker_memory.buf)
+    _worker_grid = parameter_grid(values)
+    if cache_path is not None:
+        _worker_cache = ResultCache(cache_path, cache_size)
+        _worker_context = context
+
+
+def _run_chunk(bounds):
+    """Simulate the grid entries between the given start and stop indices."""
+    start, stop = bounds
+    chunk = {name: axis[start:stop] for name, axis in _worker_grid.items()}
+    if _worker_cache is not None:
+        return simulate_grid_cached(_worker_trace, chunk, _worker_cache, _worker_context)
+    return simulate_grid(_worker_trace, chunk)
+
+
+def _share_trace(detuning_trace):
+    """
+    Copy the detuning samples into a new shared memory block.
+    :param detuning_trace: Raw detuning samples, or a function returning an iterator over blocks of them. The
+        function is called twice, once to count the samples and once to copy them, so a trace read from a file
+        is only ever held in memory once, in the shared block.
+    :return: The shared memory block and the array of samples in it.
+    """
+    if callable(detuning_trace):
+        length = sum(len(block) for block in detuning_trace())
+        blocks = detuning_trace()
+    else:
+        blocks = [np.asarray(detuning_trace, dtype=np.float64)]
+        length = len(blocks[0])
+    memory = shared_memory.SharedMemory(create=True, size=max(8 * length, 1))
+    trace = np.ndarray((length,), dtype=np.float64, buffer=memory.buf)
+    position = 0
+    try:
+        for block in blocks:
+            if position + len(block) > length:
+                raise ValueError("The detuning trace changed while it was read.")
+            trace[position:position + len(block)] = block
+            position += len(block)
+        if position != length:
+            raise ValueError("The detuning trace changed while it was read.")
+    except BaseException:
+        trace = None
+        memory.close()
+        memory.unlink()
+        raise
+    return memory, trace
+
+
+def run_sweep(detuning_trace, values, output_path, chunk_size=1024, max_workers=None, progress=True,
+              cache_path=None, cache_size=DEFAULT_MAX_ENTRIES):
+    """
+    Run a parameter sweep on a pool of worker processes.
+    :param detuning_trace: Raw detuning samples, as stored in detuning.csv, or a function returning an iterator
+        over blocks of them, which is read twice.
+    :param values: Dictionary of parameter name to a sequence of values, as for batch.parameter_grid.
+    :param output_path: The .csv or .parquet file to write.
+    :param chunk_size: Number of grid combinations per task.
+    :param max_workers: Number of worker processes, defaults to the CPU count.
+    :param progress: Print progress to stderr while the sweep runs.
+    :param cache_path: Results cache shared by the workers, None to simulate every combination.
+    :param cache_size: Number of results kept in the cache.
+    :return: The number of combinations written.
+    """
+    total = int(np.prod([len(values[name]) for name in values]))
+    bounds = [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+    memory, trace = _share_trace(detuning_trace)
+    try:
+        context = None
+        if cache_path is not None:
+            with ResultCache(cache_path, cache_size) as cache:
+                context = cache.context(trace_digest(trace))
+        done = 0
+        start_time = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(memory.name, len(trace), values,
+                                           cache_path, cache_size, context)) as executor, \
+                ResultsWriter(output_path) as writer:
+            # map yields results in submission order, so the file follows the grid order
+            for results in executor.map(_run_chunk, bounds):
+                writer.write(results)
+                done += len(results['FoM'])
+                if progress:
+                    rate = done / max(time.perf_counter() - start_time, 1e-9)
+                    print(f"\rSwept {done}/{total} configurations ({rate:.0f}/s)",
+                          end="", file=sys.stderr, flush=True)
+        if progress:
+            print(file=sys.stderr)
+    finally:
+        # The view must be gone before the block can be closed
+        trace = None
+        memory.close()
+        memory.unlink()
+    return done
+
+
+def main(argv=None):
+    parser = build_parser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes.")
+    parser.add_argument("--chunk-size", type=int, default=1024,
+                        help="Number of configurations per task.")
+    args, values = parse_arguments(parser, argv)
+
+    def blocks():
+        # Stream the trace so the only copy in memory is the shared one
+        return (detuning for _, detuning in open_trace_source(args.trace, block_size=2**20, loop=False, read_ahead=2))
+
+    count = run_sweep(blocks, values, args.output, chunk_size=args.chunk_size, max_workers=args.workers,
+                      cache_path=None if args.no_cache else args.cache, cache_size=args.cache_size)
+    print(f"Wrote {count} configurations to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
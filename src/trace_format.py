@@ -0,0 +1,209 @@
+"""Binary detuning trace format.
+
+A trace file is a 64 byte header followed by one (time, detuning) record per
+sample, stored as little-endian float64 or float32. The records are mapped
+with np.memmap, so opening a trace costs no parsing and no copies however
+long the recording is.
+
+Convert a CSV trace with the `time` and `Detuning [Hz]` columns, from the src directory:
+    python trace_format.py ../data/detuning.csv ../data/detuning.uph
+"""
+import argparse
+import bz2
+import csv
+import gzip
+import itertools
+import lzma
+import struct
+import numpy as np
+
+TRACE_SUFFIX = ".uph"
+# Microphonics specs, generated on the fly by microphonics.py wherever a trace is read
+SPEC_SUFFIX = ".json"
+MAGIC = b"UPHTRACE"
+VERSION = 1
+# magic, version, bytes per value, sample count, padded to 64 bytes
+HEADER = struct.Struct("<8sHHxxxxQ40x")
+TIME_COLUMN = "time"
+DETUNING_COLUMN = "Detuning [Hz]"
+# Compressed files are recognised by their last suffix, e.g. detuning.csv.gz
+COMPRESSORS = {".gz": gzip, ".bz2": bz2, ".xz": lzma}
+
+
+def open_file(path, mode="rb"):
+    """Open a plain or compressed file, choosing the decompressor from the suffix."""
+    for suffix, module in COMPRESSORS.items():
+        if path.endswith(suffix):
+            return module.open(path, mode)
+    return open(path, mode)
+
+
+def strip_compression(path):
+    """Return the path without a compression suffix."""
+    for suffix in COMPRESSORS:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def iter_csv_chunks(path, chunk_rows=1_000_000):
+    """
+    Parse a CSV trace a chunk of rows at a time.
+    :param path: CSV file with `time` and `Detuning [Hz]` columns, optionally compressed.
+    :param chunk_rows: Number of rows parsed per chunk.
+    :return: Iterator over (time, detuning) array pairs.
+    """
+    with open_file(path, "rt") as file:
+        header = next(csv.reader([file.readline()]))
+        columns = (header.index(TIME_COLUMN), header.index(DETUNING_COLUMN))
+        while True:
+            lines = list(itertools.islice(file, chunk_rows))
+            if not lines:
+                break
+            values = np.loadtxt(lines, delimiter=",", usecols=columns, ndmin=2)
+            yield values[:, 0], values[:, 1]
+
+
+def record_dtype(itemsize):
+    """Structured dtype of one trace record for 4 or 8 byte floats."""
+    if itemsize not in (4, 8):
+        raise ValueError(f"Unsupported trace value size {itemsize}.")
+    value = f"<f{itemsize}"
+    return np.dtype([("time", value), ("detuning", value)])
+
+
+def read_header(path):
+    """
+    Read and validate the header of a trace file.
+    :return: Tuple of (bytes per value, sample count).
+    """
+    with open_file(path, "rb") as file:
+        return _parse_header(file.read(HEADER.size), path)
+
+
+def _parse_header(data, path):
+    """Validate raw header bytes and return (bytes per value, sample count)."""
+    if len(data) < HEADER.size:
+        raise ValueError(f"'{path}' is too short to be a trace file.")
+    magic, version, itemsize, count = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError(f"'{path}' is not a trace file.")
+    if version != VERSION:
+        raise ValueError(f"Unsupported trace file version {version} in '{path}'.")
+    return itemsize, count
+
+
+def open_trace(path):
+    """
+    Memory-map a trace file.
+    :param path: The trace file.
+    :return: Tuple of (time, detuning) read-only array views into the file.
+    """
+    itemsize, count = read_header(path)
+    if count == 0:
+        empty = np.empty(0, dtype=record_dtype(itemsize))
+        return empty["time"], empty["detuning"]
+    records = np.memmap(path, dtype=record_dtype(itemsize), mode="r", offset=HEADER.size, shape=(count,))
+    return records["time"], records["detuning"]
+
+
+def _read_exact(file, size):
+    """Read size bytes, looping because decompressing readers may return less."""
+    parts = []
+    while size > 0:
+        data = file.read(size)
+        if not data:
+            break
+        parts.append(data)
+        size -= len(data)
+    return b"".join(parts)
+
+
+def iter_trace_chunks(path, chunk_samples=1_000_000):
+    """
+    Read a trace file, optionally compressed, a chunk of samples at a time.
+    :param path: The trace file.
+    :param chunk_samples: Number of samples read per chunk.
+    :return: Iterator over (time, detuning) array pairs.
+    """
+    with open_file(path, "rb") as file:
+        itemsize, count = _parse_header(file.read(HEADER.size), path)
+        dtype = record_dtype(itemsize)
+        remaining = count
+        while remaining > 0:
+            samples = min(chunk_samples, remaining)
+            data = _read_exact(file, samples * dtype.itemsize)
+            if len(data) < samples * dtype.itemsize:
+                raise ValueError(f"Trace file '{path}' ends before its {count} samples.")
+            records = np.frombuffer(data, dtype=dtype)
+            remaining -= len(records)
+            yield records["time"], records["detuning"]
+
+
+class TraceWriter:
+    """Append (time, detuning) blocks to a new trace file."""
+
+    def __init__(self, path, dtype=np.float64):
+        self.path = path
+        self.dtype = record_dtype(np.dtype(dtype).itemsize)
+        self.count = 0
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, self.dtype["time"].itemsize, 0))
+
+    def write(self, time, detuning):
+        """Append a block of samples."""
+        records = np.empty(len(time), dtype=self.dtype)
+        records["time"] = time
+        records["detuning"] = detuning
+        self._file.write(records.tobytes())
+        self.count += len(records)
+
+    def close(self):
+        """Write the final sample count into the header and close the file."""
+        if self._file is None:
+            return
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, self.dtype["time"].itemsize, self.count))
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_trace(path, time, detuning, dtype=np.float64):
+    """Write whole time and detuning arrays to a trace file."""
+    with TraceWriter(path, dtype) as writer:
+        writer.write(np.asarray(time), np.asarray(detuning))
+
+
+def convert_csv(csv_path, trace_path, dtype=np.float64, chunk_rows=1_000_000):
+    """
+    Convert a CSV trace to the binary format without loading it all into memory.
+    :param csv_path: CSV file with `time` and `Detuning [Hz]` columns, optionally compressed.
+    :param trace_path: The trace file to write.
+    :param dtype: np.float64 or np.float32 for the stored values.
+    :param chunk_rows: Number of CSV rows parsed at a time.
+    :return: The number of samples written.
+    """
+    with TraceWriter(trace_path, dtype) as writer:
+        for time, detuning in iter_csv_chunks(csv_path, chunk_rows):
+            writer.write(time, detuning)
+        return writer.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a CSV detuning trace to the binary trace format.")
+    parser.add_argument("csv_path", help="CSV file with time and Detuning [Hz] columns.")
+    parser.add_argument("trace_path", help=f"Binary trace file to write, conventionally *{TRACE_SUFFIX}.")
+    parser.add_argument("--float32", action="store_true", help="Store values as float32 instead of float64.")
+    args = parser.parse_args(argv)
+    count = convert_csv(args.csv_path, args.trace_path, np.float32 if args.float32 else np.float64)
+    print(f"Wrote {count} samples to {args.trace_path}")
+
+
+if __name__ == "__main__":
+    main()
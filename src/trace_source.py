@@ -0,0 +1,222 @@
+"""Pluggable sources of detuning trace samples.
+
+A source delivers the trace as fixed-size NumPy blocks and, like the original
+`while True` loop over the CSV file, starts again from the beginning when it
+reaches the end. File sources read a chunk at a time, so memory stays bounded
+however long the recording is, and ReadAheadTraceSource moves the reading onto
+a background thread.
+"""
+import queue
+import threading
+import numpy as np
+from trace_format import SPEC_SUFFIX, TRACE_SUFFIX, iter_csv_chunks, iter_trace_chunks, strip_compression
+
+# Marks the end of a non-looping source in the read-ahead queue
+_END = object()
+
+
+class TraceSource:
+    """Base class of trace sources. Subclasses implement _iter_chunks."""
+
+    def __init__(self, block_size=65536, loop=True):
+        """
+        :param block_size: Number of samples per block yielded by blocks().
+        :param loop: Start again at the beginning of the trace when the end is reached.
+        """
+        self.block_size = block_size
+        self.loop = loop
+        self._blocks = None
+        self._pending = (np.empty(0), np.empty(0))
+
+    def _iter_chunks(self):
+        """Yield (time, detuning) chunks of any size for one pass over the trace."""
+        raise NotImplementedError
+
+    def blocks(self):
+        """
+        Yield (time, detuning) blocks of block_size samples.
+        Blocks run across the end of the trace when looping; otherwise the last block may be shorter.
+        """
+        pending_time, pending_detuning, pending = [], [], 0
+        while True:
+            empty = True
+            for time, detuning in self._iter_chunks():
+                if len(time) == 0:
+                    continue
+                empty = False
+                pending_time.append(time)
+                pending_detuning.append(detuning)
+                pending += len(time)
+                if pending < self.block_size:
+                    continue
+                time = np.concatenate(pending_time)
+                detuning = np.concatenate(pending_detuning)
+                end = pending - pending % self.block_size
+                for start in range(0, end, self.block_size):
+                    yield time[start:start + self.block_size], detuning[start:start + self.block_size]
+                pending_time, pending_detuning, pending = [time[end:]], [detuning[end:]], pending - end
+            if empty or not self.loop:
+                break
+        if pending:
+            yield np.concatenate(pending_time), np.concatenate(pending_detuning)
+
+    def read(self, count):
+        """
+        Return the next count samples as (time, detuning) arrays.
+        Fewer samples are returned only at the end of a non-looping trace.
+        """
+        if self._blocks is None:
+            self._blocks = self.blocks()
+        times, detunings = [self._pending[0]], [self._pending[1]]
+        available = len(self._pending[0])
+        while available < count:
+            try:
+                time, detuning = next(self._blocks)
+            except StopIteration:
+                break
+            times.append(time)
+            detunings.append(detuning)
+            available += len(time)
+        time = np.concatenate(times)
+        detuning = np.concatenate(detunings)
+        self._pending = (time[count:], detuning[count:])
+        return time[:count], detuning[:count]
+
+    def read_all(self):
+        """Read one whole pass of the trace into a pair of (time, detuning) arrays."""
+        chunks = [(time, detuning) for time, detuning in self._iter_chunks() if len(time)]
+        if not chunks:
+            return np.empty(0), np.empty(0)
+        return np.concatenate([time for time, _ in chunks]), np.concatenate([detuning for _, detuning in chunks])
+
+    def __iter__(self):
+        return self.blocks()
+
+    def close(self):
+        """Stop reading and release the underlying file."""
+        if self._blocks is not None:
+            self._blocks.close()
+            self._blocks = None
+
+
+class ArrayTraceSource(TraceSource):
+    """A trace already held in (possibly memory-mapped) arrays."""
+
+    def __init__(self, time, detuning, block_size=65536, loop=True, chunk_samples=1_000_000):
+        super().__init__(block_size, loop)
+        self.time = time
+        self.detuning = detuning
+        self.chunk_samples = chunk_samples
+        self._position = 0
+
+    def _iter_chunks(self):
+        # Slices keep memory-mapped traces from being copied whole
+        for start in range(0, len(self.detuning), self.chunk_samples):
+            yield self.time[start:start + self.chunk_samples], self.detuning[start:start + self.chunk_samples]
+
+    def read(self, count):
+        """Return the next count samples by index arithmetic, wrapping at the end of the trace."""
+        length = len(self.detuning)
+        if not self.loop:
+            count = min(count, length - self._position)
+            start, self._position = self._position, self._position + count
+            return self.time[start:self._position], self.detuning[start:self._position]
+        indices = (self._position + np.arange(count)) % length
+        self._position = (self._position + count) % length
+        return self.time[indices], self.detuning[indices]
+
+
+class CsvTraceSource(TraceSource):
+    """A CSV trace with `time` and `Detuning [Hz]` columns, optionally gzip, bz2 or xz compressed."""
+
+    def __init__(self, path, block_size=65536, loop=True, chunk_rows=1_000_000):
+        super().__init__(block_size, loop)
+        self.path = path
+        self.chunk_rows = chunk_rows
+
+    def _iter_chunks(self):
+        return iter_csv_chunks(self.path, self.chunk_rows)
+
+
+class BinaryTraceSource(TraceSource):
+    """A binary trace file from trace_format, optionally gzip, bz2 or xz compressed."""
+
+    def __init__(self, path, block_size=65536, loop=True, chunk_samples=1_000_000):
+        super().__init__(block_size, loop)
+        self.path = path
+        self.chunk_samples = chunk_samples
+
+    def _iter_chunks(self):
+        return iter_trace_chunks(self.path, self.chunk_samples)
+
+
+class ReadAheadTraceSource(TraceSource):
+    """Read the blocks of another source on a background thread, a bounded number of blocks ahead."""
+
+    def __init__(self, source, depth=4):
+        """
+        :param source: The trace source to read from.
+        :param depth: Maximum number of blocks buffered ahead of the consumer.
+        """
+        super().__init__(source.block_size, source.loop)
+        self.source = source
+        self.depth = depth
+
+    def blocks(self):
+        stop = threading.Event()
+        buffer = queue.Queue(maxsize=self.depth)
+
+        def put(item):
+            # Time out regularly so the thread notices when the consumer has gone away
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for block in self.source.blocks():
+                    if not put(block):
+                        return
+                put(_END)
+            except Exception as error:
+                put(error)
+
+        thread = threading.Thread(target=produce, name="trace read-ahead", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = buffer.get()
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+
+def open_trace_source(path, block_size=65536, loop=True, read_ahead=0):
+    """
+    Open a trace file as a source, choosing the reader from the file suffix.
+    :param path: A CSV or binary trace file, optionally compressed, or a microphonics spec with a duration.
+    :param block_size: Number of samples per block.
+    :param loop: Start again at the beginning of the trace when the end is reached.
+    :param read_ahead: Number of blocks to read ahead on a background thread, 0 to read inline.
+    """
+    if path.endswith(SPEC_SUFFIX):
+        from microphonics import MicrophonicsTraceSource, load_spec  # Deferred, microphonics imports this module
+        spec = load_spec(path)
+        if spec.get("duration") is None:
+            raise ValueError(f"The microphonics spec {path} needs a duration to be read as a trace.")
+        source = MicrophonicsTraceSource(spec, block_size, loop)
+    elif strip_compression(path).endswith(TRACE_SUFFIX):
+        source = BinaryTraceSource(path, block_size, loop)
+    else:
+        source = CsvTraceSource(path, block_size, loop)
+    if read_ahead:
+        source = ReadAheadTraceSource(source, read_ahead)
+    return source
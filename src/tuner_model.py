@@ -0,0 +1,180 @@
+"""Time-domain model of the fast reactive tuner (FRT) and its controller.
+
+The ideal FRT of the kernel cancels the detuning instantly, up to half its
+tuning range. TunerModel adds the dynamics of a real tuner: the command is
+computed from the detuning measured `delay` seconds earlier, by feedforward
+from the detuning and feedback from the residual detuning; it is clipped to
+the tuning range, slew-rate limited and passed through a first or second order
+response. With no delay, instant response, no slew limit, unity feedforward and
+no feedback it reproduces the ideal FRT exactly.
+
+Blocks are processed whole with the vectorized filters of iir.py, the state
+carried from block to block. A feedback loop must wait for its own residual,
+so with feedback the block is processed in steps of one loop delay.
+
+    tuner = TunerModel(kernel.sample_rate, delay=1e-3, order=2, bandwidth=200, slew_rate=5e4)
+    detuning_FRT = tuner.apply(detuning, tuning_range)
+"""
+import json
+import numpy as np
+from iir import first_order_iir
+
+# Run lengths searched at a time while a slew limited ramp catches up with its input
+RAMP_WINDOW = 64
+
+
+def load_tuner_spec(path):
+    """Load the keyword arguments of a TunerModel from a JSON file."""
+    with open(path) as file:
+        return json.load(file)
+
+
+def slew_limit(x, max_step, state):
+    """
+    Limit the change between consecutive samples, y[n] = clip(x[n], y[n-1] - max_step, y[n-1] + max_step).
+    Runs where the input moves slowly enough are copied, only the ramps are computed.
+    :param state: y[-1], the last output of the previous block.
+    :return: The limited samples and the final state.
+    """
+    y = np.array(x, dtype=float)
+    n = len(y)
+    if n == 0:
+        return y, state
+    # Where the input itself steps too far, the start of every possible ramp
+    violations = np.flatnonzero(np.abs(np.diff(y, prepend=state)) > max_step)
+    if len(violations) * RAMP_WINDOW > n:
+        # Ramps too many and too short to pay for the search, one sample at a time is faster
+        values = y.tolist()
+        for index, value in enumerate(values):
+            if value > state + max_step:
+                state += max_step
+            elif value < state - max_step:
+                state -= max_step
+            else:
+                state = value
+            values[index] = state
+        return np.array(values), state
+    position, previous = 0, state
+    while True:
+        # Free run, the output follows the input up to the next step that is too large
+        following = np.searchsorted(violations, position)
+        if following == len(violations):
+            break
+        position = violations[following]
+        previous = y[position - 1] if position else previous
+        # Ramp towards the input until it is within reach, reversing if it moved away the other way
+        while position < n:
+            direction = 1.0 if y[position] > previous else -1.0
+            window = RAMP_WINDOW
+            while True:
+                count = min(window, n - position)
+                ramp = previous + direction * max_step * np.arange(1, count + 1)
+                reached = np.flatnonzero(direction * (y[position:position + count] - ramp) <= 0)
+                end = reached[0] if len(reached) else count
+                y[position:position + end] = ramp[:end]
+                previous = ramp[end - 1] if end else previous
+                position += end
+                if len(reached) or position == n:
+                    break
+                window *= 2
+            if position == n:
+                break
+            value = min(max(y[position], previous - max_step), previous + max_step)
+            caught = value == y[position]
+            y[position] = previous = value
+            position += 1
+            if caught:
+                break  # The output follows the input again
+    return y, y[-1]
+
+
+class TunerModel:
+    def __init__(self, sample_rate, delay=0.0, order=0, bandwidth=None, damping=0.7, slew_rate=None,
+                 feedforward_gain=1.0, feedback_gain=0.0, feedback_bandwidth=0.0):
+        """
+        :param sample_rate: Samples per second of the detuning blocks.
+        :param delay: Seconds from measuring the detuning to acting on it; feedback always acts at least a sample late.
+        :param order: Order of the tuner response, 0 for instantaneous, 1 or 2.
+        :param bandwidth: Corner frequency of the tuner response in Hz.
+        :param damping: Damping ratio of the second order response.
+        :param slew_rate: Largest rate of change of the tuner detuning in Hz/s, None for no limit.
+        :param feedforward_gain: Gain from the measured detuning to the tuner command.
+        :param feedback_gain: Proportional gain from the measured residual detuning to the tuner command.
+        :param feedback_bandwidth: Integral action of the feedback, as the unity gain frequency of the integrator in Hz.
+        """
+        if order not in (0, 1, 2):
+            raise ValueError(f"Unknown tuner response order {order}, use 0, 1 or 2.")
+        if order and not bandwidth:
+            raise ValueError("A tuner response of order 1 or 2 needs a bandwidth.")
+        self.sample_rate = sample_rate
+        self.feedforward_gain = feedforward_gain
+        self.feedback_gain = feedback_gain
+        self.integral_gain = 2 * np.pi * feedback_bandwidth / sample_rate
+        self.feedback = bool(feedback_gain or feedback_bandwidth)
+        self.delay = int(round(delay * sample_rate))
+        if self.feedback:
+            self.delay = max(self.delay, 1)
+        self.max_step = None if slew_rate is None else slew_rate / sample_rate
+        # Poles of the response, each a unity gain first order section
+        if order == 0:
+            self.poles = ()
+        else:
+            w = 2 * np.pi * bandwidth / sample_rate
+            if order == 1:
+                self.poles = (np.exp(-w),)
+            elif damping < 1:
+                root = w * np.sqrt(1 - damping**2)
+                self.poles = (np.exp(-w * damping + 1j * root), np.exp(-w * damping - 1j * root))
+            else:
+                root = w * np.sqrt(damping**2 - 1)
+                self.poles = (np.exp(-w * damping + root), np.exp(-w * damping - root))
+        self.reset()
+
+    def reset(self):
+        """Forget the past, with the tuner at rest."""
+        self._measured = np.zeros(self.delay)  # The last `delay` samples of measured detuning
+        self._residuals = np.zeros(self.delay)  # The last `delay` samples of residual detuning
+        self._integral = 0.0  # Sum of the residuals older than those
+        self._slew_state = 0.0
+        self._response_states = [0.0] * len(self.poles)
+
+    def _delayed(self, detuning):
+        """The measured detuning as seen by the controller, `delay` samples late."""
+        if not self.delay:
+            return detuning
+        measured = np.concatenate((self._measured, detuning))
+        self._measured = measured[len(detuning):]
+        return measured[:len(detuning)]
+
+    def _actuate(self, command, half_range):
+        """Tuner detuning produced by a command: clipped to the tuning range, slew limited and filtered."""
+        tuner = np.clip(command, -half_range, half_range)
+        if self.max_step is not None:
+            tuner, self._slew_state = slew_limit(tuner, self.max_step, self._slew_state)
+        for index, pole in enumerate(self.poles):
+            tuner, self._response_states[index] = first_order_iir(
+                (1 - pole) * tuner, pole, self._response_states[index])
+        return tuner.real if self.poles else tuner
+
+    def apply(self, detuning, tuning_range):
+        """
+        Run a block of cavity detuning through the tuner.
+        :param detuning: The cavity detuning without the tuner.
+        :param tuning_range: The tuning range, the tuner detuning is limited to half of it either way.
+        :return: The residual detuning, cavity detuning minus tuner detuning.
+        """
+        detuning = np.asarray(detuning, dtype=float)
+        command = self.feedforward_gain * self._delayed(detuning)
+        if not self.feedback:
+            return detuning - self._actuate(command, tuning_range / 2)
+        residual = np.empty_like(detuning)
+        for start in range(0, len(detuning), self.delay):
+            stop = min(start + self.delay, len(detuning))
+            # Everything the controller sees in this step was measured before it started
+            seen = self._residuals[:stop - start]
+            feedback = self.feedback_gain * seen + self.integral_gain * (self._integral + np.cumsum(seen))
+            residual[start:stop] = detuning[start:stop] - self._actuate(command[start:stop] + feedback,
+                                                                       tuning_range / 2)
+            self._integral += seen.sum()
+            self._residuals = np.concatenate((self._residuals[stop - start:], residual[start:stop]))
+        return residual